@@ -2,10 +2,15 @@
 import sys
 import os
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # gzip only
+    BrotliMiddleware = None
 
 # ---------------- Path Setup ----------------
 # Add src to sys.path so Python can find your modules
@@ -13,19 +18,40 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 
 # Import routers
 from draft_routes import router as draft_router      # draft generate
+from draft_routes import Prospect, build_draft_record
+from src.utils.admission import BATCH
 from send_routes import router as act_router         # draft update/send & calendar event
+from src.admin_routes import router as admin_router   # profiles, traces
+from src.calendar_routes import router as calendar_router  # calendar push webhook
+from src.Email_Services.idle_watcher import start_watcher, stop_watcher
+from src.followup_scheduler import start_scheduler, stop_scheduler
+from src.Calender_Services.push_channel import start_channel_manager, stop_channel_manager
+from src.utils.http_cache import (
+    FastJSONResponse,
+    CachedStaticFiles,
+    content_etag,
+    not_modified,
+    not_modified_response,
+    versioned_html
+)
+from src.utils.profiling import ProfilingMiddleware
+from src.utils.tracing import TracingMiddleware, install_log_correlation
+from src.utils.tenants import TenantMiddleware
 
 # ---------------- App Init ----------------
 app = FastAPI(
     title="Draft Email API",
     description="API for generating, updating and sending email drafts",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # ---------------- Logging ----------------
+# every record carries the current request's trace id ("-" outside one)
+install_log_correlation()
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+    format="%(asctime)s - %(levelname)s - [%(trace_id)s] %(message)s"
 )
 
 # ---------------- CORS ----------------
@@ -37,24 +63,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------------- Compression ----------------
+# brotli when the client accepts it (and brotli-asgi is installed), else gzip
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_BYTES, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+
+# ---------------- Profiling (opt-in: X-Profile header / PROFILE_REQUESTS) ----------------
+app.add_middleware(ProfilingMiddleware)
+
+# ---------------- Tracing (TRACING=true; X-Trace-Id in, X-Trace-Id out) ----------------
+app.add_middleware(TracingMiddleware)
+
+# ---------------- Tenants (X-Tenant header or /t/<tenant>/ prefix; see tenants.yaml) ----------------
+# outermost, so everything below runs as the request's tenant
+app.add_middleware(TenantMiddleware)
+
 # ---------------- Static Files + Frontend ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INDEX_FILE = os.path.join(BASE_DIR, "index.html")
+STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 if os.path.exists(INDEX_FILE):
-    # Serve all root files (index.html, JS, CSS, etc.) via /static
-    app.mount("/static", StaticFiles(directory=BASE_DIR), name="static")
+    # Only the asset directory is public; files are cached long-term and
+    # index.html links them with a content-hash version
+    app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
+
+    with open(INDEX_FILE, encoding="utf-8") as f:
+        INDEX_HTML = versioned_html(f.read(), STATIC_DIR)
+    INDEX_ETAG = content_etag(INDEX_HTML.encode("utf-8"))
 
     @app.get("/")
-    async def serve_index():
-        """Serve the main frontend index.html at root /"""
-        return FileResponse(INDEX_FILE)
+    async def serve_index(request: Request):
+        """Serve the main frontend index.html at root / (revalidated via ETag)"""
+        if not_modified(request, INDEX_ETAG):
+            return not_modified_response(INDEX_ETAG)
+        return HTMLResponse(INDEX_HTML, headers={"ETag": INDEX_ETAG, "Cache-Control": "no-cache"})
 else:
     logging.warning("⚠️ index.html not found at project root!")
 
 # ---------------- Routers ----------------
 app.include_router(draft_router, prefix="/api")  # /api/generate-draft
 app.include_router(act_router, prefix="/api")    # /api/act
+app.include_router(admin_router, prefix="/api")  # /api/admin/...
+app.include_router(calendar_router, prefix="/api")  # /api/calendar/...
+
+# ---------------- Background: inbox watcher + follow-ups + calendar push ----------------
+# Pre-generate drafts when known prospects reply (IMAP IDLE) and follow-ups
+# for prospects who went quiet; keep the calendar push channel registered.
+# The watcher and the follow-up scans cover every tenant; the push channel
+# only the default one.
+# Enable in a single process only, e.g. IMAP_IDLE_WATCHER=true /
+# FOLLOWUP_SCHEDULER=true / CALENDAR_PUSH=true on one worker.
+@app.on_event("startup")
+def start_background_workers():
+    # background drafts queue behind interactive ones
+    generate = lambda p: build_draft_record(Prospect(**p), priority=BATCH)
+    if os.getenv("IMAP_IDLE_WATCHER", "false").lower() == "true":
+        start_watcher(generate)
+    if os.getenv("FOLLOWUP_SCHEDULER", "false").lower() == "true":
+        start_scheduler(generate)
+    if os.getenv("CALENDAR_PUSH", "false").lower() == "true":
+        start_channel_manager()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    stop_watcher()
+    stop_scheduler()
+    stop_channel_manager()
 
 # ---------------- Run ----------------
 if __name__ == "__main__":
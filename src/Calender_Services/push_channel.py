@@ -0,0 +1,433 @@
+# push_channel.py
+"""
+Google Calendar push notifications for the configured calendar.
+
+A watch channel on events makes Google POST to CALENDAR_WEBHOOK_URL
+(/api/calendar/notifications) whenever the calendar changes. Each
+notification triggers an incremental sync with the stored syncToken; the
+changes found invalidate the "calendar:slots" / "calendar:events" caches.
+While the channel is live, those caches use CALENDAR_PUSH_CACHE_TTL instead
+of CALENDAR_CACHE_TTL. The channel is renewed before it expires; if it
+lapses, caches are dropped and the short TTL applies again.
+
+    python -m src.Calender_Services.push_channel register|ensure|stop|status
+    python -m src.Calender_Services.push_channel simulate [--local] [--state exists] [--url URL]
+
+`simulate --local` stores a local channel (no Google call) so the webhook
+can be exercised end to end without a public URL.
+
+The channel watches the default tenant's calendar only; other tenants keep
+the short CALENDAR_CACHE_TTL.
+"""
+import os
+import sys
+import time
+import uuid
+import logging
+import argparse
+import threading
+import urllib.request
+from datetime import datetime
+from email.utils import formatdate
+from typing import Optional
+
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+from src.utils.helpers import load_json, save_json, update_json
+from src.utils.cache_backend import get_backend, invalidate_namespace
+from src.Calender_Services.services import load_calendar_config, get_service_account_service, execute
+from src.utils.tenants import current_tenant
+
+load_dotenv()
+
+STATE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "calendar_channel.json")
+
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL", "")  # public https URL of /api/calendar/notifications
+CALENDAR_WEBHOOK_TOKEN = os.getenv("CALENDAR_WEBHOOK_TOKEN", "")  # echoed back in X-Goog-Channel-Token
+CALENDAR_CHANNEL_TTL = int(os.getenv("CALENDAR_CHANNEL_TTL", str(7 * 24 * 3600)))
+CALENDAR_CHANNEL_RENEW_BEFORE = float(os.getenv("CALENDAR_CHANNEL_RENEW_BEFORE", str(24 * 3600)))
+CALENDAR_CHANNEL_CHECK_SECONDS = float(os.getenv("CALENDAR_CHANNEL_CHECK_SECONDS", "600"))
+STATE_MEMO_SECONDS = 15
+LOCAL_URL = "http://localhost:8000/api/calendar/notifications"
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------- State -------------------
+def load_state() -> dict:
+    state = load_json(STATE_FILE, {})
+    return state if isinstance(state, dict) else {}
+
+
+def _update_state(**fields) -> dict:
+    state = update_json(STATE_FILE, lambda s: dict(s if isinstance(s, dict) else {}, **fields), {})
+    _memo.update(at=0.0)
+    return state
+
+
+def channel_live(state: dict) -> bool:
+    return bool(state.get("channel_id")) and state.get("expiration", 0) > time.time() and state.get("last_sync_ok", True)
+
+
+_memo = {"at": 0.0, "active": False}
+
+
+def push_active() -> bool:
+    """
+    True while a live channel keeps the calendar caches invalidated. Needs a
+    shared cache backend when several workers run, since only the worker that
+    receives a notification can drop its own in-memory cache.
+    """
+    if not current_tenant().is_default:
+        return False
+    now = time.monotonic()
+    if now - _memo["at"] < STATE_MEMO_SECONDS:
+        return _memo["active"]
+    single_worker = os.getenv("WEB_CONCURRENCY", "1") == "1"
+    active = channel_live(load_state()) and (get_backend().shared or single_worker)
+    if _memo["active"] and not active:
+        # entries cached with the long TTL would outlive the channel
+        logger.warning("Calendar push channel no longer live; dropping calendar caches")
+        invalidate_namespace("calendar:")
+    _memo.update(at=now, active=active)
+    return active
+
+
+# ------------------- Sync -------------------
+def _list_events(svc, calendar_id: str, sync_token: Optional[str]) -> tuple[list, str]:
+    """All pages of events.list (changes since sync_token, or a full listing); returns (items, nextSyncToken)."""
+    items, page_token = [], None
+    while True:
+        params = {"calendarId": calendar_id, "maxResults": 2500, "showDeleted": True}
+        if sync_token:
+            params["syncToken"] = sync_token
+        if page_token:
+            params["pageToken"] = page_token
+        resp = execute(svc.events().list(**params), "calendar.events.sync", incremental=bool(sync_token))
+        items.extend(resp.get("items", []))
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return items, resp.get("nextSyncToken")
+
+
+def _pull_changes(svc, calendar_id: str, sync_token: Optional[str]) -> tuple[Optional[list], str]:
+    """(changed events, next token); changes is None after a full resync."""
+    if sync_token:
+        try:
+            return _list_events(svc, calendar_id, sync_token)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            logger.info("Calendar syncToken expired; running a full resync")
+    return None, _list_events(svc, calendar_id, None)[1]
+
+
+def _affects_busy_time(ev: dict) -> bool:
+    # transparent ("free") events never block a slot, unless they were just removed
+    return ev.get("status") == "cancelled" or ev.get("transparency", "opaque") != "transparent"
+
+
+def sync_changes(cfg_path: Optional[str] = None) -> dict:
+    """
+    Pull changes since the stored syncToken and invalidate the affected
+    calendar caches. A missing or expired (410) token means a full resync
+    and a full invalidation.
+    """
+    state = load_state()
+    if state.get("local"):
+        invalidate_namespace("calendar:")
+        _update_state(last_sync_at=datetime.now().isoformat(), last_sync_ok=True, last_changes=None)
+        return {"mode": "local", "changes": None}
+
+    try:
+        cfg = load_calendar_config(cfg_path)
+        svc = get_service_account_service()
+        changes, next_token = _pull_changes(svc, cfg["calendar_id"], state.get("sync_token"))
+    except Exception:
+        # can't tell what changed: drop everything and stop trusting the long TTL
+        _update_state(last_sync_ok=False)
+        invalidate_namespace("calendar:")
+        raise
+
+    if changes is None:
+        invalidate_namespace("calendar:")
+        result = {"mode": "full", "changes": None}
+    else:
+        if changes:
+            invalidate_namespace("calendar:events")
+            if any(_affects_busy_time(ev) for ev in changes):
+                invalidate_namespace("calendar:slots")
+        result = {"mode": "incremental", "changes": len(changes)}
+
+    _update_state(sync_token=next_token, last_sync_at=datetime.now().isoformat(), last_sync_ok=True,
+                  last_changes=result["changes"])
+    logger.info("Calendar sync: %s", result)
+    return result
+
+
+_sync_lock = threading.Lock()
+_sync_pending = threading.Event()
+
+
+def _drain_syncs():
+    while True:
+        try:
+            while _sync_pending.is_set():
+                _sync_pending.clear()
+                try:
+                    sync_changes()
+                except Exception:
+                    logger.exception("Calendar sync failed")
+        finally:
+            _sync_lock.release()
+        # a request that arrived after the loop but before the release
+        if not _sync_pending.is_set() or not _sync_lock.acquire(blocking=False):
+            return
+
+
+def request_sync():
+    """Run sync_changes in the background; bursts of notifications collapse into one more sync."""
+    _sync_pending.set()
+    if _sync_lock.acquire(blocking=False):
+        threading.Thread(target=_drain_syncs, name="calendar-sync", daemon=True).start()
+
+
+# ------------------- Notifications -------------------
+class InvalidNotification(Exception):
+    pass
+
+
+def handle_notification(headers) -> dict:
+    """
+    Process one webhook call from its X-Goog-* headers. Raises
+    InvalidNotification on a token mismatch; notifications for unknown
+    channels or replayed message numbers are acknowledged and ignored.
+    """
+    state = load_state()
+    channel_id = headers.get("x-goog-channel-id")
+    if CALENDAR_WEBHOOK_TOKEN and headers.get("x-goog-channel-token") != CALENDAR_WEBHOOK_TOKEN:
+        raise InvalidNotification("channel token mismatch")
+    if not channel_id or channel_id != state.get("channel_id"):
+        logger.info("Notification for unknown channel %s ignored", channel_id)
+        return {"status": "ignored", "reason": "unknown channel"}
+
+    resource_state = headers.get("x-goog-resource-state", "")
+    try:
+        number = int(headers.get("x-goog-message-number") or 0)
+    except ValueError:
+        number = 0
+    if resource_state == "sync":
+        # handshake sent right after the channel is created
+        _update_state(last_notification_at=datetime.now().isoformat(), last_message_number=number)
+        return {"status": "ok", "resource_state": "sync"}
+    if number and number <= state.get("last_message_number", 0):
+        return {"status": "ignored", "reason": "replayed message"}
+
+    _update_state(last_notification_at=datetime.now().isoformat(), last_message_number=number)
+    request_sync()
+    return {"status": "ok", "resource_state": resource_state}
+
+
+# ------------------- Channel lifecycle -------------------
+def register_channel(cfg_path: Optional[str] = None) -> dict:
+    """
+    Open a new watch channel, take a fresh syncToken, then stop the previous
+    channel (so there is no gap). Changes missed in between are covered by
+    a full invalidation.
+    """
+    if not CALENDAR_WEBHOOK_URL:
+        raise RuntimeError("CALENDAR_WEBHOOK_URL is not set.")
+    cfg = load_calendar_config(cfg_path)
+    svc = get_service_account_service()
+    body = {
+        "id": uuid.uuid4().hex,
+        "type": "web_hook",
+        "address": CALENDAR_WEBHOOK_URL,
+        "params": {"ttl": str(CALENDAR_CHANNEL_TTL)}
+    }
+    if CALENDAR_WEBHOOK_TOKEN:
+        body["token"] = CALENDAR_WEBHOOK_TOKEN
+    resp = execute(svc.events().watch(calendarId=cfg["calendar_id"], body=body), "calendar.events.watch")
+    _, sync_token = _list_events(svc, cfg["calendar_id"], None)
+
+    previous = load_state()
+    state = {
+        "channel_id": resp["id"],
+        "resource_id": resp["resourceId"],
+        "calendar_id": cfg["calendar_id"],
+        "expiration": int(resp.get("expiration", 0)) / 1000 or time.time() + CALENDAR_CHANNEL_TTL,
+        "registered_at": datetime.now().isoformat(),
+        "sync_token": sync_token,
+        "last_sync_ok": True,
+        "last_message_number": 0
+    }
+    save_json(STATE_FILE, state)
+    _memo.update(at=0.0)
+    invalidate_namespace("calendar:")
+    if previous.get("channel_id") and not previous.get("local"):
+        try:
+            _stop(svc, previous)
+        except Exception as e:
+            logger.warning("Could not stop previous channel %s: %s", previous["channel_id"], e)
+    logger.info("Calendar push channel %s registered until %s", state["channel_id"],
+                datetime.fromtimestamp(state["expiration"]).isoformat())
+    return state
+
+
+def _stop(svc, state: dict):
+    try:
+        execute(svc.channels().stop(body={"id": state["channel_id"], "resourceId": state["resource_id"]}),
+                "calendar.channels.stop")
+    except HttpError as e:
+        if e.resp.status != 404:  # already expired
+            raise
+
+
+def stop_channel() -> dict:
+    """Stop the current channel and fall back to short cache TTLs."""
+    state = load_state()
+    if state.get("channel_id") and not state.get("local"):
+        _stop(get_service_account_service(), state)
+    save_json(STATE_FILE, {})
+    _memo.update(at=0.0, active=False)
+    # entries cached with the long TTL would otherwise outlive the channel
+    invalidate_namespace("calendar:")
+    return state
+
+
+def ensure_channel() -> Optional[dict]:
+    """Register a channel when none is live or the current one expires within CALENDAR_CHANNEL_RENEW_BEFORE."""
+    state = load_state()
+    if state.get("local"):
+        return state
+    if state.get("channel_id") and state.get("expiration", 0) - time.time() > CALENDAR_CHANNEL_RENEW_BEFORE:
+        if not state.get("last_sync_ok", True):
+            request_sync()
+        return state
+    return register_channel()
+
+
+def channel_status() -> dict:
+    state = load_state()
+    return {
+        "push_active": push_active(),
+        "webhook_url": CALENDAR_WEBHOOK_URL or None,
+        "channel_id": state.get("channel_id"),
+        "local": bool(state.get("local")),
+        "expires_at": datetime.fromtimestamp(state["expiration"]).isoformat() if state.get("expiration") else None,
+        "last_notification_at": state.get("last_notification_at"),
+        "last_sync_at": state.get("last_sync_at"),
+        "last_sync_ok": state.get("last_sync_ok"),
+        "last_changes": state.get("last_changes")
+    }
+
+
+# ------------------- Manager thread -------------------
+class ChannelManager:
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="calendar-channel", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info("Calendar push channel manager started (%s)", CALENDAR_WEBHOOK_URL)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ensure_channel()
+            except Exception:
+                logger.exception("Calendar channel renewal failed")
+            self._stop.wait(CALENDAR_CHANNEL_CHECK_SECONDS)
+
+
+_manager: Optional[ChannelManager] = None
+
+
+def start_channel_manager() -> ChannelManager:
+    global _manager
+    if _manager is None:
+        _manager = ChannelManager()
+        _manager.start()
+    return _manager
+
+
+def stop_channel_manager():
+    global _manager
+    if _manager is not None:
+        _manager.stop()
+        _manager = None
+
+
+# ------------------- Local stand-in -------------------
+def register_local_channel() -> dict:
+    """A channel that exists only here: notifications are accepted and every sync drops all calendar caches."""
+    state = {
+        "channel_id": "local-" + uuid.uuid4().hex[:12],
+        "resource_id": "local",
+        "local": True,
+        "expiration": time.time() + CALENDAR_CHANNEL_TTL,
+        "registered_at": datetime.now().isoformat(),
+        "last_sync_ok": True,
+        "last_message_number": 0
+    }
+    save_json(STATE_FILE, state)
+    _memo.update(at=0.0)
+    return state
+
+
+def simulate_notification(url: str = LOCAL_URL, resource_state: str = "exists") -> int:
+    """POST a notification shaped like Google's to url for the current channel; returns the HTTP status."""
+    state = load_state()
+    if not state.get("channel_id"):
+        raise RuntimeError("No channel registered (use register, or simulate --local).")
+    number = state.get("last_message_number", 0) + 1
+    headers = {
+        "X-Goog-Channel-ID": state["channel_id"],
+        "X-Goog-Resource-ID": state.get("resource_id", ""),
+        "X-Goog-Resource-State": resource_state,
+        "X-Goog-Message-Number": str(number),
+        "X-Goog-Resource-URI": f"https://www.googleapis.com/calendar/v3/calendars/{state.get('calendar_id', '')}/events",
+        "X-Goog-Channel-Expiration": formatdate(state.get("expiration", 0), usegmt=True)
+    }
+    if CALENDAR_WEBHOOK_TOKEN:
+        headers["X-Goog-Channel-Token"] = CALENDAR_WEBHOOK_TOKEN
+    req = urllib.request.Request(url, data=b"", headers=headers, method="POST")
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Google Calendar push channel")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("register", help="open a new channel (replacing the current one)")
+    sub.add_parser("ensure", help="register or renew only when needed")
+    sub.add_parser("stop", help="stop the current channel")
+    sub.add_parser("status")
+    sim = sub.add_parser("simulate", help="send a fake notification to the webhook")
+    sim.add_argument("--local", action="store_true", help="register a local-only channel first")
+    sim.add_argument("--state", default="exists", choices=["sync", "exists", "not_exists"])
+    sim.add_argument("--url", default=LOCAL_URL)
+    args = parser.parse_args(argv)
+
+    if args.command == "register":
+        print(register_channel())
+    elif args.command == "ensure":
+        print(ensure_channel())
+    elif args.command == "stop":
+        print(stop_channel())
+    elif args.command == "status":
+        print(channel_status())
+    else:
+        if args.local:
+            print("Local channel:", register_local_channel()["channel_id"])
+        print("Webhook answered", simulate_notification(args.url, args.state))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -3,6 +3,7 @@ import datetime as dt
 from typing import List, Dict, Optional
 import pytz
 import logging
+import uuid
 import yaml
 
 from googleapiclient.discovery import build
@@ -12,6 +13,14 @@ from dotenv import load_dotenv
 import os
 import json
 
+from src.utils.single_flight import single_flight
+from src.utils.cache_backend import cached, STALE_CACHE_TTL
+from src.utils.circuit_breaker import get_breaker
+from src.utils.clients import google_http
+from src.utils import cassette
+from src.utils.tracing import span
+from src.utils.tenants import current_tenant, tenant_setting
+
 load_dotenv()  # Loads environment variables from .env
 
 # -------------------------
@@ -31,12 +40,21 @@ HERE = os.path.dirname(os.path.abspath(__file__))
 # SERVICE_ACCOUNT_FILE = os.path.join(HERE, "sakey.json")
 CONFIG_FILE = os.path.join(HERE, "calender_config.yaml")
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
+CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", "60"))
+# used instead while a push channel invalidates the caches on every change
+CALENDAR_PUSH_CACHE_TTL = float(os.getenv("CALENDAR_PUSH_CACHE_TTL", "3600"))
+
+
+def calendar_cache_ttl() -> float:
+    from src.Calender_Services.push_channel import push_active  # imports this module
+    return CALENDAR_PUSH_CACHE_TTL if push_active() else CALENDAR_CACHE_TTL
 
 # -------------------------
 # Load config
 # -------------------------
 def load_calendar_config(path: Optional[str] = None) -> dict:
-    p = path or CONFIG_FILE
+    # default: the current tenant's calendar_config, else calender_config.yaml
+    p = path or current_tenant().calendar_config or CONFIG_FILE
     if not os.path.exists(p):
         raise FileNotFoundError(f"Calendar config not found: {p}")
     with open(p, "r", encoding="utf-8") as f:
@@ -55,19 +73,24 @@ def load_calendar_config(path: Optional[str] = None) -> dict:
 from google.oauth2 import service_account
 
 def get_service_account_service(subject: Optional[str] = None):
-    # Create service account info dict from environment variables
+    if cassette.mode("google") == "replay":
+        # answered from the cassette: no service account needed
+        return build("calendar", "v3", http=google_http(None))
+
+    # Create service account info dict from environment variables (the
+    # tenant's own, prefixed ones when set)
     service_account_info = {
-        "type": os.getenv("TYPE"),
-        "project_id": os.getenv("PROJECT_ID"),
-        "private_key_id": os.getenv("PRIVATE_KEY_ID"),
-        "private_key": os.getenv("PRIVATE_KEY").replace("\\n", "\n"),
-        "client_email": os.getenv("CLIENT_EMAIL"),
-        "client_id": os.getenv("CLIENT_ID"),
-        "auth_uri": os.getenv("AUTH_URI"),
-        "token_uri": os.getenv("TOKEN_URI"),
-        "auth_provider_x509_cert_url": os.getenv("AUTH_PROVIDER_X509_CERT_URL"),
-        "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
-        "universe_domain": os.getenv("UNIVERSE_DOMAIN")
+        "type": tenant_setting("TYPE"),
+        "project_id": tenant_setting("PROJECT_ID"),
+        "private_key_id": tenant_setting("PRIVATE_KEY_ID"),
+        "private_key": tenant_setting("PRIVATE_KEY").replace("\\n", "\n"),
+        "client_email": tenant_setting("CLIENT_EMAIL"),
+        "client_id": tenant_setting("CLIENT_ID"),
+        "auth_uri": tenant_setting("AUTH_URI"),
+        "token_uri": tenant_setting("TOKEN_URI"),
+        "auth_provider_x509_cert_url": tenant_setting("AUTH_PROVIDER_X509_CERT_URL"),
+        "client_x509_cert_url": tenant_setting("CLIENT_X509_CERT_URL"),
+        "universe_domain": tenant_setting("UNIVERSE_DOMAIN")
     }
 
     creds = service_account.Credentials.from_service_account_info(
@@ -75,21 +98,69 @@ def get_service_account_service(subject: Optional[str] = None):
     )
     if subject:
         creds = creds.with_subject(subject)
-    service = build("calendar", "v3", credentials=creds)
+    # explicit socket timeout instead of httplib2's default (none)
+    service = build("calendar", "v3", http=google_http(creds))
     return service
 
+def execute(request, name: str = "calendar.request", **attrs):
+    """
+    request.execute() through the calendar circuit breaker (CircuitOpenError
+    while open), traced as a span called `name`.
+    """
+    with span(name, **attrs), get_breaker("calendar"):
+        return request.execute()
+
 # -------------------------
 # Freebusy query
 # -------------------------
+# Google caps a single freebusy request at 50 calendars and a batch HTTP
+# request at 50 inner calls.
+FREEBUSY_MAX_ITEMS = 50
+BATCH_MAX_REQUESTS = 50
+
+
 def freebusy_query(service, calendar_id: str, time_min_iso: str, time_max_iso: str) -> List[Dict]:
-    body = {"timeMin": time_min_iso, "timeMax": time_max_iso, "items": [{"id": calendar_id}]}
-    try:
-        resp = service.freebusy().query(body=body).execute()
-        busy = resp["calendars"].get(calendar_id, {}).get("busy", [])
-        return busy
-    except HttpError as e:
-        logger.error("Freebusy error: %s", e)
-        return []
+    return freebusy_query_many(service, [calendar_id], time_min_iso, time_max_iso).get(calendar_id, [])
+
+
+def freebusy_query_many(service, calendar_ids: List[str], time_min_iso: str, time_max_iso: str) -> Dict[str, List[Dict]]:
+    """
+    Query busy intervals for many calendars, one freebusy call per chunk of
+    FREEBUSY_MAX_ITEMS ids. Returns {calendar_id: [busy intervals]}. A failed
+    chunk or calendar raises instead of reading as "all free", so callers
+    (and @cached) never treat an unknown calendar as available.
+    """
+    ids = list(dict.fromkeys(calendar_ids))  # dedupe, keep order
+    result: Dict[str, List[Dict]] = {cid: [] for cid in ids}
+    for i in range(0, len(ids), FREEBUSY_MAX_ITEMS):
+        chunk = ids[i:i + FREEBUSY_MAX_ITEMS]
+        body = {"timeMin": time_min_iso, "timeMax": time_max_iso, "items": [{"id": cid} for cid in chunk]}
+        try:
+            resp = execute(service.freebusy().query(body=body), "calendar.freebusy", calendars=len(chunk))
+        except HttpError as e:
+            logger.error("Freebusy error: %s", e)
+            raise
+        calendars = resp.get("calendars", {})
+        for cid in chunk:
+            info = calendars.get(cid, {})
+            if info.get("errors"):
+                logger.error("Freebusy error for %s: %s", cid, info["errors"])
+                raise RuntimeError(f"Freebusy failed for {cid}: {info['errors']}")
+            result[cid] = info.get("busy", [])
+    return result
+
+# -------------------------
+# Slot identity
+# -------------------------
+def slot_id(start: dt.datetime) -> str:
+    """Stable id for a slot, derived from its UTC start (e.g. "slot-20250919T1400Z")."""
+    return "slot-" + start.astimezone(pytz.UTC).strftime("%Y%m%dT%H%MZ")
+
+
+def index_slots(slots: List[Dict]) -> Dict[str, Dict]:
+    """{slot id: slot} lookup table for structured slots."""
+    return {s["id"]: s for s in (slots or []) if isinstance(s, dict) and s.get("id")}
+
 
 # -------------------------
 # Compute free slots (formatted)
@@ -136,8 +207,10 @@ def compute_free_slots_from_busy(
             overlap = any(not (slot_finish <= bstart or slot_start >= bend) for bstart, bend in busy)
             if not overlap and slot_start > reference_now:
                 results.append({
+                    "id": slot_id(slot_start),
                     "start_iso": slot_start.isoformat(),
                     "end_iso": slot_finish.isoformat(),
+                    "timezone": tz.zone,
                     "start_readable": slot_start.strftime("%a, %b %d %Y | %I:%M %p"),
                     "end_readable": slot_finish.strftime("%I:%M %p")
                 })
@@ -148,6 +221,8 @@ def compute_free_slots_from_busy(
 # -------------------------
 # Get top N available slots
 # -------------------------
+@single_flight("get_top_available_slots")
+@cached("calendar:slots", calendar_cache_ttl, stale_ttl=STALE_CACHE_TTL)
 def get_top_available_slots(
     cfg_path: Optional[str] = None,
     days: int = 7,
@@ -172,6 +247,8 @@ def get_top_available_slots(
 # -------------------------
 # Check if prospect has upcoming event (formatted)
 # -------------------------
+@single_flight("check_prospect_upcoming_event")
+@cached("calendar:events", calendar_cache_ttl, stale_ttl=STALE_CACHE_TTL)
 def check_prospect_upcoming_event(prospect_email: str, cfg_path: Optional[str] = None) -> List[Dict]:
     cfg = load_calendar_config(cfg_path)
     svc = get_service_account_service()
@@ -180,13 +257,13 @@ def check_prospect_upcoming_event(prospect_email: str, cfg_path: Optional[str] =
     now_local = dt.datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0)
     now_iso = now_local.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    events_result = svc.events().list(
+    events_result = execute(svc.events().list(
         calendarId=cfg["calendar_id"],
         timeMin=now_iso,
         maxResults=250,
         singleEvents=True,
         orderBy="startTime"
-    ).execute()
+    ), "calendar.events.list")
 
     events = events_result.get("items", [])
     matched_events = []
@@ -232,9 +309,13 @@ def check_prospect_upcoming_event(prospect_email: str, cfg_path: Optional[str] =
 # -------------------------
 # 1️⃣ Get readable available slots
 # -------------------------
+def format_readable_slot(slot: Dict) -> str:
+    return f"{slot['start_readable']} - {slot['end_readable']}"
+
+
 def get_readable_available_slots(cfg_path: Optional[str] = None, days: int = 7, top_n: int = 5, offset_days: int = 0) -> List[str]:
     slots = get_top_available_slots(cfg_path=cfg_path, days=days, top_n=top_n, offset_days=offset_days)
-    readable_slots = [f"{s['start_readable']} - {s['end_readable']}" for s in slots]
+    readable_slots = [format_readable_slot(s) for s in slots]
     return readable_slots
 
 # -------------------------
@@ -263,6 +344,33 @@ def is_slot_free(cfg: dict, start_iso: str, end_iso: str) -> bool:
 # -------------------------
 # Create a calendar event
 # -------------------------
+def build_event_body(
+    cfg: dict,
+    summary: str,
+    start_iso: str,
+    end_iso: str,
+    email: str = "",
+    mail_body: str = "",
+    conference: bool = False,
+    invite_attendees: bool = False
+) -> dict:
+    event_body = {
+        "summary": summary,
+        "description": f"Email: {email}\n\n{mail_body}",
+        "start": {"dateTime": start_iso, "timeZone": cfg.get("timezone", "UTC")},
+        "end": {"dateTime": end_iso, "timeZone": cfg.get("timezone", "UTC")},
+    }
+
+    if invite_attendees and email:
+        event_body["attendees"] = [{"email": email}]
+
+    if conference:
+        # requestId must be unique per event (several can be created in one batch)
+        event_body["conferenceData"] = {"createRequest": {"requestId": f"meet-{uuid.uuid4().hex}"}}
+
+    return event_body
+
+
 def create_event(
     cfg: dict,
     summary: str,
@@ -284,29 +392,82 @@ def create_event(
     Returns event dict.
     """
     svc = get_service_account_service()
-    event_body = {
-        "summary": summary,
-        "description": f"Email: {email}\n\n{mail_body}",
-        "start": {"dateTime": start_iso, "timeZone": cfg.get("timezone", "UTC")},
-        "end": {"dateTime": end_iso, "timeZone": cfg.get("timezone", "UTC")},
-    }
-
-    if invite_attendees and email:
-        event_body["attendees"] = [{"email": email}]
-
-    if conference:
-        event_body["conferenceData"] = {"createRequest": {"requestId": f"meet-{int(dt.datetime.now().timestamp())}"}}
+    event_body = build_event_body(
+        cfg, summary, start_iso, end_iso,
+        email=email, mail_body=mail_body,
+        conference=conference, invite_attendees=invite_attendees
+    )
 
     try:
-        created_event = svc.events().insert(
+        created_event = execute(svc.events().insert(
             calendarId=cfg["calendar_id"],
             body=event_body,
             conferenceDataVersion=1 if conference else 0
-        ).execute()
+        ), "calendar.events.insert")
         return created_event
     except HttpError as e:
         logger.error("Failed to create event: %s", e)
         raise
+
+
+# -------------------------
+# Create many calendar events (batch HTTP)
+# -------------------------
+def create_events_batch(cfg: dict, events: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Insert many events using googleapiclient batch requests, BATCH_MAX_REQUESTS
+    inserts per HTTP round-trip.
+    - events: list of dicts with the create_event keyword arguments
+      (summary, start_iso, end_iso, email, mail_body, conference, invite_attendees)
+      plus an optional "key" used to match results back to the caller.
+    Returns {"created": [{"key", "event"}], "failed": [{"key", "error"}]}.
+    A failed insert never aborts the rest of the batch.
+    """
+    svc = get_service_account_service()
+    created: List[Dict] = []
+    failed: List[Dict] = []
+
+    items = [(str(ev.get("key", i)), ev) for i, ev in enumerate(events)]
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            logger.error("Batch insert %s failed: %s", request_id, exception)
+            failed.append({"key": request_id, "error": str(exception)})
+        else:
+            created.append({"key": request_id, "event": response})
+
+    for i in range(0, len(items), BATCH_MAX_REQUESTS):
+        chunk = items[i:i + BATCH_MAX_REQUESTS]
+        batch = svc.new_batch_http_request(callback=_callback)
+        for key, ev in chunk:
+            conference = bool(ev.get("conference", False))
+            body = build_event_body(
+                cfg,
+                ev.get("summary", ""),
+                ev["start_iso"],
+                ev["end_iso"],
+                email=ev.get("email", ""),
+                mail_body=ev.get("mail_body", ""),
+                conference=conference,
+                invite_attendees=bool(ev.get("invite_attendees", False))
+            )
+            batch.add(
+                svc.events().insert(
+                    calendarId=cfg["calendar_id"],
+                    body=body,
+                    conferenceDataVersion=1 if conference else 0
+                ),
+                request_id=key
+            )
+        try:
+            execute(batch, "calendar.events.batch_insert", requests=len(chunk))
+        except Exception as e:
+            # whole round-trip failed: every request in this chunk is unaccounted for
+            logger.error("Batch insert request failed: %s", e)
+            done = {c["key"] for c in created} | {f["key"] for f in failed}
+            failed.extend({"key": key, "error": str(e)} for key, _ in chunk if key not in done)
+
+    return {"created": created, "failed": failed}
 ##############################################################################################################
 
 
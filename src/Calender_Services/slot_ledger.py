@@ -0,0 +1,76 @@
+import os
+import datetime as dt
+from typing import List, Dict, Optional
+
+import pytz
+
+from src.utils.helpers import load_json, update_json
+from src.utils.tenants import data_path
+
+# -------------------------
+# Slot reservation ledger
+# -------------------------
+# Soft holds on slots we have offered in a draft, so consecutive drafts offer
+# different slots and approval can be answered locally.
+# Stored as {slot_id: {"owner": email, "expires_at": iso}} using the ids from
+# compute_free_slots_from_busy.
+LEDGER_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "slot_holds.json")
+HOLD_TTL_MINUTES = int(os.getenv("SLOT_HOLD_TTL_MINUTES", "30"))
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.now(pytz.UTC)
+
+
+def _active(holds) -> Dict[str, Dict]:
+    if not isinstance(holds, dict):
+        return {}
+    now = _now()
+    return {
+        key: h for key, h in holds.items()
+        if dt.datetime.fromisoformat(h.get("expires_at", "1970-01-01T00:00:00+00:00")) > now
+    }
+
+
+def holder_of(slot_id: str) -> Optional[str]:
+    """Owner email of an unexpired hold on slot_id, or None."""
+    hold = _active(load_json(data_path(LEDGER_FILE), {})).get(slot_id)
+    return hold["owner"] if hold else None
+
+
+def pick_slots(owner: str, candidates: List[Dict], n: int, ttl_minutes: Optional[int] = None) -> List[Dict]:
+    """
+    Choose up to n candidate slots (dicts with "id") not held by
+    another prospect, and hold them for owner. Any previous holds of owner are
+    replaced, so regenerating a draft does not leak holds.
+    """
+    owner = (owner or "").lower()
+    expires_at = (_now() + dt.timedelta(minutes=ttl_minutes or HOLD_TTL_MINUTES)).isoformat()
+
+    chosen = []
+
+    def _pick(holds):
+        holds = {k: h for k, h in _active(holds).items() if h["owner"] != owner}
+        chosen[:] = [s for s in candidates if s["id"] not in holds][:n]
+        for s in chosen:
+            holds[s["id"]] = {"owner": owner, "expires_at": expires_at}
+        return holds
+
+    # locked read-modify-write: workers picking at once never share a slot
+    update_json(data_path(LEDGER_FILE), _pick, {})
+    return chosen
+
+
+def release_holds(owner: str) -> int:
+    """Release every hold of owner (e.g. once their email is sent)."""
+    owner = (owner or "").lower()
+    released = []
+
+    def _release(holds):
+        holds = _active(holds)
+        kept = {k: h for k, h in holds.items() if h["owner"] != owner}
+        released.append(len(holds) - len(kept))
+        return kept
+
+    update_json(data_path(LEDGER_FILE), _release, {})
+    return released[0]
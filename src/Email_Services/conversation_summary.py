@@ -0,0 +1,95 @@
+import os
+import logging
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from src.utils.helpers import load_json, update_json
+from src.utils.rate_limiter import chat_completion
+from src.utils.single_flight import single_flight
+from src.utils.cache_backend import cached
+from src.utils.clients import tenant_openai_client
+from src.utils.tenants import data_path
+from src.Email_Services.get_mails import get_messages_since, MAIL_CACHE_TTL
+
+load_dotenv()
+
+# ------------------- Conversation summaries -------------------
+# One rolling summary per prospect in data/conversation_summaries.json:
+# {email: {"summary", "uids": {"inbox", "sent"}, "messages", "updated_at"}}.
+# Each update folds only messages newer than the stored UIDs into the
+# previous summary, so a long thread is never re-read or re-summarized.
+SUMMARY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                            "conversation_summaries.json")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "250"))
+SUMMARY_MAX_NEW_MESSAGES = int(os.getenv("SUMMARY_MAX_NEW_MESSAGES", "20"))
+MESSAGE_MAX_CHARS = 2000
+
+SUMMARY_SYSTEM_PROMPT = f"""
+You maintain a running summary of a sales email conversation with one prospect.
+Update the existing summary with the new messages. Keep facts that still matter:
+their needs and objections, questions asked, times proposed or agreed, commitments
+on either side and the current status. Drop greetings and signatures.
+Return plain text only, at most {SUMMARY_MAX_TOKENS} tokens.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def load_summaries() -> dict:
+    data = load_json(data_path(SUMMARY_FILE), {})
+    return data if isinstance(data, dict) else {}
+
+
+def _fold(summary: str, messages: list) -> str:
+    lines = []
+    for m in messages:
+        who = "Prospect" if m["direction"] == "in" else "Us"
+        lines.append(f"[{m['date'] or 'unknown date'}] {who}:\n{m['text'][:MESSAGE_MAX_CHARS]}")
+    response = chat_completion(
+        tenant_openai_client(),
+        model=SUMMARY_MODEL,
+        temperature=0,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT.strip()},
+            {"role": "user", "content": f"Existing summary:\n{summary or '(none yet)'}\n\nNew messages:\n"
+                                        + "\n\n".join(lines)}
+        ]
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+@single_flight("conversation_summary")
+@cached("mail:summary", MAIL_CACHE_TTL)
+def get_conversation_summary(email: str) -> str:
+    """
+    Up-to-date summary of the conversation with email, folding in any
+    messages since the last update. Falls back to the stored summary when
+    IMAP or the LLM is unavailable.
+    """
+    key = email.lower()
+    entry = load_summaries().get(key) or {}
+    messages, uids = get_messages_since(email, entry.get("uids"), limit=SUMMARY_MAX_NEW_MESSAGES)
+    if not messages:
+        return entry.get("summary", "")
+
+    try:
+        summary = _fold(entry.get("summary", ""), messages)
+    except Exception as e:
+        logger.warning("Conversation summary update failed for %s: %s", email, e)
+        return entry.get("summary", "")
+
+    def _store(data):
+        data = data if isinstance(data, dict) else {}
+        data[key] = {
+            "summary": summary,
+            "uids": uids,
+            "messages": (data.get(key) or {}).get("messages", 0) + len(messages),
+            "updated_at": datetime.now().isoformat()
+        }
+        return data
+
+    update_json(data_path(SUMMARY_FILE), _store, {})
+    return summary
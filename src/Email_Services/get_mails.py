@@ -1,87 +1,178 @@
-import imaplib
 import email
+import email.utils
 import os
 from dotenv import load_dotenv
 
+from src.utils.single_flight import single_flight
+from src.utils.cache_backend import cached, STALE_CACHE_TTL
+from src.utils.circuit_breaker import get_breaker, CircuitOpenError
+from src.utils.clients import imap_connect
+from src.utils.tracing import span
+
 # Load .env variables
 load_dotenv()
 
-IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com")
-IMAP_USER = os.getenv("IMAP_USER")
-IMAP_PASS = os.getenv("IMAP_PASS")
+# the mailbox is the current tenant's (IMAP_HOST / IMAP_USER / IMAP_PASS)
+MAIL_CACHE_TTL = float(os.getenv("MAIL_CACHE_TTL", "60"))
 
 
+@single_flight("get_last_mail_from_sender")
+@cached("mail:last_from", MAIL_CACHE_TTL, stale_ttl=STALE_CACHE_TTL)
 def get_last_mail_from_sender(sender_email):
     """
     Get the latest mail from a specific sender in your inbox.
     """
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_HOST)
-        mail.login(IMAP_USER, IMAP_PASS)
-        mail.select("inbox")
-
-        status, data = mail.search(None, f'(FROM "{sender_email}")')
-        if status != "OK" or not data[0]:
-            return ""
-
-        latest_id = data[0].split()[-1]
-        status, msg_data = mail.fetch(latest_id, "(RFC822)")
-        if status != "OK":
-            return ""
-
-        msg = email.message_from_bytes(msg_data[0][1])
-        subject = msg["subject"] or ""
-
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
-                    body = part.get_payload(decode=True).decode(errors="ignore")
-                    break
-        else:
-            body = msg.get_payload(decode=True).decode(errors="ignore")
-
-        mail_text = f"{subject}\n{body.strip()}".strip()
-        return mail_text if len(mail_text.split()) >= 3 else ""
-
+        with span("imap.last_from"), get_breaker("imap"):
+            mail = imap_connect()
+            mail.select("inbox")
+
+            status, data = mail.search(None, f'(FROM "{sender_email}")')
+            if status != "OK" or not data[0]:
+                return ""
+
+            latest_id = data[0].split()[-1]
+            status, msg_data = mail.fetch(latest_id, "(RFC822)")
+            if status != "OK":
+                return ""
+
+            msg = email.message_from_bytes(msg_data[0][1])
+            subject = msg["subject"] or ""
+
+            body = ""
+            if msg.is_multipart():
+                for part in msg.walk():
+                    if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
+                        body = part.get_payload(decode=True).decode(errors="ignore")
+                        break
+            else:
+                body = msg.get_payload(decode=True).decode(errors="ignore")
+
+            mail_text = f"{subject}\n{body.strip()}".strip()
+            return mail_text if len(mail_text.split()) >= 3 else ""
+
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error fetching email: {e}")
         return ""
 
 
+@single_flight("get_last_sent_mail_to")
+@cached("mail:last_sent", MAIL_CACHE_TTL, stale_ttl=STALE_CACHE_TTL)
 def get_last_sent_mail_to(recipient_email):
     """
     Get the latest sent mail to a specific recipient.
     """
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_HOST)
-        mail.login(IMAP_USER, IMAP_PASS)
-        mail.select('"[Gmail]/Sent Mail"')
-
-        status, data = mail.search(None, f'(TO "{recipient_email}")')
-        if status != "OK" or not data[0]:
-            return ""
-
-        latest_id = data[0].split()[-1]
-        status, msg_data = mail.fetch(latest_id, "(RFC822)")
-        if status != "OK":
-            return ""
-
-        msg = email.message_from_bytes(msg_data[0][1])
-        subject = msg["subject"] or ""
-
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
-                    body = part.get_payload(decode=True).decode(errors="ignore")
-                    break
-        else:
-            body = msg.get_payload(decode=True).decode(errors="ignore")
-
-        mail_text = f"{subject}\n{body.strip()}".strip()
-        return mail_text if len(mail_text.split()) >= 3 else ""
-
+        with span("imap.last_sent"), get_breaker("imap"):
+            mail = imap_connect()
+            mail.select('"[Gmail]/Sent Mail"')
+
+            status, data = mail.search(None, f'(TO "{recipient_email}")')
+            if status != "OK" or not data[0]:
+                return ""
+
+            latest_id = data[0].split()[-1]
+            status, msg_data = mail.fetch(latest_id, "(RFC822)")
+            if status != "OK":
+                return ""
+
+            msg = email.message_from_bytes(msg_data[0][1])
+            subject = msg["subject"] or ""
+
+            body = ""
+            if msg.is_multipart():
+                for part in msg.walk():
+                    if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
+                        body = part.get_payload(decode=True).decode(errors="ignore")
+                        break
+            else:
+                body = msg.get_payload(decode=True).decode(errors="ignore")
+
+            mail_text = f"{subject}\n{body.strip()}".strip()
+            return mail_text if len(mail_text.split()) >= 3 else ""
+
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error fetching sent email: {e}")
         return ""
+
+
+def has_reply_since(sender_email, since):
+    """
+    True if the inbox has any mail from sender_email on or after the date of
+    `since` (IMAP SINCE has day granularity). None when IMAP is unreachable
+    or its circuit breaker is open.
+    """
+    try:
+        with span("imap.has_reply_since"), get_breaker("imap"):
+            mail = imap_connect()
+            mail.select("inbox", readonly=True)
+
+            status, data = mail.search(None, f'(FROM "{sender_email}" SINCE {since.strftime("%d-%b-%Y")})')
+            return status == "OK" and bool(data[0])
+
+    except Exception as e:
+        print(f"Error checking replies: {e}")
+        return None
+
+
+def _message_text(msg):
+    """Subject plus plain-text body of a parsed message."""
+    subject = msg["subject"] or ""
+    body = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition")):
+                body = (part.get_payload(decode=True) or b"").decode(errors="ignore")
+                break
+    else:
+        body = (msg.get_payload(decode=True) or b"").decode(errors="ignore")
+    return f"{subject}\n{body.strip()}".strip()
+
+
+def get_messages_since(contact_email, last_uids=None, limit=20):
+    """
+    Messages exchanged with contact_email whose UID is above last_uids
+    ({"inbox": uid, "sent": uid}), oldest first and at most `limit` (newest
+    kept). Returns (messages, uids) where messages are
+    [{"direction": "in"/"out", "date": ..., "text": ...}] and uids the new
+    high-water marks. Returns (None, last_uids) when IMAP is unreachable.
+    """
+    last_uids = dict(last_uids or {})
+    folders = (("inbox", "inbox", "FROM", "in"), ("sent", '"[Gmail]/Sent Mail"', "TO", "out"))
+    try:
+        with span("imap.messages_since"), get_breaker("imap"):
+            mail = imap_connect()
+
+            found = []
+            for key, folder, field, direction in folders:
+                mail.select(folder, readonly=True)
+                after = int(last_uids.get(key, 0))
+                status, data = mail.uid("search", None, f'({field} "{contact_email}" UID {after + 1}:*)')
+                if status != "OK" or not data[0]:
+                    continue
+                # "n:*" always matches the highest UID, even when it is below n
+                uids = sorted(u for u in map(int, data[0].split()) if u > after)[-limit:]
+                for uid in uids:
+                    status, msg_data = mail.uid("fetch", str(uid), "(RFC822)")
+                    if status != "OK" or not msg_data or not isinstance(msg_data[0], tuple):
+                        continue
+                    msg = email.message_from_bytes(msg_data[0][1])
+                    try:
+                        date = email.utils.parsedate_to_datetime(msg["date"]).isoformat()
+                    except Exception:
+                        date = ""
+                    found.append({"direction": direction, "date": date, "text": _message_text(msg)})
+                if uids:
+                    last_uids[key] = uids[-1]
+
+            mail.logout()
+            found.sort(key=lambda m: m["date"])
+            return found[-limit:], last_uids
+
+    except Exception as e:
+        print(f"Error fetching conversation: {e}")
+        return None, last_uids
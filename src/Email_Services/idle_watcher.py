@@ -0,0 +1,213 @@
+import os
+import ssl
+import time
+import email
+import select
+import logging
+import imaplib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from email.utils import parseaddr
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.utils.history_store import known_prospects
+from src.utils.draft_store import save_speculative_draft, discard_speculative_draft
+from src.utils.cache_backend import invalidate
+from src.Email_Services.get_mails import get_last_mail_from_sender
+from src.utils.clients import imap_connect
+from src.Email_Services.conversation_summary import get_conversation_summary
+from src.utils.tenants import DEFAULT_TENANT, get_tenant, tenant_ids, use_tenant
+
+load_dotenv()
+
+# Servers drop IDLE after ~30 min, so re-issue it a bit earlier
+IDLE_RENEW_SECONDS = int(os.getenv("IMAP_IDLE_RENEW_SECONDS", "1500"))
+IDLE_WATCHER_WORKERS = int(os.getenv("IMAP_IDLE_WATCHER_WORKERS", "2"))
+RECONNECT_MAX_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------- IDLE watcher -------------------
+class InboxIdleWatcher:
+    """
+    Waits on INBOX with IMAP IDLE. When a new message from a known prospect
+    (anyone in history) arrives, `generate(prospect)` runs on a bounded worker
+    pool and its record is stored as that prospect's speculative draft.
+    A newer reply from the same prospect supersedes any pending or running
+    generation: the old job is cancelled or its result discarded.
+    One watcher per tenant; everything it does runs as that tenant.
+    """
+
+    def __init__(self, generate: Callable[[dict], dict], workers: int = IDLE_WATCHER_WORKERS,
+                 tenant_id: str = DEFAULT_TENANT):
+        self.generate = generate
+        self.tenant_id = tenant_id
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculative-draft")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Future] = {}
+        self._generation: Dict[str, int] = {}
+
+    # -------- lifecycle --------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"imap-idle-watcher-{self.tenant_id}", daemon=True)
+        self._thread.start()
+        logger.info("IMAP IDLE watcher started for tenant %s", self.tenant_id)
+
+    def stop(self):
+        self._stop.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # -------- speculative jobs --------
+    def submit(self, prospect: dict):
+        email_key = prospect["email"].lower()
+        with self._lock:
+            generation = self._generation.get(email_key, 0) + 1
+            self._generation[email_key] = generation
+            old = self._jobs.get(email_key)
+            if old is not None:
+                old.cancel()  # no-op if already running; its result is dropped below
+        discard_speculative_draft(email_key)
+        # the cached "last mail" is now out of date
+        invalidate(get_last_mail_from_sender, prospect["email"])
+        invalidate(get_conversation_summary, prospect["email"])
+
+        future = self.pool.submit(self._generate, prospect, email_key, generation)
+        with self._lock:
+            self._jobs[email_key] = future
+
+    def _generate(self, prospect: dict, email_key: str, generation: int):
+        with use_tenant(self.tenant_id):
+            self._generate_as_tenant(prospect, email_key, generation)
+
+    def _generate_as_tenant(self, prospect: dict, email_key: str, generation: int):
+        try:
+            record = self.generate(prospect)
+        except Exception:
+            logger.exception("Speculative draft failed for %s", email_key)
+            with self._lock:
+                if self._generation.get(email_key) == generation:
+                    self._jobs.pop(email_key, None)
+            return
+        with self._lock:
+            if self._generation.get(email_key) != generation:
+                logger.info("Dropping stale speculative draft for %s", email_key)
+                return
+            self._jobs.pop(email_key, None)
+        save_speculative_draft(email_key, record)
+        logger.info("Speculative draft ready for %s", email_key)
+
+    # -------- IMAP loop --------
+    def _run(self):
+        with use_tenant(self.tenant_id):
+            self._run_as_tenant()
+
+    def _run_as_tenant(self):
+        backoff = 5
+        while not self._stop.is_set():
+            try:
+                self._watch()
+                backoff = 5
+            except Exception as e:
+                logger.warning("IMAP IDLE watcher error: %s (reconnecting in %ss)", e, backoff)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+    def _watch(self):
+        conn = imap_connect(timeout=60)
+        try:
+            conn.select("INBOX", readonly=True)
+            last_uid = self._max_uid(conn)
+
+            while not self._stop.is_set():
+                if self._idle(conn):
+                    last_uid = self._handle_new(conn, last_uid)
+        finally:
+            try:
+                conn.logout()
+            except Exception:
+                pass
+
+    def _max_uid(self, conn) -> int:
+        status, data = conn.uid("search", None, "ALL")
+        uids = data[0].split() if status == "OK" and data and data[0] else []
+        return int(uids[-1]) if uids else 0
+
+    def _idle(self, conn) -> bool:
+        """Run one IDLE cycle; True if the server reported new messages."""
+        tag = conn._new_tag().decode()
+        conn.send(f"{tag} IDLE\r\n".encode())
+        if not conn.readline().startswith(b"+"):
+            raise imaplib.IMAP4.abort("IDLE not accepted")
+
+        changed = False
+        deadline = time.monotonic() + IDLE_RENEW_SECONDS
+        while not changed and not self._stop.is_set() and time.monotonic() < deadline:
+            # wake every few seconds to honor stop(); select() can't see lines
+            # imaplib has already read into its buffer, so check that first
+            if not self._buffered(conn) and not select.select([conn.sock], [], [], 5)[0]:
+                continue
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            changed = b"EXISTS" in line
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed after IDLE")
+            changed = changed or b"EXISTS" in line
+            if line.startswith(tag.encode()):
+                return changed
+
+    @staticmethod
+    def _buffered(conn) -> bool:
+        """True if conn.file holds unread bytes (or TLS has decrypted ones pending)."""
+        timeout = conn.sock.gettimeout()
+        conn.sock.settimeout(0)
+        try:
+            return bool(conn.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            conn.sock.settimeout(timeout)
+
+    def _handle_new(self, conn, last_uid: int) -> int:
+        status, data = conn.uid("search", None, f"UID {last_uid + 1}:*")
+        uids = [int(u) for u in (data[0].split() if status == "OK" and data and data[0] else [])]
+        uids = [u for u in uids if u > last_uid]  # "N:*" always matches the last message
+        if not uids:
+            return last_uid
+
+        prospects = known_prospects()
+        for uid in uids:
+            status, msg_data = conn.uid("fetch", str(uid), "(BODY.PEEK[HEADER.FIELDS (FROM)])")
+            if status != "OK" or not msg_data or not isinstance(msg_data[0], tuple):
+                continue
+            sender = parseaddr(email.message_from_bytes(msg_data[0][1]).get("From", ""))[1].lower()
+            if sender in prospects:
+                logger.info("New reply from prospect %s, generating speculative draft", sender)
+                self.submit(prospects[sender])
+        return max(uids)
+
+
+_watchers: Dict[str, InboxIdleWatcher] = {}
+
+
+def start_watcher(generate: Callable[[dict], dict]) -> Dict[str, InboxIdleWatcher]:
+    """One watcher per tenant with a mailbox configured (IMAP_USER)."""
+    for tenant_id in tenant_ids():
+        if tenant_id not in _watchers and get_tenant(tenant_id).setting("IMAP_USER"):
+            _watchers[tenant_id] = InboxIdleWatcher(generate, tenant_id=tenant_id)
+            _watchers[tenant_id].start()
+    return _watchers
+
+
+def stop_watcher():
+    while _watchers:
+        _watchers.popitem()[1].stop()
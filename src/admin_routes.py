@@ -0,0 +1,45 @@
+# admin_routes.py
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from src.utils.profiling import list_profiles, profile_path
+from src.utils.tracing import recent_traces, waterfall, render_waterfall
+
+router = APIRouter()
+
+
+# -------- Profiles --------
+@router.get("/admin/profiles")
+def list_profiles_route(limit: int = Query(20, ge=1, le=200)):
+    """Recent request profiles (send "X-Profile: 1" on a request to record one)."""
+    return {"profiles": list_profiles(limit)}
+
+
+@router.get("/admin/profiles/{profile_id}")
+def get_profile_route(profile_id: str, format: str = Query("txt", pattern="^(txt|prof|html)$")):
+    """A stored profile: text summary, raw pstats dump (prof) or sampling report (html)."""
+    path = profile_path(profile_id, "." + format)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    if format == "txt":
+        with open(path, encoding="utf-8") as f:
+            return PlainTextResponse(f.read())
+    return FileResponse(path, filename=f"{profile_id}.{format}")
+
+
+# -------- Traces --------
+@router.get("/admin/traces")
+def list_traces_route(limit: int = Query(20, ge=1, le=200)):
+    """Most recent request traces of this worker (TRACING=true), newest first."""
+    return {"traces": recent_traces(limit)}
+
+
+@router.get("/admin/traces/{trace_id}")
+def get_trace_route(trace_id: str, format: str = Query("json", pattern="^(json|text)$")):
+    """Waterfall of one trace with its critical path (text: one bar per span)."""
+    wf = waterfall(trace_id.lower())
+    if wf is None:
+        raise HTTPException(status_code=404, detail="Trace not found.")
+    if format == "text":
+        return PlainTextResponse(render_waterfall(wf))
+    return wf
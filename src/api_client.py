@@ -0,0 +1,270 @@
+# api_client.py
+"""
+Python client for the Draft Email API.
+
+    from src.api_client import DraftApiClient
+
+    api = DraftApiClient("http://localhost:8000")
+    record = api.generate_draft("ana@example.com", name="Ana")
+    api.update_draft("shorten the subject")
+    api.approve()
+    for rec in api.iter_history(page_size=100):
+        ...
+
+One keep-alive connection pool per client. GETs are retried on connection
+errors and 502/503/504 (honoring Retry-After). Draft generation is retried
+only on 503, which the server returns before doing any work. Approvals are
+never retried because they send mail. AsyncDraftApiClient (httpx) has the
+same methods as coroutines.
+"""
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # async client unavailable
+    httpx = None
+
+DEFAULT_TIMEOUT = 60.0  # server sheds interactive work well before this
+APPROVE_TIMEOUT = 120.0
+MAX_RETRIES = 3
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+class ApiError(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        return min(float(headers.get("Retry-After")), MAX_RETRY_AFTER_SECONDS)
+    except (TypeError, ValueError):
+        return None
+
+
+def _raise_for_status(status_code: int, headers, body) -> None:
+    if 200 <= status_code < 300 or status_code == 304:
+        return
+    detail = body.get("detail", body) if isinstance(body, dict) else body
+    raise ApiError(status_code, str(detail), _retry_after(headers))
+
+
+def _prospect(email: str, name: str, role: str, industry: str) -> dict:
+    return {"email": email, "name": name, "role": role, "industry": industry}
+
+
+# ------------------- Sync client -------------------
+class DraftApiClient:
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = DEFAULT_TIMEOUT,
+                 pool_size: int = 10, max_retries: int = MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._etags = {}  # url -> (etag, body) for conditional GETs
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -------- transport --------
+    def _request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs):
+        r = self.session.request(method, self.base_url + path, timeout=timeout or self.timeout, **kwargs)
+        try:
+            body = r.json()
+        except ValueError:
+            body = r.text
+        _raise_for_status(r.status_code, r.headers, body)
+        return r, body
+
+    def _get_cached(self, path: str, params: Optional[dict] = None):
+        """GET with If-None-Match; an unchanged resource is served from memory."""
+        key = (path, tuple(sorted((params or {}).items())))
+        cached = self._etags.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        r, body = self._request("GET", path, params=params, headers=headers)
+        if r.status_code == 304 and cached:
+            return cached[1]
+        if r.headers.get("ETag"):
+            self._etags[key] = (r.headers["ETag"], body)
+        return body
+
+    # -------- drafts --------
+    def generate_draft(self, email: str, name: str = "", role: str = "", industry: str = "") -> dict:
+        payload = _prospect(email, name, role, industry)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._request("POST", "/api/generate-draft", json=payload)[1]
+            except ApiError as e:
+                if e.status_code != 503 or attempt >= self.max_retries:
+                    raise
+                time.sleep(e.retry_after or 2 ** attempt)
+
+    def generate_drafts(self, prospects: List[dict], concurrency: int = 4) -> List[dict]:
+        """
+        Generate drafts for many prospects over the shared pool. Returns one
+        {"prospect", "result"} or {"prospect", "error"} per prospect, in order.
+        """
+        def _one(p):
+            try:
+                return {"prospect": p, "result": self.generate_draft(**_prospect(
+                    p["email"], p.get("name", ""), p.get("role", ""), p.get("industry", "")))}
+            except Exception as e:
+                return {"prospect": p, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(_one, prospects))
+
+    def update_draft(self, feedback: str) -> dict:
+        return self._request("POST", "/api/act", json={"decision": "U", "feedback": feedback})[1]
+
+    def approve(self) -> dict:
+        """Send the current draft (creates the event for a confirmed slot). Not retried."""
+        return self._request("POST", "/api/act", json={"decision": "A", "feedback": None},
+                             timeout=APPROVE_TIMEOUT)[1]
+
+    def approve_batch(self, drafts: List[dict]) -> dict:
+        """Approve many draft records in one call (/api/act-batch). Not retried."""
+        return self._request("POST", "/api/act-batch", json={"drafts": drafts}, timeout=APPROVE_TIMEOUT)[1]
+
+    # -------- history --------
+    def history(self, limit: Optional[int] = None, offset: int = 0, newest_first: bool = False) -> dict:
+        """{"history", "total", "offset", "limit"}; revalidated with ETag."""
+        params = {"offset": offset, "newest_first": str(newest_first).lower()}
+        if limit is not None:
+            params["limit"] = limit
+        return self._get_cached("/api/history", params)
+
+    def iter_history(self, page_size: int = 200, newest_first: bool = False) -> Iterator[dict]:
+        """Stream history records page by page without holding all of them."""
+        offset = 0
+        while True:
+            page = self.history(limit=page_size, offset=offset, newest_first=newest_first)
+            yield from page["history"]
+            offset += len(page["history"])
+            if not page["history"] or offset >= page["total"]:
+                return
+
+    # -------- status --------
+    def status(self) -> dict:
+        return self._request("GET", "/api/status", timeout=5)[1]
+
+    def ping(self) -> bool:
+        try:
+            self.status()
+            return True
+        except (requests.RequestException, ApiError):
+            return False
+
+
+# ------------------- Async client -------------------
+class AsyncDraftApiClient:
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = DEFAULT_TIMEOUT,
+                 pool_size: int = 10, max_retries: int = MAX_RETRIES):
+        if httpx is None:
+            raise RuntimeError("AsyncDraftApiClient needs httpx (pip install httpx)")
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            # connect-level retries; HTTP-level ones are handled below
+            transport=httpx.AsyncHTTPTransport(retries=max_retries)
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _request(self, method: str, path: str, retry_on=(), **kwargs):
+        for attempt in range(self.max_retries + 1):
+            r = await self.client.request(method, path, **kwargs)
+            try:
+                body = r.json()
+            except ValueError:
+                body = r.text
+            try:
+                _raise_for_status(r.status_code, r.headers, body)
+                return body
+            except ApiError as e:
+                if e.status_code not in retry_on or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(e.retry_after or 2 ** attempt)
+
+    async def generate_draft(self, email: str, name: str = "", role: str = "", industry: str = "") -> dict:
+        return await self._request("POST", "/api/generate-draft", retry_on=(503,),
+                                   json=_prospect(email, name, role, industry))
+
+    async def generate_drafts(self, prospects: List[dict], concurrency: int = 4) -> List[dict]:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one(p):
+            async with sem:
+                try:
+                    return {"prospect": p, "result": await self.generate_draft(**_prospect(
+                        p["email"], p.get("name", ""), p.get("role", ""), p.get("industry", "")))}
+                except Exception as e:
+                    return {"prospect": p, "error": str(e)}
+
+        return await asyncio.gather(*(_one(p) for p in prospects))
+
+    async def update_draft(self, feedback: str) -> dict:
+        return await self._request("POST", "/api/act", json={"decision": "U", "feedback": feedback})
+
+    async def approve(self) -> dict:
+        return await self._request("POST", "/api/act", json={"decision": "A", "feedback": None},
+                                   timeout=APPROVE_TIMEOUT)
+
+    async def approve_batch(self, drafts: List[dict]) -> dict:
+        return await self._request("POST", "/api/act-batch", json={"drafts": drafts}, timeout=APPROVE_TIMEOUT)
+
+    async def history(self, limit: Optional[int] = None, offset: int = 0, newest_first: bool = False) -> dict:
+        params = {"offset": offset, "newest_first": str(newest_first).lower()}
+        if limit is not None:
+            params["limit"] = limit
+        return await self._request("GET", "/api/history", retry_on=(502, 503, 504), params=params)
+
+    async def iter_history(self, page_size: int = 200, newest_first: bool = False) -> AsyncIterator[dict]:
+        offset = 0
+        while True:
+            page = await self.history(limit=page_size, offset=offset, newest_first=newest_first)
+            for rec in page["history"]:
+                yield rec
+            offset += len(page["history"])
+            if not page["history"] or offset >= page["total"]:
+                return
+
+    async def status(self) -> dict:
+        return await self._request("GET", "/api/status", timeout=5)
@@ -0,0 +1,295 @@
+# batch_drafts.py
+"""
+Low-priority bulk draft generation through the OpenAI Batch API.
+
+Prompts are built exactly like generate_draft does, written to a JSONL batch
+file, submitted and polled; finished drafts land in the draft store as
+speculative drafts (one per prospect), ready when the user opens them.
+
+    python -m src.batch_drafts prospects.json        # list of prospect dicts
+    python -m src.batch_drafts --from-history        # every prospect in history
+    python -m src.batch_drafts --collect <run_dir>   # resume polling a submitted run
+
+Point OPENAI_BASE_URL at src/batch_stub_server.py to try it without an account.
+Runs belong to the current tenant (TENANT=<id> on the command line); their
+drafts are collected into that tenant's store.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import logging
+from datetime import datetime
+
+from openai import OpenAI
+
+# draft pipeline modules are imported the same way main.py does
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from draft_routes import Prospect, gather_draft_inputs, make_draft_record
+from src.generate_draft import (
+    MODEL,
+    DRAFT_TEMPERATURE,
+    DRAFT_MAX_TOKENS,
+    build_draft_prompt,
+    draft_messages,
+    parse_draft_output,
+    fallback_draft
+)
+from src.Calender_Services.slot_ledger import pick_slots
+from src.Calender_Services.services import freebusy_query, get_service_account_service, load_calendar_config
+from src.utils.draft_store import save_speculative_draft
+from src.utils.history_store import known_prospects
+from src.utils.clients import tenant_openai_client
+from src.utils.admission import admit, BATCH
+from src.utils.tenants import DEFAULT_TENANT, current_tenant, data_path, use_tenant
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "batches")
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_POLL_SECONDS = int(os.getenv("OPENAI_BATCH_POLL_SECONDS", "60"))
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def _client() -> OpenAI:
+    return tenant_openai_client()
+
+
+# ------------------- Submit -------------------
+def submit_batch(prospects: list[dict], client: OpenAI | None = None) -> str:
+    """
+    Gather inputs and build prompts for every prospect, write the JSONL batch
+    file, upload it and create the batch. Returns the run directory, which
+    holds the input file, per-request context and run metadata.
+    """
+    client = client or _client()
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    run_dir = os.path.join(data_path(BATCH_DIR), run_id)
+    os.makedirs(run_dir, exist_ok=True)
+
+    started = time.time()
+    contexts = {}
+    input_path = os.path.join(run_dir, "input.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for i, p in enumerate(prospects):
+            with admit(BATCH):
+                inputs = gather_draft_inputs(Prospect(**p))
+            prompt = build_draft_prompt(**inputs)
+            custom_id = f"draft-{i}"
+            contexts[custom_id] = {"inputs": inputs, "prompt": prompt}
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": MODEL,
+                    "temperature": DRAFT_TEMPERATURE,
+                    "max_tokens": DRAFT_MAX_TOKENS,
+                    "messages": draft_messages(prompt)
+                }
+            }, ensure_ascii=False) + "\n")
+
+    with open(input_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"run_id": run_id, "kind": "draft"}
+    )
+
+    with open(os.path.join(run_dir, "contexts.json"), "w", encoding="utf-8") as f:
+        json.dump(contexts, f, ensure_ascii=False)
+    with open(os.path.join(run_dir, "run.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "run_id": run_id,
+            "tenant": current_tenant().id,
+            "batch_id": batch.id,
+            "input_file_id": uploaded.id,
+            "requests": len(contexts),
+            "prepared_seconds": round(time.time() - started, 3),
+            "submitted_at": time.time()
+        }, f, indent=2)
+
+    logger.info("Submitted batch %s (%d requests) for run %s", batch.id, len(contexts), run_id)
+    return run_dir
+
+
+# ------------------- Poll + ingest -------------------
+def _free_slot_ids(contexts: dict) -> set:
+    """
+    Ids of the run's candidate slots that are still in the future and free in
+    the calendar, with one freebusy call over their whole window. The batch
+    may have run for hours, so slots checked at submit time can be booked by now.
+    """
+    slots = {s["id"]: s for ctx in contexts.values() for s in ctx["inputs"]["available_slots"] or []}
+    if not slots:
+        return set()
+    window_min = min((s["start_iso"] for s in slots.values()), key=datetime.fromisoformat)
+    window_max = max((s["end_iso"] for s in slots.values()), key=datetime.fromisoformat)
+    busy = freebusy_query(get_service_account_service(), load_calendar_config()["calendar_id"], window_min, window_max)
+    busy_ranges = [(
+        datetime.fromisoformat(b["start"].replace("Z", "+00:00")),
+        datetime.fromisoformat(b["end"].replace("Z", "+00:00"))
+    ) for b in busy]
+    now = datetime.now().astimezone()
+    free = set()
+    for sid, slot in slots.items():
+        s, e = datetime.fromisoformat(slot["start_iso"]), datetime.fromisoformat(slot["end_iso"])
+        if s > now and not any(s < be and e > bs for bs, be in busy_ranges):
+            free.add(sid)
+    return free
+
+
+def _keep_slots(draft: dict, prompt: dict, slot_ids: set) -> dict:
+    """
+    The draft restricted to slots in slot_ids. Falls back to fallback_draft
+    (over the remaining slots) when its confirmed slot or every suggested slot is gone.
+    """
+    if not draft.get("slot_ids") and not draft.get("final_slot_id"):
+        return draft
+    kept = [(sid, text) for sid, text in zip(draft["slot_ids"], draft["slots"]) if sid in slot_ids]
+    if draft.get("final_slot_id"):
+        usable = draft["final_slot_id"] in slot_ids
+    else:
+        usable = bool(kept)
+    if not usable:
+        return fallback_draft(dict(prompt, offered_slots=[s for s in prompt["offered_slots"] if s["id"] in slot_ids]))
+    return dict(draft, slot_ids=[sid for sid, _ in kept], slots=[text for _, text in kept])
+
+
+def collect_batch(run_dir: str, client: OpenAI | None = None, poll_seconds: int = BATCH_POLL_SECONDS,
+                  wait: bool = True) -> dict | None:
+    """
+    Poll the run's batch until it finishes, ingest every result into the
+    draft store and write summary.json (tokens, throughput, failures).
+    With wait=False, returns None right away while the batch is still running.
+    """
+    with open(os.path.join(run_dir, "run.json"), encoding="utf-8") as f:
+        run = json.load(f)
+    # drafts go to the tenant the run was submitted for
+    with use_tenant(run.get("tenant", DEFAULT_TENANT)):
+        return _collect(run_dir, run, client or _client(), poll_seconds, wait)
+
+
+def _collect(run_dir: str, run: dict, client: OpenAI, poll_seconds: int, wait: bool = True) -> dict | None:
+    with open(os.path.join(run_dir, "contexts.json"), encoding="utf-8") as f:
+        contexts = json.load(f)
+
+    batch = client.batches.retrieve(run["batch_id"])
+    while batch.status not in TERMINAL_STATUSES:
+        if not wait:
+            return None
+        logger.info("Batch %s: %s", batch.id, batch.status)
+        time.sleep(poll_seconds)
+        batch = client.batches.retrieve(run["batch_id"])
+
+    summary = {
+        "run_id": run["run_id"],
+        "batch_id": batch.id,
+        "status": batch.status,
+        "requests": run["requests"],
+        "succeeded": 0,
+        "failed": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "errors": []
+    }
+
+    # slots may have been booked or held while the batch ran; without a
+    # calendar answer no stored slot is offered
+    try:
+        free_ids = _free_slot_ids(contexts)
+    except Exception as e:
+        logger.warning("Could not re-check slots for run %s: %s", run["run_id"], e)
+        free_ids = set()
+
+    seen = set()
+    if batch.output_file_id:
+        output = client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            custom_id = item.get("custom_id")
+            ctx = contexts.get(custom_id)
+            if ctx is None:
+                continue
+            seen.add(custom_id)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            usage = body.get("usage") or {}
+            summary["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            summary["completion_tokens"] += usage.get("completion_tokens", 0)
+            email = ctx["inputs"]["prospect"]["email"]
+            # holds placed at submit time may have expired while the batch ran:
+            # hold again what is still free and not taken by another prospect
+            free = [s for s in ctx["inputs"]["available_slots"] if s["id"] in free_ids]
+            held = pick_slots(email, free, len(free))
+            held_ids = {s["id"] for s in held}
+            try:
+                if response.get("status_code") != 200:
+                    raise ValueError(f"HTTP {response.get('status_code')}: {item.get('error')}")
+                text = body["choices"][0]["message"]["content"].strip()
+                draft = _keep_slots(parse_draft_output(text, ctx["prompt"]), ctx["prompt"], held_ids)
+                summary["succeeded"] += 1
+            except Exception as e:
+                draft = _keep_slots(fallback_draft(ctx["prompt"]), ctx["prompt"], held_ids)
+                summary["failed"] += 1
+                summary["errors"].append({"custom_id": custom_id, "error": str(e)})
+            inputs = dict(ctx["inputs"], available_slots=held)
+            save_speculative_draft(email, make_draft_record(inputs, draft))
+
+    # requests missing from the output (error file, expired batch, ...)
+    for custom_id in contexts:
+        if custom_id not in seen:
+            summary["failed"] += 1
+            summary["errors"].append({"custom_id": custom_id, "error": f"no output (batch {batch.status})"})
+
+    elapsed = max(time.time() - run["submitted_at"], 1e-6)
+    total_tokens = summary["prompt_tokens"] + summary["completion_tokens"]
+    summary["total_tokens"] = total_tokens
+    summary["elapsed_seconds"] = round(elapsed, 1)
+    summary["drafts_per_minute"] = round(summary["succeeded"] / elapsed * 60, 2)
+    summary["tokens_per_second"] = round(total_tokens / elapsed, 2)
+
+    with open(os.path.join(run_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(
+        "Batch run %s: %d ok / %d failed, %d tokens, %.2f drafts/min",
+        run["run_id"], summary["succeeded"], summary["failed"], total_tokens, summary["drafts_per_minute"]
+    )
+    return summary
+
+
+def run_batch(prospects: list[dict], client: OpenAI | None = None, poll_seconds: int = BATCH_POLL_SECONDS) -> dict:
+    client = client or _client()
+    run_dir = submit_batch(prospects, client=client)
+    return collect_batch(run_dir, client=client, poll_seconds=poll_seconds)
+
+
+# ------------------- CLI -------------------
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Generate drafts in bulk via the OpenAI Batch API")
+    parser.add_argument("prospects_file", nargs="?", help="JSON file with a list of prospect dicts")
+    parser.add_argument("--from-history", action="store_true", help="use every prospect found in history")
+    parser.add_argument("--collect", metavar="RUN_DIR", help="poll and ingest an already submitted run")
+    parser.add_argument("--poll-seconds", type=int, default=BATCH_POLL_SECONDS)
+    args = parser.parse_args()
+
+    if args.collect:
+        result = collect_batch(args.collect, poll_seconds=args.poll_seconds)
+    else:
+        if args.from_history:
+            prospect_list = list(known_prospects().values())
+        elif args.prospects_file:
+            with open(args.prospects_file, encoding="utf-8") as f:
+                prospect_list = json.load(f)
+        else:
+            parser.error("give a prospects file or --from-history")
+        result = run_batch(prospect_list, poll_seconds=args.poll_seconds)
+    print(json.dumps(result, indent=2))
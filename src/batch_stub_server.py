@@ -0,0 +1,201 @@
+# batch_stub_server.py
+"""
+Local stand-in for the OpenAI Files + Batch endpoints, for exercising
+batch_drafts.py without an account or spend.
+
+    python -m src.batch_stub_server --port 8765
+    OPENAI_BASE_URL=http://localhost:8765/v1 OPENAI_API_KEY=stub python -m src.batch_drafts prospects.json
+
+Every request in a batch gets a canned JSON draft as its completion after
+--delay seconds; usage is estimated at ~4 characters per token.
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILES: dict[str, dict] = {}
+BATCHES: dict[str, dict] = {}
+_lock = threading.Lock()
+PROCESS_DELAY_SECONDS = 2.0
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def _file_object(file_id: str) -> dict:
+    f = FILES[file_id]
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(f["content"]),
+        "created_at": f["created_at"],
+        "filename": f["filename"],
+        "purpose": f["purpose"],
+        "status": "processed"
+    }
+
+
+def _canned_completion(request: dict) -> dict:
+    body = request.get("body") or {}
+    messages = body.get("messages") or []
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+    user_prompt = str(messages[-1].get("content", "")) if messages else ""
+    slot_ids = re.findall(r"\[(slot-[0-9TZ]+)\]", user_prompt)
+    content = json.dumps({
+        "subject": "Following up on our conversation",
+        "body": "Hi,\n\nJust following up on my last note. Would one of the times below work for a quick call?\n\nBest regards",
+        "confirmed_slot_id": "",
+        "suggested_slot_ids": slot_ids[:3],
+        "slot_action": "suggested" if slot_ids else "none"
+    })
+    return {
+        "id": "chatcmpl-" + uuid.uuid4().hex[:12],
+        "object": "chat.completion",
+        "created": _now(),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_chars // 4 + len(content) // 4
+        }
+    }
+
+
+def _process_batch(batch_id: str):
+    time.sleep(PROCESS_DELAY_SECONDS)
+    with _lock:
+        batch = BATCHES[batch_id]
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = _now()
+        lines = FILES[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+
+    out = []
+    for line in lines:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        out.append(json.dumps({
+            "id": "batch_req_" + uuid.uuid4().hex[:12],
+            "custom_id": request.get("custom_id"),
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": _canned_completion(request)},
+            "error": None
+        }))
+
+    output_id = "file-" + uuid.uuid4().hex[:24]
+    with _lock:
+        FILES[output_id] = {
+            "content": ("\n".join(out) + "\n").encode("utf-8"),
+            "filename": "batch_output.jsonl",
+            "purpose": "batch_output",
+            "created_at": _now()
+        }
+        batch.update({
+            "status": "completed",
+            "output_file_id": output_id,
+            "completed_at": _now(),
+            "request_counts": {"total": len(out), "completed": len(out), "failed": 0}
+        })
+
+
+def _parse_multipart(body: bytes, content_type: str) -> dict:
+    """Minimal multipart/form-data parser: {field name: (filename, bytes)}."""
+    boundary = content_type.split("boundary=", 1)[1].strip().strip('"').encode()
+    fields = {}
+    for part in body.split(b"--" + boundary):
+        if b"\r\n\r\n" not in part:
+            continue
+        raw_headers, data = part.split(b"\r\n\r\n", 1)
+        headers = raw_headers.decode("utf-8", errors="ignore")
+        name = re.search(r'name="([^"]*)"', headers)
+        filename = re.search(r'filename="([^"]*)"', headers)
+        if name:
+            fields[name.group(1)] = (filename.group(1) if filename else None, data.rstrip(b"\r\n"))
+    return fields
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _send_json(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        if self.path == "/v1/files":
+            fields = _parse_multipart(self._body(), self.headers.get("Content-Type", ""))
+            filename, content = fields.get("file", ("upload.jsonl", b""))
+            purpose = (fields.get("purpose") or (None, b"batch"))[1].decode()
+            file_id = "file-" + uuid.uuid4().hex[:24]
+            with _lock:
+                FILES[file_id] = {"content": content, "filename": filename or "upload.jsonl",
+                                  "purpose": purpose, "created_at": _now()}
+                obj = _file_object(file_id)
+            return self._send_json(obj)
+
+        if self.path == "/v1/batches":
+            req = json.loads(self._body() or b"{}")
+            if req.get("input_file_id") not in FILES:
+                return self._send_json({"error": {"message": "input file not found"}}, 404)
+            batch_id = "batch_" + uuid.uuid4().hex[:24]
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": req.get("endpoint"),
+                "input_file_id": req["input_file_id"],
+                "completion_window": req.get("completion_window", "24h"),
+                "status": "validating",
+                "created_at": _now(),
+                "metadata": req.get("metadata"),
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}
+            }
+            with _lock:
+                BATCHES[batch_id] = batch
+            threading.Thread(target=_process_batch, args=(batch_id,), daemon=True).start()
+            return self._send_json(batch)
+
+        self._send_json({"error": {"message": "not found"}}, 404)
+
+    def do_GET(self):
+        m = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        if m and m.group(1) in BATCHES:
+            with _lock:
+                return self._send_json(dict(BATCHES[m.group(1)]))
+
+        m = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+        if m and m.group(1) in FILES:
+            data = FILES[m.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        m = re.fullmatch(r"/v1/files/([\w-]+)", self.path)
+        if m and m.group(1) in FILES:
+            with _lock:
+                return self._send_json(_file_object(m.group(1)))
+
+        self._send_json({"error": {"message": "not found"}}, 404)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI Batch API stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=PROCESS_DELAY_SECONDS, help="seconds before a batch completes")
+    args = parser.parse_args()
+    PROCESS_DELAY_SECONDS = args.delay
+    print(f"Batch stub listening on http://localhost:{args.port}/v1")
+    ThreadingHTTPServer(("0.0.0.0", args.port), Handler).serve_forever()
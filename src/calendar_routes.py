@@ -0,0 +1,60 @@
+# calendar_routes.py
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from src.Calender_Services.push_channel import (
+    InvalidNotification,
+    handle_notification,
+    channel_status,
+    register_channel,
+    stop_channel
+)
+from src.utils.tenants import current_tenant
+
+
+def default_tenant_only():
+    # the push channel watches the default tenant's calendar only
+    if not current_tenant().is_default:
+        raise HTTPException(status_code=404, detail="Calendar push is only available for the default tenant")
+
+
+router = APIRouter(dependencies=[Depends(default_tenant_only)])
+
+
+# -------- Google Calendar push webhook --------
+@router.post("/calendar/notifications")
+def calendar_notification_route(request: Request):
+    """
+    Receiver for Google Calendar watch-channel notifications. Answers right
+    away; the incremental sync and cache invalidation run in the background.
+    """
+    try:
+        return handle_notification(request.headers)
+    except InvalidNotification as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+# -------- Channel management --------
+@router.get("/calendar/channel")
+def calendar_channel_status_route():
+    return channel_status()
+
+
+@router.post("/calendar/channel")
+def calendar_channel_register_route():
+    """Open a new watch channel (replacing the current one)."""
+    try:
+        register_channel()
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Channel registration failed: {e}")
+    return channel_status()
+
+
+@router.delete("/calendar/channel")
+def calendar_channel_stop_route():
+    try:
+        stop_channel()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Channel stop failed: {e}")
+    return channel_status()
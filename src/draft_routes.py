@@ -1,30 +1,40 @@
 # draft_routes.py
 import os
-import json
 import traceback
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 # Calendar & Email imports
-from Calender_Services.services import (
-    get_readable_available_slots,
+from src.Calender_Services.services import (
+    get_top_available_slots,
+    format_readable_slot,
     get_prospect_upcoming_event_simple
 )
-from Email_Services.get_mails import get_last_mail_from_sender, get_last_sent_mail_to
+from src.Calender_Services.slot_ledger import pick_slots
+from src.utils.draft_store import save_draft, take_speculative_draft
+from src.utils.vector_index import retrieve_examples
+from src.utils.fast_path import stats as fast_path_stats
+from src.utils.hedging import stats as hedge_stats
+from src.utils.circuit_breaker import breaker_status
+from src.utils.admission import admit, get_admission, get_tenant_admission, Overloaded, INTERACTIVE, PRIORITY_NAMES
+from src.utils.tracing import span
+from src.utils.tenants import tenant_setting
+from src.utils.profiling import profiled
+from src.Email_Services.get_mails import get_last_mail_from_sender, get_last_sent_mail_to
+from src.Email_Services.conversation_summary import get_conversation_summary
 
 # Draft generator
-from generate_draft import generate_draft
+from src.generate_draft import generate_draft
 
 # Load env
 load_dotenv()
 
-cfg_path = os.path.join(os.path.dirname(__file__), "Calender_Services", "calender_config.yaml")
-print("Using config path:", cfg_path)
-
-
-# JSON file to persist draft
-DRAFT_JSON_FILE = os.path.join(os.path.dirname(__file__), "data", "draft.json")
+# How many free slots to fetch so consecutive drafts can be offered distinct ones
+SLOT_CANDIDATES = int(os.getenv("SLOT_CANDIDATES", "40"))
+SLOTS_PER_DRAFT = 5
+# Similar past sent emails to show the LLM as few-shot examples (0 disables)
+FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", "2"))
 
 router = APIRouter()
 
@@ -39,95 +49,185 @@ class Prospect(BaseModel):
 
 def save_draft_to_json(data: dict):
     """
-    Save the latest draft to JSON, replacing any previous entry.
+    Save the latest draft to the draft store, replacing any previous entry.
     """
-    folder = os.path.dirname(DRAFT_JSON_FILE)
-    os.makedirs(folder, exist_ok=True)
     try:
-        with open(DRAFT_JSON_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print("Draft saved to", DRAFT_JSON_FILE)
+        save_draft(data)
     except Exception as e:
         print("⚠️ Failed to save draft:", e)
 
 
-# -------- Draft Route --------
-@router.post("/generate-draft")
-def generate_draft_route(prospect: Prospect):
+# -------- Draft pipeline --------
+def gather_draft_inputs(prospect: Prospect) -> dict:
+    """
+    Collect everything the draft prompt needs (mail, calendar, slot holds,
+    company config). Returns generate_draft keyword arguments.
+    """
+    # -------- Fetch mails --------
     try:
-        # -------- Fetch mails --------
-        try:
-            current_mail = get_last_mail_from_sender(prospect.email) or ""
-        except Exception as e:
-            print("Warning: get_last_mail_from_sender failed:", e)
-            current_mail = ""
+        current_mail = get_last_mail_from_sender(prospect.email) or ""
+    except Exception as e:
+        print("Warning: get_last_mail_from_sender failed:", e)
+        current_mail = ""
 
-        try:
-            past_interaction = get_last_sent_mail_to(prospect.email) or ""
-        except Exception as e:
-            print("Warning: get_last_sent_mail_to failed:", e)
-            past_interaction = ""
+    try:
+        past_interaction = get_last_sent_mail_to(prospect.email) or ""
+    except Exception as e:
+        print("Warning: get_last_sent_mail_to failed:", e)
+        past_interaction = ""
 
-        # -------- Calendar --------
+    # -------- Rolling thread summary (only for known conversations) --------
+    conversation_summary = ""
+    if current_mail or past_interaction:
         try:
-            upcoming_events = get_prospect_upcoming_event_simple(prospect.email, cfg_path=cfg_path) or []
-            print("Upcoming events for", prospect.email, ":", upcoming_events)
+            conversation_summary = get_conversation_summary(prospect.email) or ""
         except Exception as e:
-            print("Warning: get_prospect_upcoming_event_simple failed:", e)
-            upcoming_events = []
+            print("Warning: get_conversation_summary failed:", e)
 
-        # Determine first confirmed slot
-        confirmed_slot = ""
-        for ev in upcoming_events:
-            if ev.get("confirmed"):
-                confirmed_slot = ev.get("start_readable", "")
-                break
+    # -------- Calendar --------
+    try:
+        upcoming_events = get_prospect_upcoming_event_simple(prospect.email) or []
+        print("Upcoming events for", prospect.email, ":", upcoming_events)
+    except Exception as e:
+        print("Warning: get_prospect_upcoming_event_simple failed:", e)
+        upcoming_events = []
 
+    # Determine first confirmed slot
+    confirmed_slot = ""
+    for ev in upcoming_events:
+        if ev.get("confirmed"):
+            confirmed_slot = ev.get("start_readable", "")
+            break
+
+    try:
+        candidates = get_top_available_slots(days=7, top_n=SLOT_CANDIDATES, offset_days=1) or []
+        # soft-hold distinct slots for this prospect so batch drafts don't collide
+        chosen = pick_slots(prospect.email, candidates, SLOTS_PER_DRAFT)
+        # structured slots (id, start/end ISO, timezone) travel with the draft
+        available_slots = [dict(s, readable=format_readable_slot(s)) for s in chosen]
+    except Exception as e:
+        print("Warning: get_top_available_slots failed:", e)
+        available_slots = []
+
+    # -------- Company config (the tenant's, see tenants.yaml) --------
+    company_config = {
+        "sender_company": tenant_setting("SENDER_COMPANY", "Talita Alves Clinic"),
+        "signature": tenant_setting("EMAIL_SIGNATURE", "Best regards,\nTalita Alves Clinic Team"),
+        "cta": tenant_setting("EMAIL_CTA", "📅 Book Your Evaluation Today"),
+        "services": ["Aesthetic Treatments", "Skin Care", "Wellness"],
+        "usp": ["Personalized care", "Expert doctors", "Advanced technology"]
+    }
+
+    # -------- Few-shot examples from our own sent history --------
+    examples = []
+    if FEW_SHOT_EXAMPLES:
+        query = current_mail or past_interaction or f"{prospect.role} {prospect.industry}".strip()
         try:
-            available_slots = get_readable_available_slots(cfg_path=cfg_path, days=7, top_n=5, offset_days=1) or []
+            examples = retrieve_examples(query, k=FEW_SHOT_EXAMPLES, exclude_email=prospect.email)
         except Exception as e:
-            print("Warning: get_readable_available_slots failed:", e)
-            available_slots = []
-
-        # -------- Company config --------
-        company_config = {
-            "sender_company": os.getenv("SENDER_COMPANY", "Talita Alves Clinic"),
-            "signature": os.getenv("EMAIL_SIGNATURE", "Best regards,\nTalita Alves Clinic Team"),
-            "cta": os.getenv("EMAIL_CTA", "📅 Book Your Evaluation Today"),
-            "services": ["Aesthetic Treatments", "Skin Care", "Wellness"],
-            "usp": ["Personalized care", "Expert doctors", "Advanced technology"]
-        }
+            print("Warning: retrieve_examples failed:", e)
+
+    return dict(
+        prospect=prospect.dict(),
+        past_interaction=past_interaction,
+        current_mail=current_mail,
+        available_slots=available_slots,
+        upcoming_events=upcoming_events,  # ✅ pass list of events
+        company_config=company_config,
+        examples=examples,
+        conversation_summary=conversation_summary
+    )
+
+
+def make_draft_record(inputs: dict, draft: dict) -> dict:
+    """Draft record as kept in the draft store and archived to history."""
+    return {
+        "prospect": inputs["prospect"],
+        "draft": draft,
+        "upcoming_events": inputs["upcoming_events"],
+        "available_slots": inputs["available_slots"],
+        "current_mail": inputs["current_mail"],
+        "past_interaction": inputs["past_interaction"]
+    }
+
+
+def build_draft_record(prospect: Prospect, priority: int = INTERACTIVE, fresh: bool = False) -> dict:
+    """
+    Run the full pipeline (mail, calendar, slot holds, LLM) for a prospect
+    and return the draft record that the draft store keeps. Runs once
+    admitted at `priority`; raises Overloaded when shed. fresh skips the
+    cached LLM draft (explicit regenerate).
+    """
+    with span("draft.pipeline", priority=PRIORITY_NAMES[priority]), admit(priority):
+        with span("draft.gather_inputs"):
+            inputs = gather_draft_inputs(prospect)
 
         # -------- Generate draft --------
-        draft = generate_draft(
-            prospect=prospect.dict(),
-            past_interaction=past_interaction,
-            current_mail=current_mail,
-            available_slots=available_slots,
-            upcoming_events=upcoming_events,  # ✅ pass list of events
-            company_config=company_config
-        )
-
-        # -------- Persist draft in JSON (replace old entry) --------
-        save_draft_to_json({
-            "prospect": prospect.dict(),
-            "draft": draft,
-            "upcoming_events": upcoming_events,
-            "available_slots": available_slots,
-            "current_mail": current_mail,
-            "past_interaction": past_interaction
-        })
+        with span("draft.generate"):
+            draft = generate_draft(**inputs, fresh=fresh)
+    return make_draft_record(inputs, draft)
+
+
+# -------- Draft Route --------
+@router.post("/generate-draft")
+@profiled("generate_draft")
+def generate_draft_route(prospect: Prospect, fresh: bool = False):
+    """fresh=true regenerates: no speculative or cached draft, always a new LLM answer."""
+    try:
+        # A draft pre-generated by the inbox watcher is used as-is
+        record = None if fresh else take_speculative_draft(prospect.email, prospect.dict())
+        if record:
+            print("Using speculative draft for", prospect.email)
+        else:
+            record = build_draft_record(prospect, fresh=fresh)
+
+        # -------- Persist draft (replace old entry) --------
+        save_draft_to_json(record)
 
         # -------- Return response --------
         return {
             "status": "success",
-            "draft": draft,
-            "upcoming_events": upcoming_events,
-            "available_slots": available_slots,
-            "current_mail": current_mail,
-            "past_interaction": past_interaction
+            "draft": record["draft"],
+            "upcoming_events": record["upcoming_events"],
+            "available_slots": record["available_slots"],
+            "current_mail": record["current_mail"],
+            "past_interaction": record["past_interaction"]
         }
 
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# -------- Fast path stats --------
+@router.get("/fast-path-stats")
+def fast_path_stats_route():
+    """How many drafts/feedback edits were answered by templates vs. the LLM (this process)."""
+    return fast_path_stats.snapshot()
+
+
+@router.get("/llm-hedge-stats")
+def llm_hedge_stats_route():
+    """Draft completion latency percentiles, hedges sent and how often the hedge won (this process)."""
+    return hedge_stats.snapshot()
+
+
+# -------- Dependency status --------
+@router.get("/status")
+def status_route():
+    """Circuit breaker state per dependency (imap, calendar, smtp, openai) in this process."""
+    breakers = breaker_status()
+    degraded = [name for name, b in breakers.items() if b["state"] != "closed"]
+    return {"status": "degraded" if degraded else "ok", "degraded": degraded, "breakers": breakers}
+
+
+@router.get("/admission-stats")
+def admission_stats_route():
+    """
+    In-flight draft pipelines, queue depth and queue wait / shedding per
+    priority (this process), plus the tenant's own quota when it has one.
+    """
+    quota = get_tenant_admission()
+    return dict(get_admission().snapshot(), tenant_quota=quota.snapshot() if quota is not None else None)
@@ -0,0 +1,276 @@
+# followup_scheduler.py
+"""
+Background follow-ups driven by history.
+
+Each scan only reads history records appended since the last watermark (a
+byte offset into history.json) and folds them into per-prospect state (last
+sent time). Prospects whose last
+sent mail is older than FOLLOWUP_AFTER_DAYS, with no reply since, get a
+follow-up draft generated in rate-limited batches during off-peak hours.
+Drafts land in the draft store as speculative drafts; with
+FOLLOWUP_MODE=batch they are submitted to the Batch API and collected by a
+later scan once the batch finishes. Each scan covers
+every tenant in turn, with the tenant's own history, state and mailbox.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+from src.utils.helpers import load_json, save_json
+from src.utils.history_store import iter_history_from
+from src.utils.draft_store import save_speculative_draft
+from src.Email_Services.get_mails import has_reply_since
+from src.utils.tenants import data_path, tenant_ids, use_tenant
+
+load_dotenv()
+
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "followup_state.json")
+
+FOLLOWUP_AFTER_DAYS = float(os.getenv("FOLLOWUP_AFTER_DAYS", "3"))
+FOLLOWUP_OFFPEAK_HOURS = os.getenv("FOLLOWUP_OFFPEAK_HOURS", "20-7")  # local hours, may wrap midnight
+FOLLOWUP_BATCH_SIZE = int(os.getenv("FOLLOWUP_BATCH_SIZE", "20"))
+FOLLOWUP_BATCH_INTERVAL = float(os.getenv("FOLLOWUP_BATCH_INTERVAL", "60"))
+FOLLOWUP_SCAN_SECONDS = float(os.getenv("FOLLOWUP_SCAN_SECONDS", "900"))
+FOLLOWUP_MODE = os.getenv("FOLLOWUP_MODE", "sync").lower()  # "sync" or "batch" (OpenAI Batch API)
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------- State -------------------
+def _empty_state() -> dict:
+    # offset: byte offset of the last examined history record
+    return {"watermark": {"count": 0, "offset": 0, "last_sent_at": None}, "prospects": {}, "batch_runs": []}
+
+
+def load_state() -> dict:
+    state = load_json(data_path(STATE_FILE), {})
+    if not isinstance(state, dict) or "watermark" not in state:
+        return _empty_state()
+    if "offset" not in state["watermark"]:
+        # state from before byte offsets: refold history, keeping prospects
+        state["watermark"] = _empty_state()["watermark"]
+    state.setdefault("batch_runs", [])
+    return state
+
+
+def in_offpeak(now: Optional[datetime] = None) -> bool:
+    start, end = (int(h) for h in FOLLOWUP_OFFPEAK_HOURS.split("-"))
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start < end else (hour >= start or hour < end)
+
+
+# ------------------- Incremental scan -------------------
+def _records_after(mark: dict):
+    """
+    History records after the watermark as (start offset, record), or None
+    when the record at the watermark is no longer the one we saw last
+    (history was rewritten underneath us).
+    """
+    records = iter_history_from(mark["offset"])
+    if not mark["count"]:
+        return ((start, rec) for start, _, rec in records)
+    try:
+        first = next(records, None)
+    except ValueError:
+        return None
+    if first is None or not isinstance(first[2], dict) or first[2].get("sent_at") != mark["last_sent_at"]:
+        return None
+    return ((start, rec) for start, _, rec in records)
+
+
+def scan_history(state: dict) -> int:
+    """
+    Fold history records past the watermark into state, streaming from its
+    byte offset. Returns how many records were examined. If history was
+    rewritten underneath us (the record at the watermark no longer matches),
+    state is rebuilt from scratch.
+    """
+    records = _records_after(state["watermark"])
+    if records is None:
+        logger.info("History changed below the watermark, rescanning")
+        batch_runs = state.get("batch_runs", [])
+        state.clear()
+        state.update(_empty_state(), batch_runs=batch_runs)
+        records = _records_after(state["watermark"])
+
+    mark = state["watermark"]
+    prospects = state["prospects"]
+    examined = 0
+    for start, rec in records:
+        examined += 1
+        mark.update(count=mark["count"] + 1, offset=start, last_sent_at=rec.get("sent_at"))
+        prospect = rec.get("prospect") or {}
+        email = (prospect.get("email") or "").lower()
+        sent_at = rec.get("sent_at")
+        if not email or not sent_at:
+            continue
+        entry = prospects.setdefault(email, {"prospect": prospect, "last_sent_at": None, "followup_for": None})
+        if not entry["last_sent_at"] or sent_at > entry["last_sent_at"]:
+            entry["last_sent_at"] = sent_at
+            entry["prospect"] = prospect
+    return examined
+
+
+def find_due(state: dict, now: Optional[datetime] = None) -> list[dict]:
+    """
+    Prospects whose last sent mail is older than FOLLOWUP_AFTER_DAYS, not yet
+    followed up for that mail, and who have not replied since.
+    """
+    cutoff = (now or datetime.now()) - timedelta(days=FOLLOWUP_AFTER_DAYS)
+    due = []
+    for email, entry in state["prospects"].items():
+        last_sent = datetime.fromisoformat(entry["last_sent_at"])
+        if last_sent > cutoff or entry.get("followup_for") == entry["last_sent_at"]:
+            continue
+        replied = has_reply_since(email, last_sent)
+        if replied is None:
+            continue  # IMAP unavailable; try again next scan
+        if replied:
+            # their reply will be handled as a normal draft; don't nag
+            entry["followup_for"] = entry["last_sent_at"]
+            continue
+        due.append(entry)
+    return due
+
+
+# ------------------- Enqueue -------------------
+def enqueue_followups(due: list[dict], generate: Callable[[dict], dict], state: dict,
+                      stop: Optional[threading.Event] = None) -> int:
+    """
+    Generate follow-ups FOLLOWUP_BATCH_SIZE at a time, pausing between
+    batches. Returns how many were generated (or submitted); failed ones stay
+    due and are retried on a later scan.
+    """
+    done = 0
+    for i in range(0, len(due), FOLLOWUP_BATCH_SIZE):
+        if (stop is not None and stop.is_set()) or not in_offpeak():
+            break
+        chunk = due[i:i + FOLLOWUP_BATCH_SIZE]
+        if FOLLOWUP_MODE == "batch":
+            from batch_drafts import submit_batch  # needs the same sys.path setup as main.py
+            try:
+                run_dir = submit_batch([entry["prospect"] for entry in chunk])
+            except Exception:
+                logger.exception("Follow-up batch submit failed")
+                break
+            # request i of the run is chunk[i] (custom_id "draft-<i>")
+            state["batch_runs"].append({
+                "run_dir": run_dir,
+                "prospects": [[entry["prospect"]["email"].lower(), entry["last_sent_at"]] for entry in chunk]
+            })
+            succeeded = chunk
+        else:
+            succeeded = []
+            for entry in chunk:
+                try:
+                    save_speculative_draft(entry["prospect"]["email"], generate(entry["prospect"]))
+                except Exception:
+                    logger.exception("Follow-up draft failed for %s", entry["prospect"].get("email"))
+                    continue
+                succeeded.append(entry)
+        for entry in succeeded:
+            entry["followup_for"] = entry["last_sent_at"]
+        done += len(succeeded)
+        save_json(data_path(STATE_FILE), state)
+        if i + FOLLOWUP_BATCH_SIZE < len(due):
+            if stop is not None:
+                stop.wait(FOLLOWUP_BATCH_INTERVAL)
+            else:
+                time.sleep(FOLLOWUP_BATCH_INTERVAL)
+    return done
+
+
+def collect_batch_runs(state: dict) -> int:
+    """
+    Ingest follow-up batch runs that have finished since the last scan; their
+    drafts go to the draft store. Prospects whose request failed become due
+    again. Returns how many runs were collected.
+    """
+    from batch_drafts import collect_batch  # needs the same sys.path setup as main.py
+    pending, collected = [], 0
+    for run in state["batch_runs"]:
+        try:
+            summary = collect_batch(run["run_dir"], wait=False)
+        except FileNotFoundError:
+            logger.warning("Follow-up batch run %s is gone, dropping it", run["run_dir"])
+            continue
+        except Exception:
+            logger.exception("Collecting follow-up batch run %s failed", run["run_dir"])
+            pending.append(run)
+            continue
+        if summary is None:
+            pending.append(run)  # still running
+            continue
+        collected += 1
+        failed = {err["custom_id"] for err in summary["errors"]}
+        for i, (email, last_sent_at) in enumerate(run["prospects"]):
+            entry = state["prospects"].get(email)
+            if f"draft-{i}" in failed and entry and entry.get("followup_for") == last_sent_at:
+                entry["followup_for"] = None
+    state["batch_runs"] = pending
+    return collected
+
+
+def run_once(generate: Callable[[dict], dict], stop: Optional[threading.Event] = None) -> dict:
+    state = load_state()
+    scanned = scan_history(state)
+    collected = collect_batch_runs(state) if state["batch_runs"] else 0
+    save_json(data_path(STATE_FILE), state)
+    result = {"scanned": scanned, "collected": collected, "due": 0, "enqueued": 0}
+    if in_offpeak():
+        due = find_due(state)
+        save_json(data_path(STATE_FILE), state)
+        result["due"] = len(due)
+        result["enqueued"] = enqueue_followups(due, generate, state, stop=stop)
+    logger.info("Follow-up scan: %s", result)
+    return result
+
+
+# ------------------- Scheduler thread -------------------
+class FollowupScheduler:
+    def __init__(self, generate: Callable[[dict], dict]):
+        self.generate = generate
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="followup-scheduler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info("Follow-up scheduler started (off-peak %s)", FOLLOWUP_OFFPEAK_HOURS)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for tenant_id in tenant_ids():
+                if self._stop.is_set():
+                    break
+                try:
+                    with use_tenant(tenant_id):
+                        run_once(self.generate, stop=self._stop)
+                except Exception:
+                    logger.exception("Follow-up scan failed for tenant %s", tenant_id)
+            self._stop.wait(FOLLOWUP_SCAN_SECONDS)
+
+
+_scheduler: Optional[FollowupScheduler] = None
+
+
+def start_scheduler(generate: Callable[[dict], dict]) -> FollowupScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FollowupScheduler(generate)
+        _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
@@ -1,28 +1,92 @@
 # generate_draft.py
-from openai import OpenAI
 import os, json, re
 from dotenv import load_dotenv
 
+from src.utils.hedging import hedged_chat_completion
+from src.utils.clients import tenant_openai_client
+from src.utils.single_flight import single_flight
+from src.utils.cache_backend import cached
+from src.utils.fast_path import existing_meeting_draft, stats as fast_path_stats
+
 load_dotenv()
 
-# support either env var name
-_api_key = os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY2")
-client = OpenAI(api_key=_api_key)
 MODEL = "gpt-4o-mini"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "300"))
 
 
-def generate_draft(prospect, past_interaction, current_mail, available_slots, upcoming_events, company_config):
+DRAFT_SYSTEM_PROMPT = """
+You are a professional B2B sales email writer.
+Follow User instructions exactly.
+IF you found suggested lots in past interaction or current mail, and they are not matched with  {available_slots} then use available slots dont prefer old ones.
+Available slots are given as "[slot id] readable time"; write the readable time in the body and refer to slots by id in the fields below.
+Strictly return ONLY one JSON object with fields:
+- subject (string)
+- body (string)
+- confirmed_slot_id (string)  ## id of the confirmed available slot, otherwise ""
+- suggested_slot_ids (list of strings) ## ids of up to 3 suggested slots
+- slot_action (string) ## one of "existing", "none", "suggested", "confirmed"
+"""
+DRAFT_TEMPERATURE = 0.3
+DRAFT_MAX_TOKENS = 600
+
+
+def draft_messages(prompt):
+    return [
+        {"role": "system", "content": prompt["system_prompt"]},
+        {"role": "user", "content": prompt["user_prompt"]}
+    ]
+
+
+def _draft_completion(system_prompt, user_prompt):
+    """Raw completion text for a draft prompt."""
+    response = hedged_chat_completion(
+        tenant_openai_client(),
+        model=MODEL,
+        temperature=DRAFT_TEMPERATURE,
+        messages=draft_messages({"system_prompt": system_prompt, "user_prompt": user_prompt}),
+        max_tokens=DRAFT_MAX_TOKENS
+    )
+
+    # robust extraction of text from different response shapes
+    choice = response.choices[0]
+    text = ""
+    # try attribute .message.content
+    try:
+        text = choice.message.content.strip()
+    except Exception:
+        try:
+            text = choice['message']['content'].strip()
+        except Exception:
+            # fallback to string representation
+            text = str(choice)
+    return text
+
+
+@cached("llm:generate_draft", LLM_CACHE_TTL)
+def _parsed_draft(prompt):
+    """Parsed draft for a prompt (cached by prompt); unusable output raises and is never cached."""
+    return parse_draft_output(_draft_completion(prompt["system_prompt"], prompt["user_prompt"]), prompt)
+
+
+def build_draft_prompt(prospect, past_interaction, current_mail, available_slots, upcoming_events, company_config,
+                       examples=None, conversation_summary=""):
     """
-    Generate a sales email draft based on prospect interaction state.
+    Build the LLM prompt for a draft based on prospect interaction state.
+    available_slots -> list of slot dicts: [{'id': ..., 'start_iso': ..., 'end_iso': ..., 'timezone': ..., 'readable': ...}]
     upcoming_events -> list of dicts: [{'start_readable': ..., 'confirmed': True/False}]
+    examples -> optional few-shot past emails: [{'subject': ..., 'body': ...}]
+    conversation_summary -> optional rolling summary of the whole thread
+    Returns the prompts plus the context parse_draft_output needs.
     """
     person_email = prospect.get("email", "")
     person_name = prospect.get("name", "")
     person_role = prospect.get("role", "")
     person_industry = prospect.get("industry", "")
 
+    offered_slots = (available_slots or [])[:3]
+
     # Prepare slots text for LLM
-    slots_text = "\n".join([f"- {s}" for s in (available_slots or [])[:3]]) or "No available slots."
+    slots_text = "\n".join([f"- [{s['id']}] {s['readable']}" for s in offered_slots]) or "No available slots."
 
     company_text = f"""
 Company: {company_config.get("sender_company", "")}
@@ -48,8 +112,8 @@ Note: Prospect already has a scheduled meeting at {existing_slot}.
 
 Task:
 - Reply politely informing them that the meeting is already scheduled.
-- confirmed_slot should contain the scheduled slot info (string).
-- suggested_slots should be an empty list.
+- confirmed_slot_id should be "" (the meeting is not one of the available slots).
+- suggested_slot_ids should be an empty list.
 - slot_action should be "existing".
 """
         slot_status = "existing"
@@ -68,7 +132,7 @@ and how it can help in {person_industry}. Keep it short, personalized, professio
         user_prompt = f"""
 Write a polite follow-up email based on Past Interaction:\n{past_interaction}\n
 Suggest these available slots:\n{slots_text}
-Always include suggested_slots as a list of strings.
+Always include suggested_slot_ids as a list of slot ids.
 """
         slot_status = "suggested"
 
@@ -79,88 +143,132 @@ Prospect reply:\n{current_mail}\n
 Available slots:\n{slots_text}\n
 Task:
 - If prospect asks for available time, suggest available slots. and confirm 
-- If they confirm a time or are flexible, include confirmation and set confirmed_slot based on available slots only.
+- If they confirm a time or are flexible, include confirmation and set confirmed_slot_id to the id of one of the available slots only.
 - Otherwise, reply naturally.
 """
         slot_status = "confirmed"
 
-    # ----------------- LLM CALL -----------------
-    system_prompt = """
-You are a professional B2B sales email writer.
-Follow User instructions exactly.
-IF you found suggested lots in past interaction or current mail, and they are not matched with  {available_slots} then use available slots dont prefer old ones.
-Strictly return ONLY one JSON object with fields:
-- subject (string)
-- body (string)
-- confirmed_slot (string)  ## if slot is confirmed include it here, otherwise ""
-- suggested_slots (list of strings) ## up to 3 suggested slots
-- slot_action (string) ## one of "existing", "none", "suggested", "confirmed"
+    # ----------------- Thread context -----------------
+    if conversation_summary:
+        user_prompt += f"""
+Summary of the conversation so far (for context; the latest messages above take precedence):
+{conversation_summary}
 """
 
-    # Call LLM
-    try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            temperature=0.3,
-            messages=[
-                {"role": "system", "content": system_prompt.strip()},
-                {"role": "user", "content": user_prompt.strip()}
-            ],
-            max_tokens=600
+    # ----------------- Few-shot examples -----------------
+    if examples:
+        examples_text = "\n\n".join(
+            f"Example {i}:\nSubject: {ex.get('subject', '')}\nBody: {ex.get('body', '')}"
+            for i, ex in enumerate(examples, 1)
         )
+        user_prompt += f"""
+Past emails of ours that worked well in similar situations (match their tone and structure, do not copy details):
+{examples_text}
+"""
 
-        # robust extraction of text from different response shapes
-        choice = response.choices[0]
-        text = ""
-        # try attribute .message.content
-        try:
-            text = choice.message.content.strip()
-        except Exception:
+    return {
+        "email": person_email,
+        "system_prompt": DRAFT_SYSTEM_PROMPT.strip(),
+        "user_prompt": user_prompt.strip(),
+        "slot_status": slot_status,
+        "existing_slot": existing_slot,
+        "offered_slots": offered_slots
+    }
+
+
+def parse_draft_output(text, prompt):
+    """Turn raw LLM text into a draft dict; raises ValueError on unusable output."""
+    slot_status = prompt["slot_status"]
+    existing_slot = prompt["existing_slot"]
+
+    # Slot lookup tables: the LLM answers with ids, readable text is only a fallback
+    slots_by_id = {s["id"]: s for s in prompt["offered_slots"]}
+    slots_by_readable = {s["readable"]: s for s in prompt["offered_slots"]}
+
+    parsed = None
+    try:
+        parsed = json.loads(text)
+    except Exception:
+        # fallback: extract first {...} block (non-greedy, DOTALL)
+        m = re.search(r"(\{(?:.|\n)*?\})", text, flags=re.S)
+        if m:
             try:
-                text = choice['message']['content'].strip()
+                parsed = json.loads(m.group(1))
             except Exception:
-                # fallback to string representation
-                text = str(choice)
+                parsed = None
 
-        parsed = None
-        try:
-            parsed = json.loads(text)
-        except Exception:
-            # fallback: extract first {...} block (non-greedy, DOTALL)
-            m = re.search(r"(\{(?:.|\n)*?\})", text, flags=re.S)
-            if m:
-                try:
-                    parsed = json.loads(m.group(1))
-                except Exception:
-                    parsed = None
-
-        if not isinstance(parsed, dict):
-            raise ValueError(f"Invalid LLM response (not a JSON object). Raw: {text[:400]}")
-
-        # ensure defaults / types
-        subject = parsed.get("subject", "") or ""
-        body = parsed.get("body", "") or ""
-        confirmed_slot = parsed.get("confirmed_slot", "") or existing_slot or ""
-        suggested_slots = parsed.get("suggested_slots", []) or []
-        slot_action = parsed.get("slot_action", slot_status) or slot_status
-
-        return {
-            "email": person_email,
-            "subject": subject,
-            "body": body,
-            "slot_status": slot_action,
-            "slots": suggested_slots[:3],
-            "final_slot": confirmed_slot
-        }
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Invalid LLM response (not a JSON object). Raw: {text[:400]}")
+
+    # ensure defaults / types
+    subject = parsed.get("subject", "") or ""
+    body = parsed.get("body", "") or ""
+    slot_action = parsed.get("slot_action", slot_status) or slot_status
+
+    # resolve slots by id (or exact readable echo); unknown values are dropped
+    def _resolve(value):
+        value = str(value or "").strip()
+        return slots_by_id.get(value) or slots_by_readable.get(value)
+
+    confirmed = _resolve(parsed.get("confirmed_slot_id") or parsed.get("confirmed_slot"))
+    suggested = [s for s in map(_resolve, parsed.get("suggested_slot_ids") or parsed.get("suggested_slots") or []) if s]
+
+    return {
+        "email": prompt["email"],
+        "subject": subject,
+        "body": body,
+        "slot_status": slot_action,
+        "slots": [s["readable"] for s in suggested[:3]],
+        "slot_ids": [s["id"] for s in suggested[:3]],
+        "final_slot": confirmed["readable"] if confirmed else existing_slot,
+        "final_slot_id": confirmed["id"] if confirmed else ""
+    }
+
+
+def fallback_draft(prompt):
+    """Consistent empty draft used when generation fails."""
+    slot_status = prompt["slot_status"]
+    fallback_slots = prompt["offered_slots"] if slot_status == "suggested" else []
+    return {
+        "email": prompt["email"],
+        "subject": "",
+        "body": "",
+        "slot_status": slot_status,
+        "slots": [s["readable"] for s in fallback_slots],
+        "slot_ids": [s["id"] for s in fallback_slots],
+        "final_slot": prompt["existing_slot"],
+        "final_slot_id": ""
+    }
+
+
+@single_flight("generate_draft")
+def generate_draft(prospect, past_interaction, current_mail, available_slots, upcoming_events, company_config,
+                   examples=None, conversation_summary="", fresh=False):
+    """
+    Generate a sales email draft based on prospect interaction state.
+    available_slots -> list of slot dicts: [{'id': ..., 'start_iso': ..., 'end_iso': ..., 'timezone': ..., 'readable': ...}]
+    upcoming_events -> list of dicts: [{'start_readable': ..., 'confirmed': True/False}]
+    examples -> optional few-shot past emails: [{'subject': ..., 'body': ...}]
+    conversation_summary -> optional rolling summary of the whole thread
+    fresh -> always ask the LLM (explicit regenerate), bypassing the LLM_CACHE_TTL draft cache
+    """
+    prompt = build_draft_prompt(prospect, past_interaction, current_mail, available_slots, upcoming_events,
+                                company_config, examples=examples, conversation_summary=conversation_summary)
+
+    # Booked meeting and nothing else asked: answer from the template
+    if prompt["slot_status"] == "existing":
+        templated = existing_meeting_draft(prospect, prompt["existing_slot"], current_mail, company_config)
+        fast_path_stats.record("existing_meeting", templated is not None)
+        if templated:
+            return dict(fallback_draft(prompt), **templated)
+
+    # Call LLM
+    try:
+        if fresh:
+            return parse_draft_output(_draft_completion(prompt["system_prompt"], prompt["user_prompt"]), prompt)
+        return _parsed_draft(prompt)
 
     except Exception as e:
         print("⚠️ Draft generation failed:", e)
         # Return consistent dict (no tuple)
-        return {
-            "email": person_email,
-            "subject": "",
-            "body": "",
-            "slot_status": slot_status,
-            "slots": (available_slots or [])[:3] if slot_status == "suggested" else [],
-            "final_slot": existing_slot
-        }
+        return fallback_draft(prompt)
@@ -1,17 +1,41 @@
 # src/routes.py
 import os
-import smtplib
+import tempfile
 import traceback
 from email.message import EmailMessage
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
-import pytz  # ✅ Added for timezone handling
 
-from src.utils.helpers import load_json, save_json
+from src.utils.history_store import HISTORY_FILE, history_page, append_history
+from src.utils.stats_store import STATS_FILE, update_stats, rebuild_stats, get_stats
+from src.utils import history_export
+from src.utils.http_cache import FastJSONResponse, file_validators, not_modified, not_modified_response
+from src.utils.vector_index import index_records_async
+from src.utils.draft_store import load_draft, clear_draft
+from src.utils.cache_backend import invalidate, invalidate_namespace
+from src.utils.circuit_breaker import get_breaker, CircuitOpenError
+from src.utils.clients import smtp_connect, smtp_settings
+from src.utils.tenants import data_path
+from src.utils.admission import admit, Overloaded
+from src.utils.profiling import profiled
+from src.utils.tracing import span
+from src.Email_Services.get_mails import get_last_sent_mail_to
+from src.Email_Services.conversation_summary import get_conversation_summary
 from src.update_approve import apply_feedback
-from src.Calender_Services.services import load_calendar_config, is_slot_free, create_event
+from src.Calender_Services.services import (
+    load_calendar_config,
+    is_slot_free,
+    create_event,
+    create_events_batch,
+    freebusy_query,
+    get_service_account_service,
+    index_slots
+)
+from src.Calender_Services import slot_ledger
 
 
 router = APIRouter()
@@ -19,34 +43,21 @@ router = APIRouter()
 # env
 load_dotenv()
 
-DRAFT_FILE = os.path.join(os.path.dirname(__file__), "data", "draft.json")
-HISTORY_FILE = os.path.join(os.path.dirname(__file__), "data", "history.json")
-print("Draft file path:", DRAFT_FILE)
-
-SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER") or os.getenv("FROM_EMAIL")
-SMTP_PASS = (os.getenv("SMTP_PASS") or "").replace(" ", "")
-SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
-FROM_EMAIL = os.getenv("FROM_EMAIL") or SMTP_USER
-
 
 # ------------------- Email Sender -------------------
 def send_email(to_email: str, subject: str, body: str):
-    if not (SMTP_HOST and SMTP_PORT and SMTP_USER and SMTP_PASS and FROM_EMAIL):
+    # the current tenant's mailbox (SMTP_* / FROM_EMAIL)
+    smtp = smtp_settings()
+    if not (smtp["host"] and smtp["port"] and smtp["user"] and smtp["password"] and smtp["from_email"]):
         raise RuntimeError("SMTP configuration missing.")
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = FROM_EMAIL
+    msg["From"] = smtp["from_email"]
     msg["To"] = to_email
     msg.set_content(body)
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as server:
-        server.ehlo()
-        if SMTP_USE_TLS:
-            server.starttls()
-            server.ehlo()
-        server.login(SMTP_USER, SMTP_PASS)
+    with span("smtp.send"), get_breaker("smtp"), \
+            smtp_connect(smtp["host"], smtp["port"], smtp["user"], smtp["password"], smtp["use_tls"]) as server:
         server.send_message(msg)
 
 
@@ -56,35 +67,150 @@ class ActionRequest(BaseModel):
     feedback: str | None = None
 
 
+class BatchApproveRequest(BaseModel):
+    drafts: list[dict]  # draft records, same shape as draft.json
+
+
+# ------------------- Helper: Resolve the confirmed slot -------------------
+def resolve_final_slot(data: dict) -> dict | None:
+    """
+    Look up the draft's confirmed slot in the structured slots stored with it,
+    by final_slot_id (or an exact readable match for drafts without ids).
+    Returns the slot dict (id, start_iso, end_iso, timezone) or None.
+    """
+    draft = data.get("draft") or {}
+    slots_by_id = index_slots(data.get("available_slots"))
+    slot = slots_by_id.get(draft.get("final_slot_id") or "")
+    if slot is None and draft.get("final_slot"):
+        slots_by_readable = {s.get("readable"): s for s in slots_by_id.values()}
+        slot = slots_by_readable.get(draft["final_slot"])
+    return slot
+
+
+def _event_info(ev: dict) -> dict:
+    return {
+        "id": ev.get("id"),
+        "htmlLink": ev.get("htmlLink"),
+        "start": ev.get("start", {}).get("dateTime") or ev.get("start", {}).get("date"),
+        "end": ev.get("end", {}).get("dateTime") or ev.get("end", {}).get("date")
+    }
+
+
 # ------------------- Helper: Save to history -------------------
 def save_to_history(full_data: dict):
-    history = load_json(HISTORY_FILE, [])
-    if isinstance(history, dict):
-        history = [history]
+    save_many_to_history([full_data])
+
 
-    full_data["sent_at"] = datetime.now().isoformat()
-    history.append(full_data)
-    save_json(HISTORY_FILE, history)
+def save_many_to_history(records: list[dict]):
+    append_history(records)
+    # keep /api/stats current without rescanning history
+    try:
+        update_stats(records)
+    except Exception as e:
+        print("Warning: update_stats failed (run stats rebuild):", e)
+    # make the new emails available as few-shot examples
+    index_records_async(records)
 
 
 # GET /api/history
 @router.get("/history")
-def get_history():
+@profiled("history")
+def get_history(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    newest_first: bool = False
+):
+    """Whole history, or one page of it with limit/offset (total is always returned)."""
+    # history only changes on append: revalidate by file size/mtime
+    etag, last_modified = file_validators(data_path(HISTORY_FILE))
+    etag = f'{etag[:-1]}-{offset}-{limit or 0}-{int(newest_first)}"'  # per-page validator
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
     try:
-        history = load_json(HISTORY_FILE, [])
-        if isinstance(history, dict):
-            history = [history]
-        return {"history": history}
+        total, records = history_page(offset, limit, newest_first)
+        return FastJSONResponse(
+            {"history": records, "total": total, "offset": offset, "limit": limit},
+            headers={"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+        )
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to load history: {e}")
 
 
+# GET /api/history/export
+EXPORT_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "arrow": "application/vnd.apache.arrow.stream",
+                      "parquet": "application/vnd.apache.parquet"}
+
+
+@router.get("/history/export")
+def export_history(
+    format: str = Query("csv", pattern="^(csv|arrow|parquet)$"),
+    columns: str | None = None,
+    since: str | None = None
+):
+    """
+    History flattened to columns, streamed in bounded chunks. `columns` is a
+    comma-separated subset; `since` (ISO) exports only records sent after it:
+    pass the largest sent_at of the previous export to continue from there.
+    """
+    try:
+        cols = history_export.resolve_columns(columns.split(",") if columns else None)
+        since_dt = history_export.parse_since(since)
+        if format != "csv":
+            history_export.arrow_schema(cols)  # fails fast without pyarrow
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    filename = f"history-{datetime.now().strftime('%Y%m%dT%H%M%S')}.{format}"
+    if format == "parquet":
+        # the Parquet footer is written last, so spool to a temp file first
+        fd, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        try:
+            history_export.write_parquet(path, cols, since_dt)
+        except Exception:
+            os.remove(path)
+            raise
+        return FileResponse(path, media_type=EXPORT_MEDIA_TYPES[format], filename=filename,
+                            background=BackgroundTask(os.remove, path))
+    chunks = history_export.iter_csv if format == "csv" else history_export.iter_arrow
+    return StreamingResponse(chunks(cols, since_dt), media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# GET /api/stats
+@router.get("/stats")
+def get_stats_route(request: Request, days: int | None = Query(None, ge=1, le=3660)):
+    """Outreach aggregates (sent per day, slot statuses, industries, time-to-confirm), precomputed on send."""
+    etag, last_modified = file_validators(data_path(STATS_FILE))
+    etag = f'{etag[:-1]}-{days or 0}"'  # per-window validator
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    try:
+        stats = get_stats(days)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to load stats: {e}")
+    return FastJSONResponse(stats, headers={"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"})
+
+
+# POST /api/stats/rebuild
+@router.post("/stats/rebuild")
+def rebuild_stats_route():
+    """Recompute the aggregates from the full history."""
+    rebuild_stats()
+    return get_stats()
+
+
 # ------------------- Routes -------------------
 @router.post("/act")
+@profiled("act")
 def act_on_draft(req: ActionRequest):
     decision = (req.decision or "").upper()
-    data = load_json(DRAFT_FILE, {})
+    data = load_draft()
 
     if not data or "draft" not in data:
         raise HTTPException(status_code=404, detail="No draft found.")
@@ -95,7 +221,11 @@ def act_on_draft(req: ActionRequest):
     if decision == "U":
         if not req.feedback:
             raise HTTPException(status_code=400, detail="Feedback required for update.")
-        result = apply_feedback(req.feedback)
+        try:
+            with admit():
+                result = apply_feedback(req.feedback)
+        except Overloaded as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
         return result
 
     elif decision == "A":
@@ -105,28 +235,19 @@ def act_on_draft(req: ActionRequest):
         if draft.get("slot_status") == "confirmed" and draft.get("final_slot"):
             try:
                 cal_cfg = load_calendar_config()
-                slot_minutes = int(cal_cfg.get("slot_duration_minutes", 30))
-
-                # Convert final_slot string to datetime
-                start_str = draft.get("final_slot")
-
-                # If slot includes a range, split and take only the start time
-                if " - " in start_str:
-                    start_str = start_str.split(" - ")[0].strip()
-
-                try:
-                    start_dt = datetime.strptime(start_str, "%a, %b %d %Y | %I:%M %p")
-                    end_dt = start_dt + timedelta(minutes=slot_minutes)
-
-                    # ✅ Convert to RFC3339 UTC format
-                    start_iso = start_dt.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
-                    end_iso = end_dt.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
-
-                except Exception:
-                    raise HTTPException(status_code=400, detail="Invalid final_slot format.")
 
-                # Check if slot is free
-                free = is_slot_free(cal_cfg, start_iso, end_iso)
+                # Confirmed slot carries its own tz-aware ISO range
+                slot = resolve_final_slot(data)
+                if not slot:
+                    raise HTTPException(status_code=400, detail="Unknown final_slot; regenerate the draft.")
+                start_iso, end_iso = slot["start_iso"], slot["end_iso"]
+
+                # Check the local hold ledger first; only ask the calendar when
+                # nobody holds the slot
+                holder = slot_ledger.holder_of(slot["id"])
+                if holder and holder != (email or "").lower():
+                    raise HTTPException(status_code=409, detail="Selected slot is held for another prospect.")
+                free = holder is not None or is_slot_free(cal_cfg, start_iso, end_iso)
                 if not free:
                     raise HTTPException(status_code=409, detail="Selected slot not free.")
 
@@ -142,17 +263,17 @@ def act_on_draft(req: ActionRequest):
                     invite_attendees=False
                 )
 
-                event_info = {
-                    "id": ev.get("id"),
-                    "htmlLink": ev.get("htmlLink"),
-                    "start": ev.get("start", {}).get("dateTime") or ev.get("start", {}).get("date"),
-                    "end": ev.get("end", {}).get("dateTime") or ev.get("end", {}).get("date")
-                }
+                event_info = _event_info(ev)
+                invalidate_namespace("calendar:")
 
                 # Append meeting link to body
                 if event_info.get("htmlLink"):
                     draft["body"] += f"\n\nMeeting details: {event_info['htmlLink']}"
 
+            except HTTPException:
+                raise
+            except CircuitOpenError as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_in) + 1)})
             except Exception as e:
                 traceback.print_exc()
                 raise HTTPException(status_code=500, detail=f"Failed to create event: {e}")
@@ -160,14 +281,21 @@ def act_on_draft(req: ActionRequest):
         # Send email
         try:
             send_email(email, draft.get("subject", ""), draft.get("body", ""))
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_in) + 1)})
         except Exception as e:
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Failed to send email: {e}")
 
-        # Save full draft to history and clear draft.json
+        # Offered slots are no longer needed once the mail is out
+        slot_ledger.release_holds(email)
+        invalidate(get_last_sent_mail_to, email)
+        invalidate(get_conversation_summary, email)
+
+        # Save full draft to history and clear the stored draft
         try:
             save_to_history(data)
-            save_json(DRAFT_FILE, {})
+            clear_draft()
         except Exception as e:
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Failed to save history or clear draft: {e}")
@@ -182,3 +310,136 @@ def act_on_draft(req: ActionRequest):
 
     else:
         raise HTTPException(status_code=400, detail="decision must be 'U' or 'A'")
+
+
+# POST /api/act-batch
+@router.post("/act-batch")
+@profiled("act_batch")
+def approve_drafts_batch(req: BatchApproveRequest):
+    """
+    Approve many drafts at once. Confirmed slots are checked with a single
+    freebusy call and booked with one batch insert round-trip; each draft is
+    then sent and archived independently. Failures are reported per draft
+    instead of aborting the whole batch.
+    """
+    results = [{"index": i, "email": (rec.get("draft") or {}).get("email"), "status": "pending"}
+               for i, rec in enumerate(req.drafts)]
+
+    def _fail(i, detail):
+        results[i]["status"] = "failed"
+        results[i]["error"] = detail
+
+    # -------- Collect slots to book --------
+    bookings = {}  # index -> (start_iso, end_iso)
+    cal_cfg = None
+    for i, rec in enumerate(req.drafts):
+        draft = rec.get("draft") or {}
+        if not draft.get("email"):
+            _fail(i, "No draft found.")
+            continue
+        if draft.get("slot_status") == "confirmed" and draft.get("final_slot"):
+            slot = resolve_final_slot(rec)
+            if not slot:
+                _fail(i, "Unknown final_slot; regenerate the draft.")
+                continue
+            holder = slot_ledger.holder_of(slot["id"])
+            if holder and holder != draft["email"].lower():
+                _fail(i, "Selected slot is held for another prospect.")
+                continue
+            cal_cfg = cal_cfg or load_calendar_config()
+            bookings[i] = (slot["start_iso"], slot["end_iso"])
+
+    # -------- One freebusy call for the whole window --------
+    if bookings:
+        try:
+            window_min = min((s for s, _ in bookings.values()), key=datetime.fromisoformat)
+            window_max = max((e for _, e in bookings.values()), key=datetime.fromisoformat)
+            busy = freebusy_query(get_service_account_service(), cal_cfg["calendar_id"], window_min, window_max)
+        except Exception as e:
+            traceback.print_exc()
+            busy = []
+            for i in list(bookings):
+                _fail(i, f"Failed to check availability: {e}")
+                bookings.pop(i)
+
+        taken = []  # slots claimed earlier in this batch
+        busy_ranges = [(
+            datetime.fromisoformat(b["start"].replace("Z", "+00:00")),
+            datetime.fromisoformat(b["end"].replace("Z", "+00:00"))
+        ) for b in busy]
+        for i in sorted(bookings):
+            start_iso, end_iso = bookings[i]
+            s = datetime.fromisoformat(start_iso)
+            e = datetime.fromisoformat(end_iso)
+            if any(s < be and e > bs for bs, be in busy_ranges + taken):
+                _fail(i, "Selected slot not free.")
+                bookings.pop(i)
+            else:
+                taken.append((s, e))
+
+    # -------- Book all free slots in one batch round-trip --------
+    if bookings:
+        to_create = []
+        for i, (start_iso, end_iso) in bookings.items():
+            draft = req.drafts[i]["draft"]
+            to_create.append({
+                "key": str(i),
+                "summary": f"{draft.get('subject')} ({draft.get('email')})",
+                "start_iso": start_iso,
+                "end_iso": end_iso,
+                "email": draft.get("email"),
+                "mail_body": draft.get("body", ""),
+                "conference": True,
+                "invite_attendees": False
+            })
+        try:
+            report = create_events_batch(cal_cfg, to_create)
+        except Exception as e:
+            traceback.print_exc()
+            report = {"created": [], "failed": [{"key": c["key"], "error": str(e)} for c in to_create]}
+
+        for item in report["failed"]:
+            _fail(int(item["key"]), f"Failed to create event: {item['error']}")
+        if report["created"]:
+            invalidate_namespace("calendar:")
+        for item in report["created"]:
+            i = int(item["key"])
+            info = _event_info(item["event"])
+            results[i]["event_info"] = info
+            if info.get("htmlLink"):
+                req.drafts[i]["draft"]["body"] += f"\n\nMeeting details: {info['htmlLink']}"
+
+    # -------- Send each remaining draft, then archive in one write --------
+    sent_records = []
+    for i, rec in enumerate(req.drafts):
+        if results[i]["status"] == "failed":
+            continue
+        draft = rec["draft"]
+        try:
+            send_email(draft["email"], draft.get("subject", ""), draft.get("body", ""))
+        except Exception as e:
+            traceback.print_exc()
+            _fail(i, f"Failed to send email: {e}")
+            continue
+        results[i]["status"] = "sent"
+        sent_records.append(rec)
+        slot_ledger.release_holds(draft["email"])
+        invalidate(get_last_sent_mail_to, draft["email"])
+        invalidate(get_conversation_summary, draft["email"])
+
+    if sent_records:
+        try:
+            save_many_to_history(sent_records)
+        except Exception as e:
+            traceback.print_exc()
+            for r in results:
+                if r["status"] == "sent":
+                    r["warning"] = f"Email sent but failed to save history: {e}"
+
+    sent = sum(1 for r in results if r["status"] == "sent")
+    return {
+        "message": f"📨 {sent}/{len(results)} drafts sent.",
+        "sent": sent,
+        "failed": len(results) - sent,
+        "results": results
+    }
@@ -1,21 +1,17 @@
 # src/update_logic.py
-import os
 import json
 import traceback
 from dotenv import load_dotenv
-from openai import OpenAI
-from src.utils.helpers import load_json, save_json, setup_logging
+from src.utils.helpers import setup_logging
+from src.utils.draft_store import load_draft, save_draft
+from src.utils.rate_limiter import chat_completion
+from src.utils.clients import tenant_openai_client
+from src.utils.fast_path import apply_simple_feedback, stats as fast_path_stats
 
 # env load
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY2")
-client = OpenAI(api_key=OPENAI_API_KEY)
 MODEL = "gpt-4o-mini"
 
-import os
-
-DRAFT_FILE = os.path.join(os.path.dirname(__file__), "data", "draft.json")
-
 setup_logging()
 
 
@@ -40,7 +36,8 @@ User Feedback: "{feedback}"
 }}
 """
     try:
-        response = client.chat.completions.create(
+        response = chat_completion(
+            tenant_openai_client(),
             model=MODEL,
             temperature=0.7,
             messages=[
@@ -56,20 +53,24 @@ User Feedback: "{feedback}"
         return {"subject": existing_subject, "body": existing_body}
 
 
-# ------------------- Update draft.json -------------------
+# ------------------- Update stored draft -------------------
 def apply_feedback(feedback: str):
-    data = load_json(DRAFT_FILE, {})
+    data = load_draft()
 
     if not data or "draft" not in data:
         return {"error": "No draft available to update."}
 
     draft = data["draft"]
 
-    refined = refine_draft_with_feedback(
-        existing_subject=draft.get("subject", ""),
-        existing_body=draft.get("body", ""),
-        feedback=feedback
-    )
+    # mechanical edits ("shorten the subject") don't need the LLM
+    refined = apply_simple_feedback(draft.get("subject", ""), draft.get("body", ""), feedback)
+    fast_path_stats.record("feedback", refined is not None)
+    if refined is None:
+        refined = refine_draft_with_feedback(
+            existing_subject=draft.get("subject", ""),
+            existing_body=draft.get("body", ""),
+            feedback=feedback
+        )
 
     # update draft
     if isinstance(refined, dict):
@@ -77,7 +78,7 @@ def apply_feedback(feedback: str):
         draft["body"] = refined.get("body", draft.get("body"))
 
     data["draft"] = draft
-    save_json(DRAFT_FILE, data)
+    save_draft(data)
 
     return {
         "message": "✅ Draft updated with feedback",
@@ -0,0 +1,186 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+from src.utils.tracing import span
+from src.utils.tenants import current_tenant
+
+# ------------------- Config -------------------
+# Admission control for draft generation (mail + calendar + LLM work). At most
+# ADMISSION_MAX_IN_FLIGHT pipelines run at once; the rest wait in a bounded
+# priority queue where interactive requests always go before batch ones.
+# A request is shed (Overloaded -> 503 + Retry-After) when the queue is full,
+# when its expected wait already exceeds the priority's max wait, or when it
+# actually waited that long; interactive max wait stays well under the 45 s
+# client timeout so no tokens are spent on answers nobody will read.
+# A tenant with max_in_flight in tenants.yaml also gets its own controller of
+# that size, entered before the shared one: its batch campaign then holds at
+# most that many shared slots, and other tenants' drafts still get through.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+INTERACTIVE_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_INTERACTIVE_MAX_WAIT", "15"))
+BATCH_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_BATCH_MAX_WAIT", "600"))
+
+INTERACTIVE, BATCH = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+MAX_WAIT = {INTERACTIVE: INTERACTIVE_MAX_WAIT_SECONDS, BATCH: BATCH_MAX_WAIT_SECONDS}
+DEFAULT_SERVICE_SECONDS = 5.0  # until real pipeline durations are observed
+WINDOW = 500
+
+
+class Overloaded(Exception):
+    """The request was not admitted; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server busy ({reason}); retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _percentile(samples, q: float) -> Optional[float]:
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._heap = []  # (priority, seq, ticket)
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.admitted = {p: 0 for p in PRIORITY_NAMES}
+        self.shed = {p: {"queue_full": 0, "expected_wait": 0, "waited_too_long": 0} for p in PRIORITY_NAMES}
+        self.waits = {p: deque(maxlen=WINDOW) for p in PRIORITY_NAMES}
+        self.service_times = deque(maxlen=WINDOW)
+
+    # -------- estimates --------
+    def _service_seconds(self) -> float:
+        if not self.service_times:
+            return DEFAULT_SERVICE_SECONDS
+        return sum(self.service_times) / len(self.service_times)
+
+    def _expected_wait(self, ahead: int) -> float:
+        """Rough queueing delay with `ahead` requests in front of us (lock held)."""
+        if self.in_flight + ahead < self.max_in_flight:
+            return 0.0
+        return (ahead // self.max_in_flight + 1) * self._service_seconds()
+
+    def _ahead_of(self, priority: int) -> int:
+        return sum(1 for p, _, _ in self._heap if p <= priority)
+
+    # -------- acquire / release --------
+    def acquire(self, priority: int = INTERACTIVE) -> float:
+        """Block until admitted; returns the queue wait. Raises Overloaded when shed."""
+        max_wait = MAX_WAIT[priority]
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self.shed[priority]["queue_full"] += 1
+                raise Overloaded("queue full", self._expected_wait(len(self._heap)))
+            expected = self._expected_wait(self._ahead_of(priority))
+            if expected > max_wait:
+                self.shed[priority]["expected_wait"] += 1
+                raise Overloaded("expected wait too long", expected)
+
+            ticket = object()
+            entry = (priority, next(self._seq), ticket)
+            heapq.heappush(self._heap, entry)
+            enqueued = time.monotonic()
+            try:
+                while not (self.in_flight < self.max_in_flight and self._heap[0][2] is ticket):
+                    remaining = max_wait - (time.monotonic() - enqueued)
+                    if remaining <= 0:
+                        self.shed[priority]["waited_too_long"] += 1
+                        raise Overloaded("waited too long", self._expected_wait(self._ahead_of(priority)))
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._heap.remove(entry)
+                heapq.heapify(self._heap)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._heap)
+            self.in_flight += 1
+            waited = time.monotonic() - enqueued
+            self.admitted[priority] += 1
+            self.waits[priority].append(waited)
+            # the next in line may also fit
+            self._cond.notify_all()
+            return waited
+
+    def release(self, service_seconds: Optional[float] = None):
+        with self._cond:
+            self.in_flight -= 1
+            if service_seconds is not None:
+                self.service_times.append(service_seconds)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, priority: int = INTERACTIVE):
+        with span("admission.wait", priority=PRIORITY_NAMES[priority]):
+            self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    # -------- metrics --------
+    def snapshot(self) -> dict:
+        with self._cond:
+            depth = {PRIORITY_NAMES[p]: sum(1 for q, _, _ in self._heap if q == p) for p in PRIORITY_NAMES}
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": depth,
+                "max_queue": self.max_queue,
+                "mean_service_seconds": round(self._service_seconds(), 3),
+                "by_priority": {
+                    PRIORITY_NAMES[p]: {
+                        "admitted": self.admitted[p],
+                        "shed": dict(self.shed[p]),
+                        "max_wait_seconds": MAX_WAIT[p],
+                        "wait_p50_seconds": _percentile(self.waits[p], 0.5),
+                        "wait_p95_seconds": _percentile(self.waits[p], 0.95),
+                        "wait_max_seconds": _percentile(self.waits[p], 1.0)
+                    }
+                    for p in PRIORITY_NAMES
+                }
+            }
+
+
+_controller = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE)
+_tenant_controllers: Dict[str, AdmissionController] = {}
+_tenant_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    """The shared controller (all tenants)."""
+    return _controller
+
+
+def get_tenant_admission() -> Optional[AdmissionController]:
+    """The current tenant's quota, or None when it has no max_in_flight."""
+    tenant = current_tenant()
+    if not tenant.max_in_flight:
+        return None
+    with _tenant_lock:
+        if tenant.id not in _tenant_controllers:
+            _tenant_controllers[tenant.id] = AdmissionController(
+                int(tenant.max_in_flight), int(tenant.max_queue or ADMISSION_MAX_QUEUE))
+        return _tenant_controllers[tenant.id]
+
+
+@contextmanager
+def admit(priority: int = INTERACTIVE):
+    """Context manager: run the block once admitted (raises Overloaded when shed)."""
+    quota = get_tenant_admission()
+    with quota.admit(priority) if quota is not None else nullcontext(), _controller.admit(priority):
+        yield
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import logging
+import tempfile
+import functools
+import contextlib
+from typing import Any
+
+from src.utils.tenants import data_path
+
+# ------------------- Blob store -------------------
+# Content-addressed, zlib-compressed bodies shared by history and draft
+# records: data/blobs/<2 hex>/<sha256>.z. Records keep {"$blob": sha256} in
+# place of large fields and are rehydrated transparently on read.
+BLOB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "blobs")
+BLOB_FIELDS = ("current_mail", "past_interaction", "available_slots", "upcoming_events")
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "64"))  # smaller values stay inline
+BLOB_GC_GRACE_SECONDS = 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(data_path(BLOB_DIR), digest[:2], digest + ".z")
+
+
+def put_blob(value: Any) -> str:
+    """Store value (JSON-serializable) once; returns its sha256."""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    path = _blob_path(digest)
+    try:
+        # referenced again: keep compact() from collecting it as old
+        os.utime(path)
+        return digest
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # unique temp file: threads of one process may write the same digest at once
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(raw, 6))
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    return digest
+
+
+@functools.lru_cache(maxsize=2048)
+def _read_blob(path: str) -> str:
+    # blobs are immutable, so decoded text can be cached forever
+    with open(path, "rb") as f:
+        return zlib.decompress(f.read()).decode("utf-8")
+
+
+def get_blob(digest: str) -> Any:
+    return json.loads(_read_blob(_blob_path(digest)))
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and set(value) == {"$blob"}
+
+
+def dehydrate(record: dict) -> dict:
+    """Copy of record with large BLOB_FIELDS replaced by blob references."""
+    if not isinstance(record, dict):
+        return record
+    out = dict(record)
+    for field in BLOB_FIELDS:
+        value = out.get(field)
+        if value in (None, "", []) or is_ref(value):
+            continue
+        if len(json.dumps(value, ensure_ascii=False)) >= BLOB_MIN_BYTES:
+            out[field] = {"$blob": put_blob(value)}
+    return out
+
+
+def rehydrate(record: dict) -> dict:
+    """Copy of record with blob references replaced by their content."""
+    if not isinstance(record, dict):
+        return record
+    out = dict(record)
+    for field in BLOB_FIELDS:
+        value = out.get(field)
+        if is_ref(value):
+            try:
+                out[field] = get_blob(value["$blob"])
+            except FileNotFoundError:
+                logger.error("Missing blob %s for field %s", value["$blob"], field)
+                out[field] = "" if field in ("current_mail", "past_interaction") else []
+    return out
+
+
+def _referenced(records) -> set:
+    refs = set()
+    for rec in records:
+        if isinstance(rec, dict):
+            refs.update(rec[f]["$blob"] for f in BLOB_FIELDS if is_ref(rec.get(f)))
+    return refs
+
+
+# ------------------- Compaction -------------------
+def compact() -> dict:
+    """
+    Rewrite history so every record references blobs (migrating inline
+    records), then delete blobs nothing references any more. Blobs younger
+    than a day are kept: speculative drafts in the cache may still use them.
+    """
+    from src.utils.history_store import HISTORY_FILE
+    from src.utils.helpers import update_json
+    from src.utils.draft_store import load_draft
+
+    history_file, blob_dir = data_path(HISTORY_FILE), data_path(BLOB_DIR)
+    before = os.path.getsize(history_file) if os.path.exists(history_file) else 0
+
+    def _compact(history):
+        if isinstance(history, dict):
+            history = [history]
+        return [dehydrate(rec) for rec in history]
+
+    history = update_json(history_file, _compact, [])
+    after = os.path.getsize(history_file)
+
+    referenced = _referenced(history) | _referenced([dehydrate(load_draft())])
+    removed = 0
+    now = time.time()
+    for root, _, files in os.walk(blob_dir):
+        for name in files:
+            digest = name[:-2] if name.endswith(".z") else None
+            path = os.path.join(root, name)
+            if digest and digest not in referenced and now - os.path.getmtime(path) > BLOB_GC_GRACE_SECONDS:
+                os.remove(path)
+                removed += 1
+
+    blob_bytes = sum(os.path.getsize(os.path.join(r, n)) for r, _, fs in os.walk(blob_dir) for n in fs)
+    return {
+        "records": len(history),
+        "history_bytes_before": before,
+        "history_bytes_after": after,
+        "blob_bytes": blob_bytes,
+        "blobs_referenced": len(referenced),
+        "blobs_removed": removed
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.utils.blob_store compact
+    if sys.argv[1:] != ["compact"]:
+        sys.exit("usage: python -m src.utils.blob_store compact")
+    print(json.dumps(compact(), indent=2))
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import functools
+import threading
+from typing import Any, Callable, Optional, Union
+
+from dotenv import load_dotenv
+
+from src.utils.circuit_breaker import CircuitOpenError
+from src.utils.tenants import scoped
+
+load_dotenv()
+
+# ------------------- Config -------------------
+# CACHE_BACKEND: "memory" (per process), "sqlite" (shared file, WAL) or
+# "redis" (any Redis-compatible server at REDIS_URL)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SQLITE_PATH = os.getenv(
+    "CACHE_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache.sqlite3")
+)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# last-known-good copies kept by @cached(stale_ttl=...)
+STALE_PREFIX = "stale:"
+STALE_CACHE_TTL = float(os.getenv("STALE_CACHE_TTL", "86400"))
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------- Backends -------------------
+class CacheBackend:
+    """Key/value store with optional per-key TTL. Values must be JSON-serializable."""
+
+    shared = False  # True when state is visible to every worker process
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (json.dumps(value, ensure_ascii=False), expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+
+class SQLiteBackend(CacheBackend):
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; WAL lets readers run alongside one writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at)
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        conn.commit()
+
+    def delete_prefix(self, prefix):
+        conn = self._conn()
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conn.execute("DELETE FROM kv WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+        conn.commit()
+
+
+class RedisBackend(CacheBackend):
+    shared = True
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for CACHE_BACKEND=redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, json.dumps(value, ensure_ascii=False), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def delete_prefix(self, prefix):
+        for key in self.client.scan_iter(match=prefix + "*"):
+            self.client.delete(key)
+
+
+# ------------------- Backend selection -------------------
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if CACHE_BACKEND == "sqlite":
+                    _backend = SQLiteBackend(CACHE_SQLITE_PATH)
+                elif CACHE_BACKEND == "redis":
+                    _backend = RedisBackend(REDIS_URL)
+                else:
+                    _backend = MemoryBackend()
+                logger.info("Cache backend: %s", type(_backend).__name__)
+    return _backend
+
+
+# ------------------- Cached decorator -------------------
+def cache_key(namespace: str, *parts: Any) -> str:
+    """Key for namespace + parts, scoped to the current tenant."""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return scoped(f"{namespace}:{digest}")
+
+
+def cached(namespace: str, ttl: Union[float, Callable[[], float]], stale_ttl: float = 0):
+    """
+    Cache a function's JSON-serializable result in the shared backend for ttl
+    seconds (ttl <= 0 disables; a callable ttl is evaluated per call). Empty
+    results are not cached. With stale_ttl, the last good result is also kept
+    that long and returned instead of failing while the dependency's circuit
+    breaker is open.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            seconds = ttl() if callable(ttl) else ttl
+            if seconds <= 0:
+                return fn(*args, **kwargs)
+            key = cache_key(namespace, args, kwargs)
+            backend = get_backend()
+            try:
+                hit = backend.get(key)
+            except Exception as e:
+                logger.warning("Cache get failed for %s: %s", namespace, e)
+                hit = None
+            if hit is not None:
+                return hit
+            try:
+                value = fn(*args, **kwargs)
+            except CircuitOpenError:
+                stale = backend.get(STALE_PREFIX + key) if stale_ttl > 0 else None
+                if stale is None:
+                    raise
+                logger.info("Serving last-known %s result (circuit open)", namespace)
+                return stale
+            if value:
+                try:
+                    backend.set(key, value, seconds)
+                    if stale_ttl > 0:
+                        backend.set(STALE_PREFIX + key, value, stale_ttl)
+                except Exception as e:
+                    logger.warning("Cache set failed for %s: %s", namespace, e)
+            return value
+        wrapper.cache_namespace = namespace
+        return wrapper
+    return decorator
+
+
+def invalidate(fn, *args, **kwargs):
+    """Drop the cached result of fn(*args, **kwargs) (fn decorated with @cached)."""
+    try:
+        get_backend().delete(cache_key(fn.cache_namespace, args, kwargs))
+    except Exception as e:
+        logger.warning("Cache invalidate failed for %s: %s", fn.cache_namespace, e)
+
+
+def invalidate_namespace(namespace: str):
+    """Drop every cached result under namespace (e.g. "calendar") for the current tenant."""
+    try:
+        get_backend().delete_prefix(scoped(namespace))
+    except Exception as e:
+        logger.warning("Cache invalidate failed for %s: %s", namespace, e)
@@ -0,0 +1,446 @@
+"""
+Record/replay of external calls (IMAP, SMTP, Google API HTTP, OpenAI HTTP).
+
+    CASSETTE_MODE=record CASSETTE=demo uvicorn main:app     # talk to the real services once
+    CASSETTE_MODE=replay CASSETTE=demo uvicorn main:app     # offline, deterministic
+    python -m src.utils.cassette bench demo --email ana@example.com --runs 20 --latency none
+
+The client factories in src/utils/clients.py wrap their connections when a
+mode is set, so every call site is covered without changes. Interactions
+are appended to data/cassettes/<name>.jsonl with their duration; replay
+matches on the exact request first and otherwise on the request shape
+(method + path, IMAP command, SMTP verb), in recorded order, and sleeps per
+CASSETTE_LATENCY: recorded | none | fixed:<ms> | scale:<factor>. No
+credentials are stored: request headers are never recorded and OAuth token
+exchanges are skipped. The IMAP IDLE watcher talks to the raw socket and is
+not covered.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import argparse
+import threading
+from typing import Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import httplib2
+
+# ------------------- Config -------------------
+CASSETTE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cassettes")
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()  # off | record | replay
+CASSETTE = os.getenv("CASSETTE", "default")
+CASSETTE_KINDS = {k.strip() for k in os.getenv("CASSETTE_KINDS", "imap,smtp,google,openai").split(",") if k.strip()}
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "recorded")
+TOKEN_HOSTS = ("oauth2.googleapis.com", "accounts.google.com")
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recorded interaction for a request."""
+
+
+# ------------------- Encoding -------------------
+def _encode(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"$b64": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, tuple):
+        return {"$tuple": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"$b64"}:
+            return base64.b64decode(value["$b64"])
+        if set(value) == {"$tuple"}:
+            return tuple(_decode(v) for v in value["$tuple"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _digest(data: Any) -> str:
+    raw = data if isinstance(data, bytes) else json.dumps(_encode(data), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+# ------------------- Cassette -------------------
+def replay_delay(seconds: float, latency: str = None) -> float:
+    latency = (latency or CASSETTE_LATENCY).lower()
+    if latency == "none":
+        return 0.0
+    if latency.startswith("fixed:"):
+        return float(latency.split(":", 1)[1]) / 1000.0
+    if latency.startswith("scale:"):
+        return seconds * float(latency.split(":", 1)[1])
+    return seconds
+
+
+class Cassette:
+    def __init__(self, name: str, mode: str):
+        self.name = name
+        self.mode = mode
+        self.path = os.path.join(CASSETTE_DIR, name + ".jsonl")
+        self._lock = threading.Lock()
+        self.interactions = []
+        if mode == "replay":
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Cassette not found: {self.path} (record it with CASSETTE_MODE=record)")
+            with open(self.path, encoding="utf-8") as f:
+                self.interactions = [json.loads(line) for line in f if line.strip()]
+        self.rewind()
+
+    def rewind(self):
+        """Start replay from the first interaction again (e.g. per benchmark run)."""
+        with self._lock:
+            self._played = set()
+
+    def record(self, kind: str, key: str, shape: str, request: Any, response: Any, seconds: float):
+        entry = {"kind": kind, "key": key, "shape": shape, "request": _encode(request),
+                 "response": _encode(response), "seconds": round(seconds, 6), "at": time.time()}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(CASSETTE_DIR, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def play(self, kind: str, key: str, shape: str) -> Tuple[Any, float]:
+        """(decoded response, delay to wait). Raises CassetteMiss."""
+        with self._lock:
+            for match in ("key", "shape"):
+                wanted = key if match == "key" else shape
+                candidates = [i for i, it in enumerate(self.interactions) if it["kind"] == kind and it[match] == wanted]
+                if not candidates:
+                    continue
+                fresh = [i for i in candidates if i not in self._played]
+                # once every match was used, keep answering with the last one
+                i = fresh[0] if fresh else candidates[-1]
+                self._played.add(i)
+                it = self.interactions[i]
+                return _decode(it["response"]), replay_delay(it["seconds"])
+        raise CassetteMiss(f"{kind}: no recorded interaction for {shape} in cassette {self.name!r}")
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def mode(kind: str) -> Optional[str]:
+    """The cassette mode ("record" / "replay") for calls of this kind, or None."""
+    if CASSETTE_MODE not in ("record", "replay") or kind not in CASSETTE_KINDS:
+        return None
+    return CASSETTE_MODE
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE, CASSETTE_MODE)
+        return _cassette
+
+
+# ------------------- IMAP / SMTP -------------------
+class _RecordingProxy:
+    """Forwards to a real connection and records the listed methods."""
+
+    kind = ""
+    methods = ()
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def _shape(self, name: str, args: tuple) -> str:
+        return name
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name not in self.methods:
+            return attr
+
+        def call(*args):
+            started = time.perf_counter()
+            error, result = None, None
+            try:
+                result = attr(*args)
+                return result
+            except Exception as e:
+                error = {"type": type(e).__name__, "message": str(e)}
+                raise
+            finally:
+                request = [name, [_request_arg(a) for a in args]]
+                get_cassette().record(self.kind, _digest(request), self._shape(name, args), request,
+                                      {"result": result, "error": error}, time.perf_counter() - started)
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+class _ReplayProxy:
+    kind = ""
+    methods = ()
+
+    def _shape(self, name: str, args: tuple) -> str:
+        return name
+
+    def __getattr__(self, name):
+        if name not in self.methods:
+            raise AttributeError(f"{name} is not replayable")
+
+        def call(*args):
+            request = [name, [_request_arg(a) for a in args]]
+            response, delay = get_cassette().play(self.kind, _digest(request), self._shape(name, args))
+            time.sleep(delay)
+            if response.get("error"):
+                raise _replayed_error(self.kind, response["error"])
+            return response["result"]
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _request_arg(arg):
+    # email.message objects are recorded as their headers (bodies vary per run)
+    if hasattr(arg, "items") and hasattr(arg, "get_payload"):
+        return {k: str(v) for k, v in arg.items()}
+    return arg
+
+
+def _replayed_error(kind: str, error: dict) -> Exception:
+    import imaplib
+    import smtplib
+    cls = {"imap": imaplib.IMAP4.error, "smtp": smtplib.SMTPException}.get(kind, OSError)
+    return cls(f"{error['type']}: {error['message']} (replayed)")
+
+
+class _ImapShape:
+    kind = "imap"
+    methods = ("select", "search", "fetch", "uid", "noop", "close", "logout")
+
+    def _shape(self, name, args):
+        # mailbox / UID command name identify the call; criteria and ids may vary
+        head = args[0] if args and name in ("select", "uid") else ""
+        return f"{name} {head}".strip()
+
+
+class _SmtpShape:
+    kind = "smtp"
+    methods = ("send_message", "sendmail", "noop", "quit", "close")
+
+
+class RecordingIMAP(_ImapShape, _RecordingProxy):
+    pass
+
+
+class ReplayIMAP(_ImapShape, _ReplayProxy):
+    pass
+
+
+class RecordingSMTP(_SmtpShape, _RecordingProxy):
+    pass
+
+
+class ReplaySMTP(_SmtpShape, _ReplayProxy):
+    pass
+
+
+# ------------------- Google (httplib2) -------------------
+def _http_shape(method: str, uri: str) -> str:
+    parts = urlsplit(str(uri))
+    return f"{method.upper()} {parts.netloc}{parts.path}"
+
+
+class RecordingHttp:
+    """httplib2.Http stand-in that records each request/response pair."""
+
+    def __init__(self, http: httplib2.Http):
+        self._http = http
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        started = time.perf_counter()
+        resp, content = self._http.request(uri, method, body, headers, *args, **kwargs)
+        if urlsplit(str(uri)).netloc not in TOKEN_HOSTS:
+            request = [method.upper(), str(uri), body]
+            get_cassette().record("google", _digest(request), _http_shape(method, uri), request[:2],
+                                  {"headers": dict(resp), "content": content}, time.perf_counter() - started)
+        return resp, content
+
+
+class ReplayHttp:
+    """Answers googleapiclient requests from the cassette; needs no credentials."""
+
+    timeout = None
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        request = [method.upper(), str(uri), body]
+        response, delay = get_cassette().play("google", _digest(request), _http_shape(method, uri))
+        time.sleep(delay)
+        return httplib2.Response(response["headers"]), response["content"]
+
+    def close(self):
+        pass
+
+
+# ------------------- OpenAI (httpx) -------------------
+_DROP_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+
+def _httpx_request(request: httpx.Request) -> Tuple[str, str]:
+    shape = f"{request.method} {request.url.host}{request.url.path}"
+    return _digest([shape, request.content]), shape
+
+
+def _httpx_record(request: httpx.Request, response: httpx.Response, seconds: float) -> httpx.Response:
+    headers = {k: v for k, v in response.headers.items() if k.lower() not in _DROP_RESPONSE_HEADERS}
+    key, shape = _httpx_request(request)
+    get_cassette().record("openai", key, shape, [request.method, str(request.url)],
+                          {"status": response.status_code, "headers": headers, "content": response.content}, seconds)
+    return httpx.Response(response.status_code, headers=headers, content=response.content, request=request)
+
+
+def _httpx_replay(request: httpx.Request) -> Tuple[httpx.Response, float]:
+    key, shape = _httpx_request(request)
+    response, delay = get_cassette().play("openai", key, shape)
+    return httpx.Response(response["status"], headers=response["headers"], content=response["content"],
+                          request=request), delay
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        response = self._transport.handle_request(request)
+        response.read()
+        return _httpx_record(request, response, time.perf_counter() - started)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        await response.aread()
+        return _httpx_record(request, response, time.perf_counter() - started)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def handle_request(self, request):
+        request.read()
+        response, delay = _httpx_replay(request)
+        time.sleep(delay)
+        return response
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        await request.aread()
+        response, delay = _httpx_replay(request)
+        await asyncio.sleep(delay)
+        return response
+
+
+def openai_http_client(timeout) -> Optional[httpx.Client]:
+    """httpx client for OpenAI(http_client=...) in record/replay mode, else None (SDK default)."""
+    m = mode("openai")
+    if m == "record":
+        return httpx.Client(timeout=timeout, transport=RecordingTransport(httpx.HTTPTransport()))
+    if m == "replay":
+        return httpx.Client(timeout=timeout, transport=ReplayTransport())
+    return None
+
+
+def async_openai_http_client(timeout) -> Optional[httpx.AsyncClient]:
+    m = mode("openai")
+    if m == "record":
+        return httpx.AsyncClient(timeout=timeout, transport=AsyncRecordingTransport(httpx.AsyncHTTPTransport()))
+    if m == "replay":
+        return httpx.AsyncClient(timeout=timeout, transport=AsyncReplayTransport())
+    return None
+
+
+# ------------------- CLI -------------------
+def _info(name: str) -> dict:
+    kinds = {}
+    for it in Cassette(name, "replay").interactions:
+        k = kinds.setdefault(it["kind"], {"calls": 0, "recorded_seconds": 0.0})
+        k["calls"] += 1
+        k["recorded_seconds"] = round(k["recorded_seconds"] + it["seconds"], 3)
+    return kinds
+
+
+def _bench(name: str, email: str, runs: int, latency: str) -> dict:
+    # configure before the pipeline modules (and their module-level clients) are imported
+    os.environ.update(CASSETTE_MODE="replay", CASSETTE=name, CASSETTE_LATENCY=latency)
+    for var in ("MAIL_CACHE_TTL", "CALENDAR_CACHE_TTL", "LLM_CACHE_TTL"):
+        os.environ[var] = "0"  # every run does the full set of calls
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # as main.py does
+    from src.utils import cassette  # this file runs as __main__; the clients use the package module
+    from draft_routes import Prospect, gather_draft_inputs
+    from src.generate_draft import generate_draft
+
+    timings = []
+    for _ in range(runs):
+        cassette.get_cassette().rewind()
+        started = time.perf_counter()
+        generate_draft(**gather_draft_inputs(Prospect(email=email)))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "cassette": name,
+        "latency": latency,
+        "runs": runs,
+        "p50_seconds": round(timings[len(timings) // 2], 4),
+        "p95_seconds": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 4),
+        "mean_seconds": round(sum(timings) / len(timings), 4)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect cassettes and benchmark the draft pipeline against them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="calls and recorded time per dependency")
+    info.add_argument("name")
+    bench = sub.add_parser("bench", help="replay gather + generate for a prospect and time it")
+    bench.add_argument("name")
+    bench.add_argument("--email", required=True)
+    bench.add_argument("--runs", type=int, default=10)
+    bench.add_argument("--latency", default="recorded", help="recorded | none | fixed:<ms> | scale:<factor>")
+    args = parser.parse_args(argv)
+    if args.command == "info":
+        print(json.dumps(_info(args.name), indent=2))
+    else:
+        print(json.dumps(_bench(args.name, args.email, args.runs, args.latency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
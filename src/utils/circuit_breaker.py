@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from src.utils.tenants import current_tenant
+
+# ------------------- Config -------------------
+# One breaker per external dependency (imap, calendar, smtp, openai). After
+# BREAKER_FAILURE_THRESHOLD consecutive failures it opens and calls fail fast
+# with CircuitOpenError; after BREAKER_RESET_SECONDS a single probe call is
+# let through and its outcome closes or re-opens the breaker. Each tenant has
+# its own set, so one clinic's broken mailbox doesn't fail the others.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+DEPENDENCIES = ("imap", "calendar", "smtp", "openai")
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """The dependency's breaker is open; the call was not attempted."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def _is_client_error(exc: BaseException) -> bool:
+    """HTTP 4xx other than 408/429 (googleapiclient HttpError, openai APIStatusError)."""
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "resp", None), "status", None)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+class CircuitBreaker:
+    """
+    Use as a context manager around one call to the dependency:
+
+        with get_breaker("imap"):
+            ...
+
+    Entering raises CircuitOpenError while open; an exception inside the
+    block counts as a failure, a clean exit as a success.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.last_error = ""
+        self.total_failures = 0
+        self.rejected = 0
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_seconds - waited)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self.probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_seconds)
+                self.probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit %s closed", self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:300]
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning("Circuit %s opened after %d failure(s): %s", self.name, self.failures, self.last_error)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def __enter__(self):
+        self.before_call()
+        return self
+
+    def release_probe(self):
+        with self._lock:
+            self.probe_in_flight = False
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None or _is_client_error(exc):
+            # the dependency answered; a 4xx is our problem, not an outage
+            self.record_success()
+        elif not isinstance(exc, Exception):
+            # cancelled (e.g. a losing hedged request): says nothing about health
+            self.release_probe()
+        else:
+            self.record_failure(exc)
+        return False
+
+    def status(self) -> dict:
+        with self._lock:
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)) if self.state == OPEN else 0.0
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "total_failures": self.total_failures,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(retry_in, 1),
+                "last_error": self.last_error
+            }
+
+
+_breakers: Dict[str, Dict[str, CircuitBreaker]] = {}  # tenant id -> name -> breaker
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The current tenant's breaker for dependency `name`."""
+    with _registry_lock:
+        breakers = _breakers.setdefault(current_tenant().id, {})
+        if name not in breakers:
+            breakers[name] = CircuitBreaker(name)
+        return breakers[name]
+
+
+def breaker_status(name: Optional[str] = None) -> dict:
+    """{name: status} for every known dependency's breaker of the current tenant in this process."""
+    for dep in DEPENDENCIES:
+        get_breaker(dep)
+    with _registry_lock:
+        breakers = dict(_breakers[current_tenant().id])
+    if name is not None:
+        return breakers[name].status() if name in breakers else {}
+    return {n: b.status() for n, b in sorted(breakers.items())}
@@ -0,0 +1,115 @@
+import os
+import imaplib
+import smtplib
+import threading
+
+import httpx
+import httplib2
+from dotenv import load_dotenv
+from google_auth_httplib2 import AuthorizedHttp
+from openai import OpenAI, AsyncOpenAI
+
+from src.utils import cassette
+from src.utils.tenants import current_tenant, tenant_setting
+
+load_dotenv()
+
+# ------------------- Client factories -------------------
+# Every connection to IMAP, SMTP, Google APIs and OpenAI is made here, with
+# explicit timeouts, so a degraded dependency fails in seconds instead of
+# hanging a request on library defaults. With CASSETTE_MODE=record|replay
+# the connections are wrapped to record or replay their traffic. Credentials
+# default to the current tenant's settings (see src/utils/tenants.py).
+IMAP_TIMEOUT = float(os.getenv("IMAP_TIMEOUT", "10"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "15"))
+GOOGLE_HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "10"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+
+
+def openai_api_key() -> str:
+    key = tenant_setting("OPENAI_API_KEY") or tenant_setting("OPENAI_API_KEY2")
+    # replay never reaches the API
+    return key or ("cassette-replay" if cassette.mode("openai") == "replay" else key)
+
+
+def openai_timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def openai_client() -> OpenAI:
+    return OpenAI(api_key=openai_api_key(), timeout=openai_timeout(),
+                  http_client=cassette.openai_http_client(openai_timeout()))
+
+
+_openai_pool = {}
+_openai_pool_lock = threading.Lock()
+
+
+def tenant_openai_client() -> OpenAI:
+    """The current tenant's OpenAI client, created once per process and reused (keeps its connection pool)."""
+    tenant_id = current_tenant().id
+    with _openai_pool_lock:
+        if tenant_id not in _openai_pool:
+            _openai_pool[tenant_id] = openai_client()
+        return _openai_pool[tenant_id]
+
+
+def async_openai_client(client: OpenAI | None = None) -> AsyncOpenAI:
+    """Async client; mirrors `client`'s key and endpoint when given."""
+    if client is None:
+        return AsyncOpenAI(api_key=openai_api_key(), timeout=openai_timeout(),
+                           http_client=cassette.async_openai_http_client(openai_timeout()))
+    return AsyncOpenAI(api_key=client.api_key, base_url=client.base_url, timeout=client.timeout,
+                       http_client=cassette.async_openai_http_client(client.timeout))
+
+
+def imap_connect(host: str | None = None, user: str | None = None, password: str | None = None,
+                 timeout: float = IMAP_TIMEOUT) -> imaplib.IMAP4_SSL:
+    """Logged-in IMAP connection (socket timeout applies to connect and every command)."""
+    if cassette.mode("imap") == "replay":
+        return cassette.ReplayIMAP()
+    mail = imaplib.IMAP4_SSL(host or tenant_setting("IMAP_HOST", "imap.gmail.com"), timeout=timeout)
+    mail.login(user or tenant_setting("IMAP_USER"), password or tenant_setting("IMAP_PASS"))
+    return cassette.RecordingIMAP(mail) if cassette.mode("imap") == "record" else mail
+
+
+def smtp_settings() -> dict:
+    """SMTP host/port/credentials and sender address for the current tenant."""
+    user = tenant_setting("SMTP_USER") or tenant_setting("FROM_EMAIL")
+    return {
+        "host": tenant_setting("SMTP_HOST", "smtp.gmail.com"),
+        "port": int(tenant_setting("SMTP_PORT", "587")),
+        "user": user,
+        "password": (tenant_setting("SMTP_PASS") or "").replace(" ", ""),
+        "use_tls": tenant_setting("SMTP_USE_TLS", "true").lower() == "true",
+        "from_email": tenant_setting("FROM_EMAIL") or user
+    }
+
+
+def smtp_connect(host: str, port: int, user: str, password: str, use_tls: bool = True,
+                 timeout: float = SMTP_TIMEOUT) -> smtplib.SMTP:
+    """Logged-in SMTP connection; use as a context manager."""
+    if cassette.mode("smtp") == "replay":
+        return cassette.ReplaySMTP()
+    server = smtplib.SMTP(host, port, timeout=timeout)
+    try:
+        server.ehlo()
+        if use_tls:
+            server.starttls()
+            server.ehlo()
+        server.login(user, password)
+    except Exception:
+        server.close()
+        raise
+    return cassette.RecordingSMTP(server) if cassette.mode("smtp") == "record" else server
+
+
+def google_http(credentials, timeout: float = GOOGLE_HTTP_TIMEOUT) -> AuthorizedHttp:
+    """Authorized httplib2 transport for googleapiclient.build(http=...)."""
+    if cassette.mode("google") == "replay":
+        return cassette.ReplayHttp()  # no credentials needed
+    http = httplib2.Http(timeout=timeout)
+    if cassette.mode("google") == "record":
+        http = cassette.RecordingHttp(http)
+    return AuthorizedHttp(credentials, http=http)
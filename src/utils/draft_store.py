@@ -0,0 +1,71 @@
+import os
+import logging
+from typing import Any
+
+from src.utils.helpers import load_json, save_json
+from src.utils.cache_backend import get_backend
+from src.utils.blob_store import dehydrate, rehydrate
+from src.utils.tenants import data_path, scoped
+
+# ------------------- Draft store -------------------
+# The current draft lives in data/draft.json by default. When a shared cache
+# backend (sqlite/redis) is configured it lives there instead, so every
+# uvicorn worker sees the same draft. Large fields are stored in the blob
+# store and rehydrated on load. File and keys are per tenant.
+DRAFT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "draft.json")
+DRAFT_KEY = "draft:current"
+SPECULATIVE_PREFIX = "draft:speculative:"
+SPECULATIVE_DRAFT_TTL = float(os.getenv("SPECULATIVE_DRAFT_TTL", "1800"))
+
+logger = logging.getLogger(__name__)
+
+
+def load_draft() -> dict:
+    backend = get_backend()
+    if backend.shared:
+        return rehydrate(backend.get(scoped(DRAFT_KEY)) or {})
+    data = load_json(data_path(DRAFT_FILE), {})
+    return rehydrate(data) if isinstance(data, dict) else {}
+
+
+def save_draft(data: Any):
+    backend = get_backend()
+    data = dehydrate(data)
+    target = scoped(DRAFT_KEY) if backend.shared else data_path(DRAFT_FILE)
+    if backend.shared:
+        backend.set(target, data)
+    else:
+        save_json(target, data)
+    logger.info("Draft saved to %s", target)
+
+
+def clear_draft():
+    save_draft({})
+
+
+# ------------------- Speculative drafts -------------------
+# Drafts pre-generated in the background (one per prospect), waiting for the
+# user to open them. Always kept in the cache backend with a TTL.
+def save_speculative_draft(email: str, data: dict):
+    get_backend().set(scoped(SPECULATIVE_PREFIX + email.lower()), dehydrate(data), SPECULATIVE_DRAFT_TTL)
+
+
+def discard_speculative_draft(email: str):
+    get_backend().delete(scoped(SPECULATIVE_PREFIX + email.lower()))
+
+
+def take_speculative_draft(email: str, prospect: dict | None = None) -> dict | None:
+    """
+    Pop the speculative draft for email, if any. When prospect details are
+    given, a draft generated for different (non-empty) details is ignored.
+    """
+    key = scoped(SPECULATIVE_PREFIX + email.lower())
+    backend = get_backend()
+    data = backend.get(key)
+    if not data:
+        return None
+    stored = data.get("prospect") or {}
+    if prospect and any(v and v != stored.get(k) for k, v in prospect.items() if k != "email"):
+        return None
+    backend.delete(key)
+    return rehydrate(data)
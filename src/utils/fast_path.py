@@ -0,0 +1,118 @@
+import re
+import threading
+from typing import Optional
+
+# ------------------- Template fast path -------------------
+# Deterministic cases answered locally instead of with an LLM round-trip:
+# - the prospect already has a confirmed meeting and their reply doesn't ask
+#   for anything else
+# - feedback that is one simple, mechanical edit ("shorten the subject")
+# Anything the rules don't fully cover returns None and goes to the LLM.
+
+# replies that need a real answer even when a meeting is booked
+NEEDS_LLM_PATTERN = re.compile(
+    r"\?|resched|reschedul|cancel|postpone|move|change|another time|different time|can't make|cannot make"
+    r"|won't be able|not available|unavailable|instead|price|cost|quote",
+    re.I
+)
+EMOJI_PATTERN = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0000FE0F\U0000200D\U00002B00-\U00002BFF]+"
+)
+SUBJECT_MAX_WORDS = 6
+
+
+class FastPathStats:
+    """Per-kind counts of requests answered by a template vs. the LLM."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, kind: str, fast: bool):
+        with self._lock:
+            counts = self._counts.setdefault(kind, {"fast": 0, "llm": 0})
+            counts["fast" if fast else "llm"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            kinds = {k: dict(v) for k, v in self._counts.items()}
+        fast = sum(v["fast"] for v in kinds.values())
+        total = fast + sum(v["llm"] for v in kinds.values())
+        for v in kinds.values():
+            n = v["fast"] + v["llm"]
+            v["fast_fraction"] = round(v["fast"] / n, 4) if n else 0.0
+        return {
+            "total": total,
+            "fast": fast,
+            "fast_fraction": round(fast / total, 4) if total else 0.0,
+            "by_kind": kinds
+        }
+
+
+stats = FastPathStats()
+
+
+# ------------------- Existing meeting -------------------
+def existing_meeting_draft(prospect: dict, existing_slot: str, current_mail: str,
+                           company_config: dict) -> Optional[dict]:
+    """
+    Subject/body telling the prospect their meeting is already booked, or
+    None when their reply asks for something (question, reschedule, ...).
+    """
+    if not existing_slot or NEEDS_LLM_PATTERN.search(current_mail or ""):
+        return None
+    name = (prospect.get("name") or "").split(" ")[0] or "there"
+    company = company_config.get("sender_company", "") or "us"
+    signature = company_config.get("signature", "")
+    body = (
+        f"Hi {name},\n\n"
+        f"Thanks for your message. Just a quick note that your meeting with {company} "
+        f"is already scheduled for {existing_slot}, so there is nothing else you need to do.\n\n"
+        "If that time no longer works for you, simply reply to this email and we will find another one.\n\n"
+        "Looking forward to speaking with you."
+    )
+    if signature:
+        body += f"\n\n{signature}"
+    return {"subject": f"Your meeting on {existing_slot} is confirmed", "body": body}
+
+
+# ------------------- Simple feedback -------------------
+def _shorten_subject(subject: str) -> str:
+    core = re.sub(r"^\s*((re|fwd?)\s*:\s*)+", "", subject, flags=re.I)
+    core = re.split(r"\s+[-–—|]\s+|:\s+|,\s+", core, maxsplit=1)[0]
+    words = core.split()
+    if len(words) > SUBJECT_MAX_WORDS:
+        core = " ".join(words[:SUBJECT_MAX_WORDS])
+    return core.strip(" .,;:-") or subject
+
+
+def _strip_emojis(text: str) -> str:
+    return re.sub(r"[ \t]{2,}", " ", EMOJI_PATTERN.sub("", text)).strip()
+
+
+# (pattern over the whole feedback, edit(subject, body, match) -> (subject, body))
+FEEDBACK_RULES = [
+    (re.compile(r"(make|keep)?\s*(the\s+)?subject\s+(line\s+)?(shorter|short|more concise)|"
+                r"(shorten|trim|cut)\s+(down\s+)?(the\s+)?subject(\s+line)?", re.I),
+     lambda s, b, m: (_shorten_subject(s), b)),
+    (re.compile(r"(change|set|update|replace)\s+(the\s+)?subject(\s+line)?\s+(to|with)\s*:?\s*(?P<new>.+)|"
+                r"subject\s*:\s*(?P<new2>.+)", re.I),
+     lambda s, b, m: ((m.group("new") or m.group("new2")).strip().strip("\"'“”"), b)),
+    (re.compile(r"(remove|drop|delete|no)\s+(all\s+)?(the\s+)?emojis?", re.I),
+     lambda s, b, m: (_strip_emojis(s), _strip_emojis(b))),
+    (re.compile(r"(capitali[sz]e|title[- ]case)\s+(the\s+)?subject(\s+line)?", re.I),
+     lambda s, b, m: (s.title(), b)),
+]
+
+
+def apply_simple_feedback(subject: str, body: str, feedback: str) -> Optional[dict]:
+    """{"subject", "body"} when feedback is exactly one known edit, else None."""
+    text = (feedback or "").strip().rstrip(".!")
+    if text.lower().startswith("please "):
+        text = text[7:]
+    for pattern, edit in FEEDBACK_RULES:
+        m = pattern.fullmatch(text)
+        if m:
+            new_subject, new_body = edit(subject, body, m)
+            return {"subject": new_subject, "body": new_body}
+    return None
@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+from openai import AsyncOpenAI
+
+from src.utils.rate_limiter import chat_completion, get_limiter
+from src.utils.clients import async_openai_client
+from src.utils.tracing import span
+from src.utils.tenants import current_tenant, use_tenant
+
+# ------------------- Config -------------------
+# Hedged chat completions: if the first request hasn't answered after the
+# hedge delay, an identical second one is fired; the first to finish wins and
+# the other is cancelled. Off unless LLM_HEDGE=true.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "0"))  # 0 = observed percentile below
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))  # max extra requests per request
+DEFAULT_HEDGE_DELAY_SECONDS = 3.0  # until enough latencies are observed
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 500
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------- Stats -------------------
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_skipped = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self) -> float:
+        if LLM_HEDGE_DELAY_MS > 0:
+            return LLM_HEDGE_DELAY_MS / 1000.0
+        if len(self.latencies) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY_SECONDS
+        return self.percentile(LLM_HEDGE_PERCENTILE)
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_result(self, latency: float, hedge_won: bool = False):
+        with self._lock:
+            self.latencies.append(latency)
+            self.hedge_wins += hedge_won
+
+    def try_spend_hedge(self) -> bool:
+        """Allow a hedge while hedges stay within LLM_HEDGE_BUDGET of requests (+1 burst)."""
+        with self._lock:
+            if self.hedges + 1 > LLM_HEDGE_BUDGET * self.requests + 1:
+                self.budget_skipped += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def snapshot(self) -> dict:
+        p = {f"p{int(q * 100)}_seconds": self.percentile(q) for q in (0.5, 0.9, 0.99)}
+        delay = self.hedge_delay()
+        with self._lock:
+            return dict(
+                enabled=LLM_HEDGE,
+                requests=self.requests,
+                hedges=self.hedges,
+                hedge_wins=self.hedge_wins,
+                hedge_win_rate=round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+                hedge_fraction=round(self.hedges / self.requests, 4) if self.requests else 0.0,
+                budget_skipped=self.budget_skipped,
+                hedge_delay_seconds=delay,
+                **p
+            )
+
+
+stats = HedgeStats()
+
+
+# ------------------- Event loop -------------------
+# One background loop owns the AsyncOpenAI client (and its connection pool);
+# sync callers hand it coroutines and block on the result.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_aclients = {}
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-hedging", daemon=True).start()
+        return _loop
+
+
+def _async_client(client) -> AsyncOpenAI:
+    # same credentials/endpoint as the sync client; only touched on the loop thread
+    key = (client.api_key, str(client.base_url))
+    if key not in _aclients:
+        _aclients[key] = async_openai_client(client)
+    return _aclients[key]
+
+
+async def _timed(aclient, kwargs):
+    started = time.monotonic()
+    response = await get_limiter().achat_completion(aclient, **kwargs)
+    return response, time.monotonic() - started
+
+
+async def _race(client, kwargs, tenant):
+    # the caller's tenant, so the "openai" breaker is the caller's too
+    with use_tenant(tenant):
+        return await _race_as_tenant(client, kwargs)
+
+
+async def _race_as_tenant(client, kwargs):
+    aclient = _async_client(client)
+    stats.record_request()
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_timed(aclient, kwargs))
+    done, _ = await asyncio.wait({primary}, timeout=stats.hedge_delay())
+    if done or not stats.try_spend_hedge():
+        response, latency = await primary
+        stats.record_result(latency)
+        return response
+
+    logger.info("LLM request slower than %.2fs, sending hedge", stats.hedge_delay())
+    hedge = asyncio.ensure_future(_timed(aclient, kwargs))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()  # the other one may still succeed
+                    continue
+                response, _ = task.result()
+                # what the caller waited, from the primary's start (a winning
+                # hedge's own run time would drag the hedge delay down)
+                stats.record_result(time.monotonic() - started, hedge_won=task is hedge)
+                return response
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def hedged_chat_completion(client, **kwargs):
+    """
+    chat_completion with request hedging when LLM_HEDGE is on; otherwise the
+    plain rate-limited call. Blocks the calling thread either way.
+    """
+    if not LLM_HEDGE:
+        started = time.monotonic()
+        response = chat_completion(client, **kwargs)
+        stats.record_request()
+        stats.record_result(time.monotonic() - started)
+        return response
+    # the race runs on the hedging loop's thread, outside this request's trace
+    with span("openai.chat", model=kwargs.get("model", ""), hedged=True):
+        return asyncio.run_coroutine_threadsafe(_race(client, kwargs, current_tenant()), _get_loop()).result()
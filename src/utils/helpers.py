@@ -2,12 +2,22 @@ import os
 import json
 import yaml
 import logging
-from typing import Any
+import tempfile
+import contextlib
+from typing import Any, Callable
+
+from src.utils.tracing import span, install_log_correlation
+
+try:
+    import fcntl
+except ImportError:  # Windows: atomic rename only, no cross-process lock
+    fcntl = None
 
 def setup_logging(log_file: str = "app.log"):
+    install_log_correlation()
     logging.basicConfig(
         level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
+        format="%(asctime)s [%(levelname)s] [%(trace_id)s] %(message)s",
         handlers=[
             logging.FileHandler(log_file),
             logging.StreamHandler()
@@ -26,13 +36,55 @@ def load_json(path: str, default=None) -> Any:
             return default if default is not None else []
     return default if default is not None else []
 
-def save_json(path: str, data: Any):
+@contextlib.contextmanager
+def file_lock(path: str):
+    """Exclusive cross-process lock on <path>.lock (held for the with-block)."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+def _write_json_atomic(path: str, data: Any):
+    # write a temp file next to the target, then rename over it, so readers
+    # never see a half-written file
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=folder)
     try:
-        with open(path, "w", encoding="utf-8") as f:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+def save_json(path: str, data: Any):
+    try:
+        with span("file.write", path=os.path.basename(path)), file_lock(path):
+            _write_json_atomic(path, data)
     except Exception as e:
         logging.error(f"Error saving {path}: {e}")
 
+def update_json(path: str, fn: Callable[[Any], Any], default=None) -> Any:
+    """
+    Read-modify-write a JSON file under the file lock, so concurrent workers
+    don't lose each other's updates. fn receives the current value and
+    returns the new one.
+    """
+    with span("file.update", path=os.path.basename(path)), file_lock(path):
+        data = fn(load_json(path, default))
+        _write_json_atomic(path, data)
+    return data
+
 def load_config(path: str) -> dict:
     if not os.path.exists(path):
         return {}
@@ -0,0 +1,241 @@
+import io
+import os
+import csv
+import json
+import argparse
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional
+
+from src.utils.helpers import load_json, save_json
+from src.utils.history_store import iter_history
+from src.utils.blob_store import get_blob, is_ref
+from src.utils.tenants import data_path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV export only
+    pa = pq = None
+
+# ------------------- Config -------------------
+# Flattened, columnar export of history for analytics. Records are streamed
+# from history.json and converted EXPORT_CHUNK_ROWS at a time (one Arrow
+# record batch / Parquet row group / CSV chunk each), so memory stays bounded
+# by the chunk size. Blob fields are only read for the columns asked for.
+# `since` exports records sent strictly after a sent_at watermark.
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "exports")
+WATERMARK_FILE = os.path.join(EXPORT_DIR, "watermark.json")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+FORMATS = ("csv", "arrow", "parquet")
+
+
+# ------------------- Columns -------------------
+def _draft(rec: dict) -> dict:
+    return rec.get("draft") or {}
+
+
+def _prospect(rec: dict) -> dict:
+    return rec.get("prospect") or {}
+
+
+def _slot_texts(slots) -> str:
+    return "; ".join(s.get("readable", "") if isinstance(s, dict) else str(s) for s in (slots or []))
+
+
+# name -> (type, blob fields it needs, extractor)
+COLUMNS = {
+    "sent_at": ("timestamp", (), lambda r: r.get("sent_at")),
+    "prospect_email": ("string", (), lambda r: (_prospect(r).get("email") or _draft(r).get("email") or "").lower()),
+    "prospect_name": ("string", (), lambda r: _prospect(r).get("name", "")),
+    "prospect_role": ("string", (), lambda r: _prospect(r).get("role", "")),
+    "prospect_industry": ("string", (), lambda r: _prospect(r).get("industry", "")),
+    "subject": ("string", (), lambda r: _draft(r).get("subject", "")),
+    "body": ("string", (), lambda r: _draft(r).get("body", "")),
+    "slot_status": ("string", (), lambda r: _draft(r).get("slot_status", "")),
+    "final_slot": ("string", (), lambda r: _draft(r).get("final_slot") or ""),
+    "final_slot_id": ("string", (), lambda r: _draft(r).get("final_slot_id") or ""),
+    "offered_slots": ("string", (), lambda r: _slot_texts(_draft(r).get("slots"))),
+    "offered_slot_count": ("int", (), lambda r: len(_draft(r).get("slots") or [])),
+    "available_slot_count": ("int", ("available_slots",), lambda r: len(r.get("available_slots") or [])),
+    "has_confirmed_event": ("bool", ("upcoming_events",),
+                            lambda r: any(e.get("confirmed") for e in (r.get("upcoming_events") or []) if isinstance(e, dict))),
+    "current_mail": ("string", ("current_mail",), lambda r: r.get("current_mail") or ""),
+    "past_interaction": ("string", ("past_interaction",), lambda r: r.get("past_interaction") or ""),
+}
+# the two mail bodies are large; ask for them explicitly
+DEFAULT_COLUMNS = [c for c in COLUMNS if c not in ("current_mail", "past_interaction")]
+
+
+def resolve_columns(columns: Optional[List[str]]) -> List[str]:
+    """Requested columns in schema order; ValueError on unknown names."""
+    if not columns:
+        return list(DEFAULT_COLUMNS)
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)} (available: {', '.join(COLUMNS)})")
+    return [c for c in COLUMNS if c in columns]
+
+
+def parse_since(since: Optional[str]) -> Optional[datetime]:
+    """ValueError when since is not an ISO timestamp."""
+    return datetime.fromisoformat(since) if since else None
+
+
+# ------------------- Rows -------------------
+def _sent_at(rec: dict) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(rec["sent_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def iter_row_chunks(columns: List[str], since: Optional[datetime] = None,
+                    chunk_rows: int = EXPORT_CHUNK_ROWS, progress: Optional[dict] = None) -> Iterator[List[dict]]:
+    """
+    Flattened rows in chunks of chunk_rows. `progress` (if given) is updated
+    with the row count and the highest sent_at seen, i.e. the next watermark.
+    """
+    blob_fields = {f for c in columns for f in COLUMNS[c][1]}
+    progress = progress if progress is not None else {}
+    progress.setdefault("rows", 0)
+    progress.setdefault("watermark", since.isoformat() if since else None)
+    latest, chunk = since, []
+    for rec in iter_history(rehydrate_blobs=False):
+        sent_at = _sent_at(rec)
+        if since is not None and (sent_at is None or sent_at <= since):
+            continue
+        for field in blob_fields:
+            if is_ref(rec.get(field)):
+                try:
+                    rec[field] = get_blob(rec[field]["$blob"])
+                except FileNotFoundError:
+                    rec[field] = None
+        chunk.append({c: COLUMNS[c][2](rec) for c in columns})
+        if sent_at is not None and (latest is None or sent_at > latest):
+            latest, progress["watermark"] = sent_at, rec["sent_at"]
+        progress["rows"] += 1
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ------------------- CSV -------------------
+def iter_csv(columns: List[str], since: Optional[datetime] = None, progress: Optional[dict] = None) -> Iterator[bytes]:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=columns)
+    writer.writeheader()
+    yield out.getvalue().encode("utf-8")
+    for chunk in iter_row_chunks(columns, since, progress=progress):
+        out.seek(0)
+        out.truncate()
+        writer.writerows(chunk)
+        yield out.getvalue().encode("utf-8")
+
+
+# ------------------- Arrow / Parquet -------------------
+def _require_arrow():
+    if pa is None:
+        raise RuntimeError("Arrow/Parquet export needs pyarrow (pip install pyarrow); use format=csv")
+
+
+def arrow_schema(columns: List[str]):
+    _require_arrow()
+    types = {"string": pa.string(), "int": pa.int32(), "bool": pa.bool_(), "timestamp": pa.timestamp("us")}
+    return pa.schema([(c, types[COLUMNS[c][0]]) for c in columns])
+
+
+def _record_batch(schema, rows: List[dict]):
+    arrays = []
+    for field in schema:
+        values = [row[field.name] for row in rows]
+        if pa.types.is_timestamp(field.type):
+            values = [datetime.fromisoformat(v) if v else None for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object whose bytes are drained after each batch."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def iter_arrow(columns: List[str], since: Optional[datetime] = None, progress: Optional[dict] = None) -> Iterator[bytes]:
+    """Arrow IPC stream, one record batch per chunk."""
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.drain()
+        for chunk in iter_row_chunks(columns, since, progress=progress):
+            writer.write_batch(_record_batch(schema, chunk))
+            yield sink.drain()
+    yield sink.drain()  # end-of-stream marker
+
+
+def write_parquet(path: str, columns: List[str], since: Optional[datetime] = None,
+                  progress: Optional[dict] = None) -> dict:
+    """Parquet file with one row group per chunk (zstd); returns progress."""
+    schema = arrow_schema(columns)
+    progress = progress if progress is not None else {}
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in iter_row_chunks(columns, since, progress=progress):
+            writer.write_batch(_record_batch(schema, chunk))
+    return progress
+
+
+def write_export(path: str, fmt: str, columns: List[str], since: Optional[datetime] = None) -> dict:
+    """Export to a file in any of FORMATS; returns {"rows", "watermark"}."""
+    progress = {}
+    if fmt == "parquet":
+        return write_parquet(path, columns, since, progress)
+    chunks: Callable = iter_arrow if fmt == "arrow" else iter_csv
+    with open(path, "wb") as f:
+        for data in chunks(columns, since, progress):
+            f.write(data)
+    return progress
+
+
+# ------------------- CLI -------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export history as flattened columns (csv, arrow or parquet).")
+    parser.add_argument("--format", choices=FORMATS, default="parquet" if pa is not None else "csv")
+    parser.add_argument("--out", help="output file (default: data/exports/history-<time>.<format>)")
+    parser.add_argument("--columns", help=f"comma-separated subset of: {', '.join(COLUMNS)}")
+    parser.add_argument("--since", help="only records sent after this ISO timestamp")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"continue from (and advance) the watermark in {data_path(WATERMARK_FILE)}")
+    args = parser.parse_args(argv)
+
+    columns = resolve_columns(args.columns.split(",") if args.columns else None)
+    since = args.since
+    if args.incremental and not since:
+        since = load_json(data_path(WATERMARK_FILE), {}).get("sent_at")
+    out = args.out or os.path.join(data_path(EXPORT_DIR), f"history-{datetime.now().strftime('%Y%m%dT%H%M%S')}.{args.format}")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+
+    result = write_export(out, args.format, columns, parse_since(since))
+    if args.incremental and result["watermark"]:
+        save_json(data_path(WATERMARK_FILE), {"sent_at": result["watermark"], "exported_at": datetime.now().isoformat()})
+    print(json.dumps({"file": out, "rows": result["rows"], "watermark": result["watermark"]}))
+
+
+if __name__ == "__main__":
+    main()
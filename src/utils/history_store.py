@@ -0,0 +1,113 @@
+import os
+import json
+import codecs
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from src.utils.helpers import load_json, update_json
+from src.utils.blob_store import dehydrate, rehydrate
+from src.utils.tenants import data_path
+
+# ------------------- History store -------------------
+# Sent drafts archived in data/history.json (a JSON list of draft records).
+# Mail bodies, slots and events are kept in the blob store and referenced by
+# hash, so repeated past-interaction text is stored once. Each tenant has its
+# own history file (see data_path).
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "history.json")
+
+
+def load_history(rehydrate_blobs: bool = True) -> List[dict]:
+    """
+    History records, oldest first. Pass rehydrate_blobs=False when only
+    prospect/draft/sent_at are needed; blob fields then stay references.
+    """
+    history = load_json(data_path(HISTORY_FILE), [])
+    if isinstance(history, dict):
+        history = [history]
+    return [rehydrate(rec) for rec in history] if rehydrate_blobs else history
+
+
+def iter_history(rehydrate_blobs: bool = True, chunk_size: int = 64 * 1024) -> Iterator[dict]:
+    """
+    Stream history records oldest first, decoding one record at a time from
+    the file instead of loading the whole list. Writers replace the file
+    atomically, so an iteration sees one consistent snapshot.
+    """
+    for _, _, rec in iter_history_from(0, chunk_size=chunk_size):
+        yield rehydrate(rec) if rehydrate_blobs else rec
+
+
+def iter_history_from(offset: int = 0, chunk_size: int = 64 * 1024) -> Iterator[Tuple[int, int, dict]]:
+    """
+    Stream raw history records from byte `offset` (0, or a record start seen
+    in an earlier pass) as (start, end, record) with byte offsets. Appends
+    keep earlier records at the same offsets, so a reader can resume where it
+    stopped. Raises ValueError when offset is not at a record boundary.
+    """
+    path = data_path(HISTORY_FILE)
+    if not os.path.exists(path):
+        return
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        buf, pos, in_list = "", 0, offset > 0
+        mark, mark_byte = 0, offset  # buf[mark] sits at byte mark_byte
+        while True:
+            chunk = f.read(chunk_size)
+            mark_byte += len(buf[mark:pos].encode("utf-8"))
+            buf, pos, mark = buf[pos:] + utf8.decode(chunk, final=not chunk), 0, 0
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(buf):
+                    break
+                if not in_list and buf[pos] == "[":
+                    in_list, pos = True, pos + 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    rec, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if not chunk:
+                        raise
+                    break  # record continues in the next chunk
+                start_byte = mark_byte + len(buf[mark:pos].encode("utf-8"))
+                mark_byte, mark, pos = start_byte + len(buf[pos:end].encode("utf-8")), end, end
+                yield start_byte, mark_byte, rec
+            if not chunk:
+                return
+
+
+def history_page(offset: int = 0, limit: int | None = None, newest_first: bool = False) -> Tuple[int, List[dict]]:
+    """(total records, one page of records); only the page is rehydrated."""
+    history = load_history(rehydrate_blobs=False)
+    if newest_first:
+        history = history[::-1]
+    page = history[offset:offset + limit if limit is not None else None]
+    return len(history), [rehydrate(rec) for rec in page]
+
+
+def append_history(records: List[dict]):
+    """Stamp sent_at on each record and append them in one locked write."""
+    def _append(history):
+        if isinstance(history, dict):
+            history = [history]
+        for full_data in records:
+            full_data["sent_at"] = datetime.now().isoformat()
+            history.append(dehydrate(full_data))
+        return history
+
+    # locked read-modify-write so concurrent workers don't drop entries
+    update_json(data_path(HISTORY_FILE), _append, [])
+
+
+def known_prospects() -> Dict[str, dict]:
+    """{prospect email (lowercase): latest prospect details} from history."""
+    prospects = {}
+    for rec in load_history(rehydrate_blobs=False):
+        prospect = rec.get("prospect") or {}
+        if prospect.get("email"):
+            prospects[prospect["email"].lower()] = prospect
+    return prospects
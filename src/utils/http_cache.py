@@ -0,0 +1,80 @@
+import os
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+# ------------------- Config -------------------
+# Assets under /static are referenced with a ?v=<content hash> query, so they
+# can be cached for a year; index.html and API data are revalidated with
+# ETag / Last-Modified and answered with 304 when unchanged.
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+
+try:
+    from fastapi.responses import ORJSONResponse
+    import orjson  # noqa: F401  (ORJSONResponse needs it at render time)
+    FastJSONResponse = ORJSONResponse
+except ImportError:  # falls back to the stdlib encoder
+    from fastapi.responses import JSONResponse as FastJSONResponse
+
+
+# ------------------- Validators -------------------
+def file_validators(path: str) -> tuple[str, str]:
+    """Weak ETag and Last-Modified for a file, from its size and mtime (no read)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 'W/"empty"', formatdate(0, usegmt=True)
+    return f'W/"{st.st_size:x}-{st.st_mtime_ns:x}"', formatdate(st.st_mtime, usegmt=True)
+
+
+def content_etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[str] = None) -> bool:
+    """Conditional GET check; If-None-Match wins over If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified_response(etag: str, last_modified: Optional[str] = None, cache_control: str = "no-cache") -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return Response(status_code=304, headers=headers)
+
+
+# ------------------- Static assets -------------------
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles (which already does ETag/Last-Modified + 304) with long-lived Cache-Control."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        return response
+
+
+def versioned_html(html: str, static_dir: str, prefix: str = "/static/") -> str:
+    """Append ?v=<content hash> to every asset under static_dir referenced in html."""
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                version = hashlib.sha256(f.read()).hexdigest()[:10]
+            for quote in ('"', "'"):
+                html = html.replace(f"{quote}{prefix}{rel}{quote}", f"{quote}{prefix}{rel}?v={version}{quote}")
+    return html
@@ -0,0 +1,170 @@
+import io
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import functools
+import contextvars
+from datetime import datetime
+from typing import List, Optional
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # deterministic cProfile only
+    SamplingProfiler = None
+
+# ------------------- Config -------------------
+# Opt-in per request with an "X-Profile: 1" header, or for every request with
+# PROFILE_REQUESTS=true. Routes decorated with @profiled then run under
+# cProfile (or pyinstrument's sampling profiler with PROFILER=sampling) and
+# the result is stored in data/profiles/<id>.{prof|html,txt,json}. When
+# profiling isn't requested the decorator costs one contextvar lookup.
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "profiles")
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILER = os.getenv("PROFILER", "cprofile").lower()  # cprofile | sampling
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_HEADER = b"x-profile"
+TOP_FUNCTIONS = 40
+
+# per-request holder {"ids": [...]}, set by ProfilingMiddleware
+_request: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("profile_request", default=None)
+
+
+# ------------------- Middleware -------------------
+class ProfilingMiddleware:
+    """Marks requests for profiling and returns profile ids in X-Profile-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        flag = dict(scope.get("headers") or []).get(PROFILE_HEADER)
+        if not (PROFILE_REQUESTS or (flag is not None and flag.lower() not in (b"0", b"false", b"no"))):
+            return await self.app(scope, receive, send)
+
+        holder = {"ids": []}
+        token = _request.set(holder)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start" and holder["ids"]:
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-profile-id", ",".join(holder["ids"]).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request.reset(token)
+
+
+# ------------------- Decorator -------------------
+def profiled(name: str):
+    """Profile the (sync) route when the current request asked for it."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            holder = _request.get()
+            if holder is None:
+                return fn(*args, **kwargs)
+            profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{name}-{uuid.uuid4().hex[:6]}"
+            holder["ids"].append(profile_id)
+            started = time.perf_counter()
+            if PROFILER == "sampling" and SamplingProfiler is not None:
+                profiler = SamplingProfiler()
+                profiler.start()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    profiler.stop()
+                    _save_sampling(profile_id, name, profiler, time.perf_counter() - started)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                _save_cprofile(profile_id, name, profiler, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+# ------------------- Storage -------------------
+def _write_meta(profile_id: str, meta: dict):
+    with open(os.path.join(PROFILE_DIR, profile_id + ".json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    _prune()
+
+
+def _save_cprofile(profile_id: str, name: str, profiler: cProfile.Profile, seconds: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, profile_id + ".prof"))
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out).sort_stats("cumulative")
+    stats.print_stats(TOP_FUNCTIONS)
+    with open(os.path.join(PROFILE_DIR, profile_id + ".txt"), "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+    top = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:5]  # by own time
+    _write_meta(profile_id, {
+        "id": profile_id,
+        "route": name,
+        "profiler": "cprofile",
+        "seconds": round(seconds, 4),
+        "created_at": datetime.now().isoformat(),
+        "artifact": profile_id + ".prof",
+        "top_self_time": [
+            {"function": f"{os.path.basename(file)}:{line}({func})", "seconds": round(tt, 4), "calls": nc}
+            for (file, line, func), (cc, nc, tt, ct, callers) in top
+        ]
+    })
+
+
+def _save_sampling(profile_id: str, name: str, profiler, seconds: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, profile_id + ".html"), "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    with open(os.path.join(PROFILE_DIR, profile_id + ".txt"), "w", encoding="utf-8") as f:
+        f.write(profiler.output_text(unicode=True))
+    _write_meta(profile_id, {
+        "id": profile_id,
+        "route": name,
+        "profiler": "sampling",
+        "seconds": round(seconds, 4),
+        "created_at": datetime.now().isoformat(),
+        "artifact": profile_id + ".html"
+    })
+
+
+def _prune():
+    metas = sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith(".json")), reverse=True)
+    for old in metas[PROFILE_KEEP:]:
+        stem = old[:-len(".json")]
+        for ext in (".json", ".prof", ".html", ".txt"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stem + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 20) -> List[dict]:
+    """Most recent profiles first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for fname in sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith(".json")), reverse=True)[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, fname), encoding="utf-8") as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def profile_path(profile_id: str, ext: str) -> Optional[str]:
+    """Path of a stored artifact, or None (ids are validated against the directory)."""
+    if ext not in (".prof", ".html", ".txt") or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + ext)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,265 @@
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+from typing import Optional
+
+import openai
+
+from src.utils.circuit_breaker import get_breaker
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# ------------------- Config -------------------
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+try:
+    import tiktoken
+except ImportError:  # estimates fall back to ~4 chars per token
+    tiktoken = None
+
+
+# ------------------- Token estimate -------------------
+_encodings = {}
+
+
+def estimate_tokens(model: str, messages: list, max_tokens: Optional[int] = None) -> int:
+    """
+    Prompt tokens (tiktoken when available) plus the completion budget, which
+    is what the provider counts against tokens-per-minute up front.
+    """
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if tiktoken is not None:
+        enc = _encodings.get(model)
+        if enc is None:
+            try:
+                enc = tiktoken.encoding_for_model(model)
+            except KeyError:
+                enc = tiktoken.get_encoding("o200k_base")
+            _encodings[model] = enc
+        prompt_tokens = len(enc.encode(text))
+    else:
+        prompt_tokens = len(text) // 4
+    # ~4 tokens of chat framing per message
+    return prompt_tokens + 4 * len(messages) + (max_tokens or 256)
+
+
+# ------------------- Token bucket -------------------
+class TokenBucket:
+    """Refills `capacity` units per minute; acquire() blocks until enough are available."""
+
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float):
+        # a single request larger than the bucket is allowed once the bucket is full
+        amount = min(amount, self.capacity)
+        with self.cond:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                self.cond.wait((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float):
+        """Charge (positive) or refund (negative) units after the fact."""
+        with self.cond:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+            self.cond.notify_all()
+
+    def drain(self):
+        """Provider said we're over the limit: start refilling from empty."""
+        with self.cond:
+            self.tokens = 0
+            self.updated = time.monotonic()
+
+
+# ------------------- AIMD concurrency -------------------
+class AIMDConcurrency:
+    """
+    Concurrency cap that grows by ~1 per window of successes (additive
+    increase) and halves on every 429 (multiplicative decrease).
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit / 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            self.cond.notify_all()
+
+
+# ------------------- Limiter -------------------
+def _retry_after_seconds(err: Exception) -> Optional[float]:
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class OpenAILimiter:
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int, max_retries: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AIMDConcurrency(max_concurrency)
+        self.max_retries = max_retries
+
+    def _admit(self, estimate: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(estimate)
+        self.concurrency.acquire()
+
+    def _settle(self, response, estimate: int):
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self.tokens.adjust(usage.total_tokens - estimate)
+
+    def _retry_delay(self, err: Exception, attempt: int, max_retries: Optional[int] = None) -> Optional[float]:
+        """Backoff before the next attempt, or None when retries are exhausted."""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if isinstance(err, openai.RateLimitError):
+            self.requests.drain()
+        if attempt >= max_retries:
+            return None
+        delay = _retry_after_seconds(err)
+        if delay is None:
+            delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        logger.warning("OpenAI %s, retry %d/%d in %.2fs", type(err).__name__, attempt + 1, max_retries, delay)
+        return delay
+
+    def chat_completion(self, client, **kwargs):
+        """
+        client.chat.completions.create(**kwargs) within RPM/TPM budgets and the
+        adaptive concurrency cap. 429s, timeouts and 5xx are retried with
+        jittered exponential backoff, honoring Retry-After when sent. A call
+        whose retries are exhausted counts against the "openai" breaker.
+        """
+        estimate = estimate_tokens(kwargs.get("model", ""), kwargs.get("messages", []), kwargs.get("max_tokens"))
+        # the SDK's own retries would bypass the limiter
+        client = client.with_options(max_retries=0)
+        with span("openai.chat", model=kwargs.get("model", "")) as s, get_breaker("openai"):
+            response = self._create(client.chat.completions.create, estimate, kwargs)
+            usage = getattr(response, "usage", None)
+            s.set(total_tokens=getattr(usage, "total_tokens", None))
+            return response
+
+    def embeddings(self, client, max_retries: Optional[int] = None, **kwargs):
+        """
+        client.embeddings.create(**kwargs) under the same budgets, concurrency
+        cap and "openai" breaker as chat completions. max_retries overrides
+        the limiter's retry count (e.g. 0 on a request path).
+        """
+        texts = kwargs.get("input") or []
+        texts = [texts] if isinstance(texts, str) else texts
+        # prompt tokens only: embeddings have no completion
+        estimate = estimate_tokens(kwargs.get("model", ""), [{"content": t} for t in texts], max_tokens=1)
+        client = client.with_options(max_retries=0)
+        with span("openai.embeddings", model=kwargs.get("model", ""), inputs=len(texts)), get_breaker("openai"):
+            return self._create(client.embeddings.create, estimate, kwargs, max_retries)
+
+    def _create(self, create, estimate, kwargs, max_retries: Optional[int] = None):
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            self._admit(estimate)
+            throttled = False
+            try:
+                response = create(**kwargs)
+                self._settle(response, estimate)
+                return response
+            except RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                delay = self._retry_delay(e, attempt, max_retries)
+                if delay is None:
+                    raise
+            finally:
+                self.concurrency.release(throttled=throttled)
+            time.sleep(delay)
+
+    async def achat_completion(self, aclient, **kwargs):
+        """
+        Async twin of chat_completion for an AsyncOpenAI client, sharing the
+        same budgets. Safe to cancel: the request is aborted and its
+        concurrency slot released.
+        """
+        estimate = estimate_tokens(kwargs.get("model", ""), kwargs.get("messages", []), kwargs.get("max_tokens"))
+        aclient = aclient.with_options(max_retries=0)
+        with get_breaker("openai"):
+            return await self._achat_completion(aclient, estimate, kwargs)
+
+    async def _achat_completion(self, aclient, estimate, kwargs):
+        for attempt in range(self.max_retries + 1):
+            admit = asyncio.ensure_future(asyncio.to_thread(self._admit, estimate))
+            try:
+                await asyncio.shield(admit)
+            except asyncio.CancelledError:
+                # the blocking acquire still completes in its thread; give the slot back then
+                admit.add_done_callback(lambda t: t.exception() is None and self.concurrency.release())
+                raise
+            throttled = False
+            try:
+                response = await aclient.chat.completions.create(**kwargs)
+                self._settle(response, estimate)
+                return response
+            except RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.concurrency.release(throttled=throttled)
+            await asyncio.sleep(delay)
+
+
+_limiter = OpenAILimiter(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, OPENAI_MAX_CONCURRENCY, OPENAI_MAX_RETRIES)
+
+
+def get_limiter() -> OpenAILimiter:
+    return _limiter
+
+
+def chat_completion(client, **kwargs):
+    """Shared-limiter wrapper around client.chat.completions.create."""
+    return _limiter.chat_completion(client, **kwargs)
@@ -0,0 +1,68 @@
+import copy
+import json
+import functools
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from src.utils.tenants import scoped
+
+
+# ------------------- Single-flight -------------------
+# Concurrent calls with the same (operation, arguments) share one execution:
+# the first caller runs the function, the rest wait for its result. Calls
+# from different tenants never share a result.
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str], _Call] = {}
+
+    def do(self, key: Tuple[str, str], fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # followers get their own copy so nobody mutates a shared result
+            return copy.deepcopy(call.result)
+
+        try:
+            result = fn()
+            # snapshot before the leader's caller can mutate it
+            call.result = copy.deepcopy(result)
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+_group = SingleFlight()
+
+
+def flight_key(op: str, args: tuple, kwargs: dict) -> Tuple[str, str]:
+    return scoped(op), json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+def single_flight(op: str):
+    """Decorator: coalesce concurrent identical calls of the wrapped function."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return _group.do(flight_key(op, args, kwargs), lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,171 @@
+import os
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+from src.utils.helpers import load_json, save_json, update_json
+from src.utils.history_store import load_history
+from src.utils.tenants import data_path
+
+# ------------------- Outreach stats -------------------
+# Aggregates over history kept up to date as records are archived, so
+# /api/stats reads one small file instead of scanning history.json:
+#   data/stats.json           counts by day, slot_status, industry, prospect
+#                             status, and time-to-confirm sums
+#   data/stats_prospects.json per-prospect state the counters need (first
+#                             contact, latest status); only touched on write
+# Both live in the tenant's data directory.
+# `python -m src.utils.stats_store rebuild` recomputes both from history.
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+STATS_FILE = os.path.join(DATA_DIR, "stats.json")
+PROSPECTS_FILE = os.path.join(DATA_DIR, "stats_prospects.json")
+STATS_VERSION = 1
+
+
+def _empty_stats() -> dict:
+    return {
+        "version": STATS_VERSION,
+        "records": 0,
+        "updated_at": None,
+        "by_day": {},
+        "by_slot_status": {},
+        "by_industry": {},
+        "prospects": 0,
+        "prospects_confirmed": 0,
+        "prospects_by_status": {},
+        "time_to_confirm": {"count": 0, "total_seconds": 0.0}
+    }
+
+
+def _bump(counter: dict, key: str, n: int = 1):
+    counter[key] = counter.get(key, 0) + n
+    if counter[key] <= 0:
+        del counter[key]
+
+
+def _parse(ts: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(ts) if ts else None
+    except ValueError:
+        return None
+
+
+def _fold(stats: dict, prospects: dict, rec: dict):
+    """Add one history record to the aggregates."""
+    draft = rec.get("draft") or {}
+    prospect = rec.get("prospect") or {}
+    status = draft.get("slot_status") or "unknown"
+    industry = (prospect.get("industry") or "").strip().lower() or "unknown"
+    sent_at = rec.get("sent_at") or datetime.now().isoformat()
+    email = (prospect.get("email") or draft.get("email") or "").lower()
+
+    day = stats["by_day"].setdefault(sent_at[:10], {"sent": 0, "followups": 0, "by_slot_status": {}})
+    day["sent"] += 1
+    _bump(day["by_slot_status"], status)
+    _bump(stats["by_slot_status"], status)
+    _bump(stats["by_industry"], industry)
+    stats["records"] += 1
+
+    if not email:
+        return
+    entry = prospects.get(email)
+    if entry is None:
+        entry = prospects[email] = {"first_sent_at": sent_at, "status": None, "confirmed_at": None, "sends": 0}
+        stats["prospects"] += 1
+    elif entry["confirmed_at"] is None:
+        # another mail to someone who hasn't confirmed yet
+        day["followups"] += 1
+    entry["sends"] += 1
+
+    if entry["status"] is not None:
+        _bump(stats["prospects_by_status"], entry["status"], -1)
+    entry["status"] = status
+    _bump(stats["prospects_by_status"], status)
+
+    if status == "confirmed" and entry["confirmed_at"] is None:
+        entry["confirmed_at"] = sent_at
+        stats["prospects_confirmed"] += 1
+        first, confirmed = _parse(entry["first_sent_at"]), _parse(sent_at)
+        if first and confirmed:
+            stats["time_to_confirm"]["count"] += 1
+            stats["time_to_confirm"]["total_seconds"] += max(0.0, (confirmed - first).total_seconds())
+
+
+def _valid(stats) -> bool:
+    return isinstance(stats, dict) and stats.get("version") == STATS_VERSION
+
+
+def _rebuilt(_=None) -> dict:
+    """Aggregates recomputed from the full history; the caller holds the stats lock."""
+    stats, prospects = _empty_stats(), {}
+    for rec in load_history(rehydrate_blobs=False):
+        _fold(stats, prospects, rec)
+    stats["updated_at"] = datetime.now().isoformat()
+    save_json(data_path(PROSPECTS_FILE), prospects)
+    return stats
+
+
+def update_stats(records: List[dict]):
+    """
+    Fold newly archived records (with sent_at, already appended to history)
+    into the aggregates. Missing or outdated aggregates are rebuilt from the
+    full history instead, which includes these records.
+    """
+    def _apply(stats):
+        if not _valid(stats) or (stats["records"] and not os.path.exists(data_path(PROSPECTS_FILE))):
+            return _rebuilt()
+
+        def _apply_prospects(prospects):
+            prospects = prospects if isinstance(prospects, dict) else {}
+            for rec in records:
+                _fold(stats, prospects, rec)
+            return prospects
+
+        # lock order is always stats -> prospects
+        update_json(data_path(PROSPECTS_FILE), _apply_prospects, {})
+        stats["updated_at"] = datetime.now().isoformat()
+        return stats
+
+    update_json(data_path(STATS_FILE), _apply, {})
+
+
+def rebuild_stats() -> dict:
+    """Recompute the aggregates from the full history (after edits, or if they drifted)."""
+    # under the stats lock, so a concurrent update_stats isn't lost
+    return update_json(data_path(STATS_FILE), _rebuilt, {})
+
+
+def get_stats(days: Optional[int] = None) -> dict:
+    """
+    The precomputed aggregates plus a few derived values. `days` keeps only
+    the most recent days in by_day. Built on first use when missing.
+    """
+    stats = load_json(data_path(STATS_FILE), {})
+    if not _valid(stats):
+        stats = rebuild_stats()
+    by_day = stats["by_day"]
+    if days is not None:
+        by_day = {d: by_day[d] for d in sorted(by_day)[-days:]}
+    ttc = stats["time_to_confirm"]
+    confirmed = stats["prospects_confirmed"]
+    return {
+        "updated_at": stats["updated_at"],
+        "sent": stats["records"],
+        "prospects": stats["prospects"],
+        "prospects_confirmed": confirmed,
+        # contacted but never confirmed a slot: candidates for a follow-up
+        "followups_pending": stats["prospects"] - confirmed,
+        "confirm_rate": round(confirmed / stats["prospects"], 4) if stats["prospects"] else 0.0,
+        "mean_time_to_confirm_hours": round(ttc["total_seconds"] / ttc["count"] / 3600, 2) if ttc["count"] else None,
+        "by_slot_status": stats["by_slot_status"],
+        "by_industry": stats["by_industry"],
+        "prospects_by_status": stats["prospects_by_status"],
+        "by_day": dict(sorted(by_day.items()))
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m src.utils.stats_store rebuild")
+    result = rebuild_stats()
+    print(f"Rebuilt stats from {result['records']} history records")
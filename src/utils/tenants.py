@@ -0,0 +1,205 @@
+import os
+import json
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional, Union
+
+import yaml
+
+# ------------------- Config -------------------
+# Several clinics served by one deployment. TENANTS_FILE maps a tenant id to
+# its settings; a request picks its tenant with the X-Tenant header or a
+# /t/<tenant>/ path prefix, and the tenant travels with the request in a
+# contextvar. Stores, caches, circuit breakers, client pools and admission
+# quotas look it up there, so each tenant gets its own data directory, cache
+# keys, connections and draft-pipeline quota.
+#
+# Without a tenant (no header/prefix, no TENANTS_FILE) everything runs as the
+# "default" tenant, exactly as a single-clinic install: global env vars,
+# src/data and src/Calender_Services/calender_config.yaml. Scripts and
+# background workers run as TENANT (default "default").
+#
+#   tenants:
+#     clinic-a:
+#       env_prefix: CLINIC_A_      # CLINIC_A_IMAP_USER, CLINIC_A_SMTP_PASS, ...
+#       calendar_config: tenants/clinic-a/calender_config.yaml
+#       max_in_flight: 4           # draft pipelines at once (admission quota)
+#       max_queue: 32
+#       env:                       # plain settings, e.g. SENDER_COMPANY
+#         SENDER_COMPANY: Clinic A
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(ROOT_DIR, "src", "data")
+TENANTS_FILE = os.getenv("TENANTS_FILE", os.path.join(ROOT_DIR, "tenants.yaml"))
+TENANT_HEADER = "x-tenant"
+TENANT_PATH_PREFIX = "/t/"
+DEFAULT_TENANT = "default"
+# never taken from the global env for a named tenant: a tenant with missing
+# credentials fails instead of using another clinic's mailbox
+PRIVATE_SETTINGS = {"IMAP_USER", "IMAP_PASS", "SMTP_USER", "SMTP_PASS", "FROM_EMAIL"}
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownTenant(LookupError):
+    def __init__(self, tenant_id: str):
+        super().__init__(f"Unknown tenant: {tenant_id}")
+        self.tenant_id = tenant_id
+
+
+class Tenant:
+    def __init__(self, tenant_id: str, settings: Optional[dict] = None):
+        settings = settings or {}
+        self.id = tenant_id
+        self.is_default = tenant_id == DEFAULT_TENANT
+        self.env_prefix = settings.get("env_prefix", "")
+        self.env = {k: str(v) for k, v in (settings.get("env") or {}).items()}
+        self.calendar_config = self._path(settings.get("calendar_config"))
+        self.data_dir = self._path(settings.get("data_dir")) or (
+            DATA_DIR if self.is_default else os.path.join(DATA_DIR, "tenants", tenant_id))
+        self.max_in_flight = settings.get("max_in_flight")
+        self.max_queue = settings.get("max_queue")
+
+    @staticmethod
+    def _path(path: Optional[str]) -> Optional[str]:
+        return os.path.join(ROOT_DIR, path) if path else None
+
+    def setting(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """<env_prefix><name> from the environment, then `env:` in TENANTS_FILE, then the global env var."""
+        if self.env_prefix and os.getenv(self.env_prefix + name):
+            return os.getenv(self.env_prefix + name)
+        if name in self.env:
+            return self.env[name]
+        if not self.is_default and name in PRIVATE_SETTINGS:
+            return default
+        return os.getenv(name, default)
+
+    def scoped(self, name: str) -> str:
+        """Key/name scoped to this tenant (unchanged for the default tenant)."""
+        return name if self.is_default else f"tenant:{self.id}:{name}"
+
+    def __repr__(self):
+        return f"Tenant({self.id!r})"
+
+
+# ------------------- Registry -------------------
+_tenants: Optional[Dict[str, Tenant]] = None
+_tenants_lock = threading.Lock()
+
+
+def load_tenants() -> Dict[str, Tenant]:
+    """{tenant id: Tenant} from TENANTS_FILE (read once), always including "default"."""
+    global _tenants
+    if _tenants is None:
+        with _tenants_lock:
+            if _tenants is None:
+                config = {}
+                if os.path.exists(TENANTS_FILE):
+                    with open(TENANTS_FILE, encoding="utf-8") as f:
+                        config = (yaml.safe_load(f) or {}).get("tenants") or {}
+                tenants = {tid: Tenant(str(tid), settings) for tid, settings in config.items()}
+                tenants.setdefault(DEFAULT_TENANT, Tenant(DEFAULT_TENANT))
+                logger.info("Tenants: %s", ", ".join(sorted(tenants)))
+                _tenants = tenants
+    return _tenants
+
+
+def get_tenant(tenant_id: str) -> Tenant:
+    try:
+        return load_tenants()[tenant_id]
+    except KeyError:
+        raise UnknownTenant(tenant_id) from None
+
+
+def tenant_ids() -> list:
+    return sorted(load_tenants())
+
+
+# ------------------- Current tenant -------------------
+_current: contextvars.ContextVar[Optional[Tenant]] = contextvars.ContextVar("tenant", default=None)
+
+
+def current_tenant() -> Tenant:
+    """The request's tenant; outside a request the TENANT env var (default "default")."""
+    tenant = _current.get()
+    return tenant if tenant is not None else get_tenant(os.getenv("TENANT", DEFAULT_TENANT))
+
+
+@contextmanager
+def use_tenant(tenant: Union[str, Tenant]):
+    """Run the with-block as `tenant` (e.g. in a background worker)."""
+    token = _current.set(get_tenant(tenant) if isinstance(tenant, str) else tenant)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def tenant_setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    return current_tenant().setting(name, default)
+
+
+def scoped(name: str) -> str:
+    return current_tenant().scoped(name)
+
+
+def data_path(path: str) -> str:
+    """`path` under src/data, moved into the current tenant's data directory."""
+    tenant = current_tenant()
+    if tenant.data_dir == DATA_DIR:
+        return path
+    rel = os.path.relpath(path, DATA_DIR)
+    return path if rel.startswith(os.pardir) else os.path.join(tenant.data_dir, rel)
+
+
+# ------------------- ASGI middleware -------------------
+class TenantMiddleware:
+    """
+    Select the tenant from X-Tenant or a /t/<tenant>/ path prefix (stripped
+    before routing, so /t/clinic-a/api/history reaches /api/history).
+    Unknown tenants get a 404; responses vary on X-Tenant.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        header = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == TENANT_HEADER.encode()), None)
+        from_path = None
+        path = scope.get("path", "")
+        if path.startswith(TENANT_PATH_PREFIX):
+            from_path, _, rest = path[len(TENANT_PATH_PREFIX):].partition("/")
+            scope = dict(scope, path="/" + rest, raw_path=("/" + rest).encode())
+        tenant_id = from_path or header or None
+        if from_path and header and header != from_path:
+            return await self._reject(scope, send, 400, f"X-Tenant {header!r} does not match path tenant {from_path!r}")
+
+        try:
+            tenant = get_tenant(tenant_id) if tenant_id else None
+        except UnknownTenant as e:
+            return await self._reject(scope, send, 404, str(e))
+
+        async def send_vary(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"vary", b"X-Tenant")])
+            await send(message)
+
+        token = _current.set(tenant)
+        try:
+            await self.app(scope, receive, send_vary if scope["type"] == "http" else send)
+        finally:
+            _current.reset(token)
+
+    @staticmethod
+    async def _reject(scope, send, status: int, detail: str):
+        if scope["type"] != "http":
+            await send({"type": "websocket.close", "code": 1008})  # policy violation
+            return
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,361 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ------------------- Config -------------------
+# Lightweight request tracing. With TRACING=true every HTTP request gets a
+# trace id (taken from an incoming X-Trace-Id / traceparent header when sent,
+# returned in X-Trace-Id) and a root span; IMAP, Calendar, OpenAI, SMTP and
+# file-write calls made while serving it become child spans. Finished spans
+# go to the exporters named in TRACE_EXPORTER (comma-separated: jsonl, log,
+# none) plus an in-memory ring buffer used by the waterfall endpoint.
+TRACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "traces")
+TRACE_FILE = os.path.join(TRACE_DIR, "spans.jsonl")
+TRACING = os.getenv("TRACING", "false").lower() == "true"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_BUFFER_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", "5000"))
+TRACE_HEADER = b"x-trace-id"
+TRACEPARENT_HEADER = b"traceparent"
+
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+# ------------------- Spans -------------------
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attrs", "error", "thread", "_t0")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.error = None
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.end = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        # wall-clock start for ordering across processes, monotonic duration
+        self.end = self.start + (time.perf_counter() - self._t0)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "end": round(self.end, 6) if self.end is not None else None,
+            "duration_ms": round((self.end - self.start) * 1000, 3) if self.end is not None else None,
+            "thread": self.thread,
+            "attrs": self.attrs,
+            "error": self.error
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> Optional[str]:
+    s = _current.get()
+    return s.trace_id if s is not None else None
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attrs):
+    """
+    Time the with-block as a child of the current span (or as the root of a
+    new trace). Yields the span so attributes can be added with .set(...);
+    a no-op when tracing is off.
+    """
+    if not TRACING:
+        yield _NOOP
+        return
+    parent = _current.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    s = Span(name, trace_id or new_trace_id(), parent_id, attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        s.finish()
+        _current.reset(token)
+        _export(s.to_dict())
+
+
+def traced(name: str):
+    """Decorator form of span(name)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------- Exporters -------------------
+class SpanExporter:
+    """Receives every finished span as a dict. Must not raise."""
+
+    def export(self, span_dict: dict):
+        raise NotImplementedError
+
+
+class MemoryExporter(SpanExporter):
+    def __init__(self, max_spans: int):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, span_dict: dict):
+        self.spans.append(span_dict)
+
+
+class JsonlExporter(SpanExporter):
+    """One JSON line per span, appended to `path` (rotated to <path>.1 past max_bytes)."""
+
+    def __init__(self, path: str, max_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def export(self, span_dict: dict):
+        line = json.dumps(span_dict, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning("Span export to %s failed: %s", self.path, e)
+
+
+class LogExporter(SpanExporter):
+    def export(self, span_dict: dict):
+        logger.info("span %s %.1fms trace=%s%s", span_dict["name"], span_dict["duration_ms"],
+                    span_dict["trace_id"], f" error={span_dict['error']}" if span_dict["error"] else "")
+
+
+_memory = MemoryExporter(TRACE_BUFFER_SPANS)
+_exporters: List[SpanExporter] = [_memory]
+for _kind in (k.strip().lower() for k in TRACE_EXPORTER.split(",")):
+    if _kind == "jsonl":
+        _exporters.append(JsonlExporter(TRACE_FILE))
+    elif _kind == "log":
+        _exporters.append(LogExporter())
+    elif _kind not in ("", "none"):
+        logger.warning("Unknown TRACE_EXPORTER %r ignored", _kind)
+
+
+def register_exporter(exporter: SpanExporter):
+    """Add an exporter (e.g. one that forwards spans to a collector)."""
+    _exporters.append(exporter)
+
+
+def _export(span_dict: dict):
+    for exporter in _exporters:
+        try:
+            exporter.export(span_dict)
+        except Exception as e:
+            logger.warning("Span exporter %s failed: %s", type(exporter).__name__, e)
+
+
+# ------------------- Log correlation -------------------
+def install_log_correlation():
+    """Give every log record a trace_id attribute ("-" outside a trace) for %(trace_id)s."""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_traced", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.trace_id = current_trace_id() or "-"
+        return record
+
+    record_factory._traced = True
+    logging.setLogRecordFactory(record_factory)
+
+
+# ------------------- Middleware -------------------
+def _incoming_context(headers: dict):
+    trace_id = (headers.get(TRACE_HEADER) or b"").decode("latin-1").strip().lower()
+    if _TRACE_ID.match(trace_id):
+        return trace_id, None
+    m = _TRACEPARENT.match((headers.get(TRACEPARENT_HEADER) or b"").decode("latin-1").strip().lower())
+    if m:
+        return m.group(1), m.group(2)
+    return None, None
+
+
+class TracingMiddleware:
+    """Root span per HTTP request; the trace id is returned in X-Trace-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING:
+            return await self.app(scope, receive, send)
+        trace_id, parent_id = _incoming_context(dict(scope.get("headers") or []))
+        name = f"{scope.get('method', 'GET')} {scope.get('path', '')}"
+        with span(name, trace_id=trace_id, parent_id=parent_id, kind="http") as root:
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    root.set(status_code=message.get("status"))
+                    headers = list(message.get("headers") or [])
+                    headers.append((TRACE_HEADER, root.trace_id.encode()))
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+
+
+# ------------------- Waterfall -------------------
+def _scan_file(trace_id: str) -> List[dict]:
+    spans = []
+    for path in (TRACE_FILE + ".1", TRACE_FILE):
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if trace_id not in line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get("trace_id") == trace_id:
+                    spans.append(rec)
+    return spans
+
+
+def get_trace(trace_id: str) -> List[dict]:
+    """All spans of a trace: from memory when recent, else from the JSONL file."""
+    spans = [s for s in list(_memory.spans) if s["trace_id"] == trace_id]
+    return spans or _scan_file(trace_id)
+
+
+def recent_traces(limit: int = 20) -> List[dict]:
+    """Root spans of the most recent traces finished in this process, newest first."""
+    roots = [s for s in list(_memory.spans) if s["parent_id"] is None or s.get("attrs", {}).get("kind") == "http"]
+    roots.sort(key=lambda s: s["end"], reverse=True)
+    return [
+        {"trace_id": s["trace_id"], "name": s["name"], "start": s["start"],
+         "duration_ms": s["duration_ms"], "status_code": s["attrs"].get("status_code"), "error": s["error"]}
+        for s in roots[:limit]
+    ]
+
+
+def _critical_path(root: dict, children: dict) -> List[dict]:
+    """
+    Walk back from the root's end: the child that finished last before the
+    cursor was what the parent waited on; continue from that child's start.
+    Overlapping (parallel) siblings that finished earlier are off the path.
+    """
+    path = [root]
+    kids = sorted(children.get(root["span_id"], []), key=lambda s: s["end"], reverse=True)
+    cursor = root["end"]
+    chain = []
+    for kid in kids:
+        if kid["end"] <= cursor + 1e-6:
+            chain.append(kid)
+            cursor = kid["start"]
+    for kid in reversed(chain):
+        path.extend(_critical_path(kid, children))
+    return path
+
+
+def waterfall(trace_id: str) -> Optional[dict]:
+    """Spans of a trace ordered by start, with offsets/depth and the critical path."""
+    spans = [s for s in get_trace(trace_id) if s.get("end") is not None]
+    if not spans:
+        return None
+    ids = {s["span_id"] for s in spans}
+    children = {}
+    for s in spans:
+        children.setdefault(s["parent_id"], []).append(s)
+    roots = [s for s in spans if s["parent_id"] not in ids]
+    t0 = min(s["start"] for s in spans)
+    t1 = max(s["end"] for s in spans)
+
+    rows, critical = [], set()
+    for root in sorted(roots, key=lambda s: s["start"]):
+        critical.update(s["span_id"] for s in _critical_path(root, children))
+        stack = [(root, 0)]
+        while stack:
+            s, depth = stack.pop()
+            rows.append(dict(
+                s,
+                depth=depth,
+                offset_ms=round((s["start"] - t0) * 1000, 3),
+                critical=False
+            ))
+            for kid in sorted(children.get(s["span_id"], []), key=lambda k: k["start"], reverse=True):
+                stack.append((kid, depth + 1))
+    for row in rows:
+        row["critical"] = row["span_id"] in critical
+
+    by_name = {}
+    for row in rows:
+        if row["critical"] and row["depth"] > 0:
+            by_name[row["name"]] = round(by_name.get(row["name"], 0) + row["duration_ms"], 3)
+    return {
+        "trace_id": trace_id,
+        "duration_ms": round((t1 - t0) * 1000, 3),
+        "span_count": len(rows),
+        "critical_path": [r["name"] for r in rows if r["critical"]],
+        "critical_path_ms_by_name": dict(sorted(by_name.items(), key=lambda kv: kv[1], reverse=True)),
+        "spans": rows
+    }
+
+
+def render_waterfall(wf: dict, width: int = 60) -> str:
+    """Plain-text waterfall: one bar per span, critical-path spans marked with *."""
+    total = max(wf["duration_ms"], 1e-3)
+    lines = [f"trace {wf['trace_id']}  {wf['duration_ms']:.1f} ms  ({wf['span_count']} spans)"]
+    label_width = max(len("  " * r["depth"] + r["name"]) for r in wf["spans"]) + 2
+    for r in wf["spans"]:
+        left = int(r["offset_ms"] / total * width)
+        size = max(1, int(r["duration_ms"] / total * width))
+        bar = " " * left + ("#" if r["critical"] else "=") * min(size, width - left or 1)
+        label = ("  " * r["depth"] + r["name"]).ljust(label_width)
+        mark = "*" if r["critical"] else " "
+        err = "  !" + r["error"] if r.get("error") else ""
+        lines.append(f"{mark} {label}|{bar.ljust(width)}| {r['duration_ms']:9.1f} ms{err}")
+    return "\n".join(lines) + "\n"
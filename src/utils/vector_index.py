@@ -0,0 +1,222 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.utils.helpers import file_lock
+from src.utils.cache_backend import cached
+from src.utils.clients import tenant_openai_client
+from src.utils.rate_limiter import get_limiter
+from src.utils.circuit_breaker import CircuitOpenError, get_breaker
+from src.utils.tenants import current_tenant, data_path, use_tenant
+
+load_dotenv()
+
+# ------------------- Config -------------------
+# In-process embedding index over sent drafts: a float32 matrix of unit
+# vectors memory-mapped from data/embeddings/vectors.f32 (one row per draft,
+# appended incrementally) plus meta.jsonl with one line per row. One index
+# per tenant, in the tenant's data directory.
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "embeddings")
+VECTORS_FILE = os.path.join(INDEX_DIR, "vectors.f32")
+META_FILE = os.path.join(INDEX_DIR, "meta.jsonl")
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+EMBED_DIM = int(os.getenv("EMBED_DIM", "1536"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "86400"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "10"))
+# the query embedding is a remote call on the draft path; past this many
+# seconds the draft goes ahead without examples
+FEW_SHOT_TIMEOUT = float(os.getenv("FEW_SHOT_TIMEOUT", "1.5"))
+FEW_SHOT_WORKERS = 4
+# drafts that led to a booking rank slightly higher
+SUCCESS_BONUS = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return (mat / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def embed_texts(texts: List[str], max_retries: Optional[int] = None) -> np.ndarray:
+    """
+    Embed texts EMBED_BATCH_SIZE at a time through the shared limiter and the
+    "openai" breaker; returns unit rows (n, EMBED_DIM).
+    """
+    client = tenant_openai_client().with_options(max_retries=0, timeout=EMBED_TIMEOUT)
+    rows = []
+    for i in range(0, len(texts), EMBED_BATCH_SIZE):
+        resp = get_limiter().embeddings(client, max_retries=max_retries, model=EMBED_MODEL,
+                                        input=texts[i:i + EMBED_BATCH_SIZE], dimensions=EMBED_DIM)
+        rows.extend(d.embedding for d in sorted(resp.data, key=lambda d: d.index))
+    return _normalize(np.asarray(rows, dtype=np.float32).reshape(-1, EMBED_DIM))
+
+
+@cached("embed:query", QUERY_EMBED_CACHE_TTL)
+def _query_embedding(text: str) -> list:
+    # on the draft path: one attempt, no backoff
+    return embed_texts([text], max_retries=0)[0].tolist()
+
+
+# ------------------- Index -------------------
+class VectorIndex:
+    def __init__(self, index_dir: str = INDEX_DIR):
+        self.index_dir = index_dir
+        self.vectors_file = os.path.join(index_dir, os.path.basename(VECTORS_FILE))
+        self.meta_file = os.path.join(index_dir, os.path.basename(META_FILE))
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._meta: List[dict] = []
+        self._hashes: set = set()
+        self._size = -1  # vectors file size the current mapping was built from
+
+    def _refresh(self):
+        """(Re)map the matrix if another thread or worker appended rows."""
+        size = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+        if size == self._size:
+            return
+        rows = size // (EMBED_DIM * 4)
+        meta = []
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, encoding="utf-8") as f:
+                meta = [json.loads(line) for line in f if line.strip()]
+        rows = min(rows, len(meta))  # ignore a row whose meta line isn't written yet
+        self._matrix = (np.memmap(self.vectors_file, dtype=np.float32, mode="r", shape=(rows, EMBED_DIM))
+                        if rows else np.zeros((0, EMBED_DIM), dtype=np.float32))
+        self._meta = meta[:rows]
+        self._hashes = {m["hash"] for m in self._meta}
+        self._size = size
+
+    def add_records(self, records: List[dict]) -> int:
+        """Embed and append sent drafts from history records not indexed yet."""
+        with self._lock:
+            self._refresh()
+            docs, seen = [], set()
+            for rec in records:
+                draft = rec.get("draft") or {}
+                text = f"{draft.get('subject', '')}\n{draft.get('body', '')}".strip()
+                if not draft.get("body"):
+                    continue
+                h = content_hash(text)
+                if h in self._hashes or h in seen:
+                    continue
+                seen.add(h)
+                docs.append((h, text, draft, rec))
+            if not docs:
+                return 0
+
+            vectors = embed_texts([text for _, text, _, _ in docs])
+            os.makedirs(self.index_dir, exist_ok=True)
+            with file_lock(self.vectors_file):
+                # meta first: a vector row only counts once its meta line exists
+                with open(self.meta_file, "a", encoding="utf-8") as f:
+                    for h, _, draft, rec in docs:
+                        f.write(json.dumps({
+                            "hash": h,
+                            "email": draft.get("email", ""),
+                            "subject": draft.get("subject", ""),
+                            "body": draft.get("body", ""),
+                            "slot_status": draft.get("slot_status", ""),
+                            "sent_at": rec.get("sent_at", "")
+                        }, ensure_ascii=False) + "\n")
+                with open(self.vectors_file, "ab") as f:
+                    f.write(vectors.tobytes())
+            self._size = -1
+            return len(docs)
+
+    def search(self, text: str, k: int = 3, exclude_email: str = "") -> List[dict]:
+        """Top-k most similar indexed drafts (cosine), best first."""
+        with self._lock:
+            self._refresh()
+            matrix, meta = self._matrix, self._meta
+        if matrix is None or not len(meta) or not text.strip():
+            return []
+
+        q = np.asarray(_query_embedding(text), dtype=np.float32)
+        scores = matrix @ q
+        scores = scores + SUCCESS_BONUS * np.fromiter(
+            (m["slot_status"] == "confirmed" for m in meta), dtype=np.float32, count=len(meta)
+        )
+        if exclude_email:
+            mask = np.fromiter((m["email"].lower() == exclude_email.lower() for m in meta), dtype=bool, count=len(meta))
+            scores[mask] = -np.inf
+
+        k = min(k, len(meta))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(meta[i], score=float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+_indexes: Dict[str, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index() -> VectorIndex:
+    """The current tenant's index."""
+    tenant_id = current_tenant().id
+    with _indexes_lock:
+        if tenant_id not in _indexes:
+            _indexes[tenant_id] = VectorIndex(data_path(INDEX_DIR))
+        return _indexes[tenant_id]
+
+
+def index_records_async(records: List[dict]):
+    """Index freshly archived drafts off the request path."""
+    tenant, index = current_tenant(), get_index()
+
+    def _run():
+        try:
+            with use_tenant(tenant):
+                index.add_records(records)
+        except Exception as e:
+            logger.warning("Indexing sent drafts failed: %s", e)
+    threading.Thread(target=_run, name="vector-index", daemon=True).start()
+
+
+_lookup_pool = ThreadPoolExecutor(max_workers=FEW_SHOT_WORKERS, thread_name_prefix="few-shot")
+
+
+def retrieve_examples(query: str, k: int = 2, exclude_email: str = "",
+                      timeout: float = FEW_SHOT_TIMEOUT) -> List[dict]:
+    """
+    Most similar past sent emails as few-shot examples: [{"subject", "body"}].
+    Time-boxed to `timeout` seconds: a slow query embedding returns no
+    examples, and finishes in the background so the next lookup hits the cache.
+    Returns no examples right away while the "openai" breaker is open.
+    """
+    if get_breaker("openai").status()["retry_in_seconds"] > 0:
+        return []  # OpenAI is known to be down; don't wait on it
+    tenant, index = current_tenant(), get_index()
+
+    def _search():
+        with use_tenant(tenant):
+            return index.search(query, k=k, exclude_email=exclude_email)
+
+    try:
+        matches = _lookup_pool.submit(_search).result(timeout=timeout)
+    except FuturesTimeout:
+        logger.info("Few-shot lookup slower than %.1fs, drafting without examples", timeout)
+        return []
+    except CircuitOpenError:
+        return []
+    return [{"subject": m["subject"], "body": m["body"]} for m in matches]
+
+
+if __name__ == "__main__":
+    # Backfill: python -m src.utils.vector_index
+    from src.utils.history_store import load_history
+    logging.basicConfig(level=logging.INFO)
+    print("Indexed", get_index().add_records(load_history(rehydrate_blobs=False)), "new drafts")
@@ -0,0 +1,212 @@
+(function(){
+  const backendInput = document.getElementById('backend-url')
+  function backend(){ return backendInput.value.trim().replace(/\/+$/, '') || 'http://localhost:8000' }
+
+  const S = {
+    email: document.getElementById('input-email'),
+    name: document.getElementById('input-name'),
+    role: document.getElementById('input-role'),
+    industry: document.getElementById('input-industry'),
+    btnGenerate: document.getElementById('btn-generate'),
+    btnHistory: document.getElementById('btn-history'),
+    btnUpdate: document.getElementById('btn-update'),
+    btnSend: document.getElementById('btn-send'),
+    feedback: document.getElementById('input-feedback'),
+    subjectField: document.getElementById('subject-field'),
+    bodyField: document.getElementById('body-field'),
+    currentMail: document.getElementById('current-mail'),
+    pastInteraction: document.getElementById('past-interaction'),
+    slotStatus: document.getElementById('slot-status'),
+    statusLine: document.getElementById('status-line')
+  }
+
+  let draftData = null
+
+  function setStatus(msg, isError=false){
+    S.statusLine.textContent = 'Status: ' + msg
+    S.statusLine.style.color = isError ? 'var(--danger)' : 'var(--muted)'
+  }
+
+  /* Button loading helper */
+  function setButtonLoading(btn, loading, label){
+    if(loading){
+      btn.dataset.orig = btn.innerHTML
+      btn.classList.add('btn-loading')
+      btn.disabled = true
+      btn.innerHTML = '<span class="spinner"></span>' + (label || btn.dataset.orig || 'Working...')
+    } else {
+      btn.disabled = false
+      btn.classList.remove('btn-loading')
+      if(btn.dataset.orig) btn.innerHTML = btn.dataset.orig
+    }
+  }
+
+  async function callApi(path, method='GET', body=null, timeout=30000){
+    const url = backend() + path
+    const opts = { method, headers: { 'Content-Type': 'application/json' } }
+    if(body !== null) opts.body = JSON.stringify(body)
+    try {
+      const controller = new AbortController()
+      const id = setTimeout(()=>controller.abort(), timeout)
+      opts.signal = controller.signal
+      const res = await fetch(url, opts)
+      clearTimeout(id)
+      const text = await res.text()
+      let json = null
+      try{ json = text ? JSON.parse(text) : null }catch(e){}
+      return { ok: res.ok, status: res.status, text, json }
+    } catch(err){
+      return { ok: false, status: 0, text: String(err), json: null }
+    }
+  }
+
+  function renderDraftToUI(d){
+    draftData = d || {}
+    const draft = draftData && draftData.draft ? draftData.draft : draftData
+    S.subjectField.value = draft && draft.subject ? draft.subject : ''
+    S.bodyField.value = draft && draft.body ? draft.body : ''
+    const current = draftData.current_mail || draftData.currentMail || (draft && draft.current_mail) || ''
+    const past = draftData.past_interaction || draftData.pastInteraction || (draft && draft.past_interaction) || ''
+    const slot = draft && draft.slot_status ? draft.slot_status : (draftData && draftData.upcoming_events ? (Array.isArray(draftData.upcoming_events) && draftData.upcoming_events.find(e=>e.confirmed) ? 'confirmed' : 'no-confirm') : (draftData && draftData.slot_status) || '—')
+    S.currentMail.textContent = current ? (String(current).slice(0,300) + (String(current).length>300 ? ' ...' : '')) : 'No current mail loaded'
+    S.pastInteraction.textContent = past ? (String(past).slice(0,300) + (String(past).length>300 ? ' ...' : '')) : 'No past interaction'
+    S.slotStatus.textContent = slot || '—'
+  }
+
+  // Generate
+  S.btnGenerate.addEventListener('click', async ()=>{
+    const email = S.email.value.trim()
+    if(!email){ alert('Email required'); return }
+    setStatus('Generating draft...')
+    setButtonLoading(S.btnGenerate, true, 'Generating...')
+    try{
+      const payload = { email, name: S.name.value.trim(), role: S.role.value.trim(), industry: S.industry.value.trim() }
+      // same prospect already on screen: regenerate instead of reusing the cached draft
+      const shown = draftData && draftData.draft ? draftData.draft : null
+      const fresh = !!(shown && shown.email && shown.email.toLowerCase() === email.toLowerCase())
+      const res = await callApi('/api/generate-draft' + (fresh ? '?fresh=true' : ''), 'POST', payload, 45000)
+      if(res.ok){
+        const obj = res.json || (res.text ? JSON.parse(res.text) : null)
+        renderDraftToUI(obj || {})
+        setStatus('Draft loaded')
+      } else {
+        setStatus('Generate failed', true)
+        alert('Generate failed: ' + res.status + '\n' + (res.text || res.status))
+      }
+    }catch(e){
+      setStatus('Generate error', true)
+      alert('Generate error: ' + e)
+    } finally {
+      setButtonLoading(S.btnGenerate, false)
+    }
+  })
+
+  // Update (U)
+  S.btnUpdate.addEventListener('click', async ()=>{
+    if(!draftData){ alert('Generate a draft first'); return }
+    const feedback = S.feedback.value.trim()
+    if(!feedback){ if(!confirm('Send empty feedback? OK to proceed.')) return }
+    setStatus('Sending update (U) to backend...')
+    setButtonLoading(S.btnUpdate, true, 'Updating...')
+    try{
+      const res = await callApi('/api/act','POST',{ decision: 'U', feedback }, 45000)
+      if(res.ok){
+        const j = res.json || (res.text ? JSON.parse(res.text) : null)
+        if(j){
+          const newDraft = j.draft || j
+          renderDraftToUI(newDraft || {})
+          setStatus('Draft updated and UI refreshed')
+        } else {
+          setStatus('Updated but non-JSON response', true)
+          alert('Update succeeded but server returned non-JSON')
+        }
+      } else {
+        setStatus('Update failed', true)
+        alert('Update failed: ' + res.status + '\n' + (res.text || res.status))
+      }
+    }catch(e){
+      setStatus('Update error', true)
+      alert('Update error: ' + e)
+    } finally {
+      setButtonLoading(S.btnUpdate, false)
+    }
+  })
+
+  // Send (A)
+  S.btnSend.addEventListener('click', async ()=>{
+    if(!draftData){ alert('Generate a draft first'); return }
+    setStatus('Sending approval (A)...')
+    setButtonLoading(S.btnSend, true, 'Sending...')
+    try{
+      const res = await callApi('/api/act','POST',{ decision: 'A', feedback: null }, 90000)
+      if(res.ok){
+        setStatus('Send completed (server success)')
+        const j = res.json || (res.text ? JSON.parse(res.text) : null)
+        if(j){
+          renderDraftToUI(j)
+        } else {
+          draftData = null
+          S.subjectField.value = ''
+          S.bodyField.value = ''
+          S.currentMail.textContent = 'No current mail loaded'
+          S.pastInteraction.textContent = 'No past interaction'
+          S.slotStatus.textContent = '—'
+        }
+      } else {
+        setStatus('Send failed', true)
+        alert('Send failed: ' + res.status + '\n' + (res.text || res.status))
+      }
+    }catch(e){
+      setStatus('Send error', true)
+      alert('Send error: ' + e)
+    } finally {
+      setButtonLoading(S.btnSend, false)
+    }
+  })
+
+  // History (fetch)
+  S.btnHistory.addEventListener('click', async ()=>{
+    setStatus('Fetching history...')
+    setButtonLoading(S.btnHistory, true, 'Fetching...')
+    try{
+      const res = await callApi('/api/history','GET', null, 30000)
+      if(res.ok && res.json){
+        const hist = res.json.history || res.json
+        if(Array.isArray(hist) && hist.length){
+          renderDraftToUI(hist[hist.length-1])
+          setStatus('Latest history item loaded')
+        } else {
+          alert('History fetched but empty')
+          setStatus('History empty')
+        }
+      } else {
+        setStatus('History fetch failed', true)
+        alert('History fetch failed: ' + res.status + '\n' + (res.text || res.status))
+      }
+    }catch(e){
+      setStatus('History error', true)
+      alert('History error: ' + e)
+    } finally {
+      setButtonLoading(S.btnHistory, false)
+    }
+  })
+
+  // when user edits subject/body locally, keep them in draftData (UI-only)
+  S.subjectField.addEventListener('input', ()=>{
+    if(!draftData) draftData = {}
+    const d = JSON.parse(JSON.stringify(draftData))
+    if(d.draft) d.draft.subject = S.subjectField.value
+    else d.subject = S.subjectField.value
+    draftData = d
+  })
+  S.bodyField.addEventListener('input', ()=>{
+    if(!draftData) draftData = {}
+    const d = JSON.parse(JSON.stringify(draftData))
+    if(d.draft) d.draft.body = S.bodyField.value
+    else d.body = S.bodyField.value
+    draftData = d
+  })
+
+  // initial status
+  setStatus('idle')
+})();
@@ -1,7 +1,8 @@
 import streamlit as st
 import requests
 import json
-from typing import Optional
+
+from src.api_client import DraftApiClient, ApiError
 
 st.set_page_config(page_title="Draft Manager — Direct Send", layout="wide")
 
@@ -15,37 +16,34 @@ st.sidebar.markdown("""
 - Fix backend apply_feedback to return a dict (no trailing comma).
 """)
 
-# ------ helpers ------
-def post_raw(path: str, payload: dict, timeout=30):
-    url = BACKEND_URL.rstrip("/") + path
-    try:
-        r = requests.post(url, json=payload, timeout=timeout)
-    except requests.exceptions.RequestException as e:
-        return {"__network_error__": str(e)}
-    out = {
-        "status_code": r.status_code,
-        "reason": r.reason,
-        "text": r.text,
-        "headers": dict(r.headers)
-    }
-    try:
-        out["json"] = r.json()
-    except Exception:
-        out["json"] = None
-    if not (200 <= r.status_code < 300):
-        out["__error__"] = f"HTTP {r.status_code} {r.reason}"
-    return out
-
-def get_raw(path: str, timeout=20):
-    url = BACKEND_URL.rstrip("/") + path
+# ------ API client (one pooled keep-alive session per backend URL) ------
+HISTORY_CACHE_SECONDS = 30
+
+
+@st.cache_resource
+def get_client(base_url: str) -> DraftApiClient:
+    return DraftApiClient(base_url)
+
+
+api = get_client(BACKEND_URL)
+
+
+@st.cache_data(ttl=HISTORY_CACHE_SECONDS, show_spinner=False)
+def fetch_history_page(base_url: str, page: int, page_size: int) -> dict:
+    # the client also revalidates with ETag, so an unchanged history costs a 304
+    return get_client(base_url).history(limit=page_size, offset=page * page_size, newest_first=True)
+
+
+def call_api(label: str, fn, *args, **kwargs):
+    """Run an API call, showing errors in the UI; returns None on failure."""
     try:
-        r = requests.get(url, timeout=timeout)
+        return fn(*args, **kwargs)
+    except ApiError as e:
+        st.error(f"{label} failed: HTTP {e.status_code}" + (f" (retry in {e.retry_after:.0f}s)" if e.retry_after else ""))
+        st.code(e.detail)
     except requests.exceptions.RequestException as e:
-        return {"__network_error__": str(e)}
-    try:
-        return {"status_code": r.status_code, "json": r.json(), "text": r.text}
-    except Exception:
-        return {"status_code": r.status_code, "json": None, "text": r.text}
+        st.error(f"Network error: {e}")
+    return None
 
 # ------ UI layout ------
 st.title("✉️ Draft Manager — Direct Send (single JSON box)")
@@ -68,25 +66,30 @@ with left:
     send_btn = st.button("Send immediately (decision A)  — NO PROMPT")
 
     st.markdown("---")
+    st.subheader("History")
     if st.button("Fetch history"):
-        hist = get_raw("/api/history")
-        if hist.get("__network_error__"):
-            st.error(f"Network error: {hist['__network_error__']}")
-        else:
-            if hist.get("json") is not None:
-                st.success("History fetched")
-                st.json(hist["json"])
-            else:
-                st.code(hist.get("text", "No response"))
+        st.session_state["show_history"] = True
+        fetch_history_page.clear()
+    if st.session_state.get("show_history"):
+        page_size = st.selectbox("Per page", [10, 25, 50, 100], index=1)
+        page = st.number_input("Page", min_value=1, value=1, step=1) - 1
+        hist = call_api("History fetch", fetch_history_page, BACKEND_URL, int(page), page_size)
+        if hist is not None:
+            total = hist.get("total", 0)
+            st.caption(f"{total} sent drafts, newest first — page {page + 1} of {max(1, -(-total // page_size))}")
+            rows = [{
+                "sent_at": rec.get("sent_at", ""),
+                "email": (rec.get("draft") or {}).get("email", ""),
+                "subject": (rec.get("draft") or {}).get("subject", ""),
+                "slot_status": (rec.get("draft") or {}).get("slot_status", "")
+            } for rec in hist.get("history", [])]
+            st.dataframe(rows, use_container_width=True)
+            with st.expander("Raw records on this page"):
+                st.json(hist.get("history", []))
 
 with right:
     st.subheader("Draft JSON (single box)")
     if "draft_data" not in st.session_state:
-        # initialize with backend draft.json if exists
-        try:
-            r = get_raw("/api/history")  # just to ensure backend reachable
-        except Exception:
-            r = {}
         st.session_state.draft_data = {}  # empty until generate
 
     # Display the draft JSON in a single read-only box (but also allow manual editing if user wants)
@@ -115,31 +118,13 @@ if gen_btn:
     if not email.strip():
         st.error("Email required to generate draft.")
     else:
-        payload = {"email": email.strip(), "name": name.strip(), "role": role.strip(), "industry": industry.strip()}
         with st.spinner("Calling /api/generate-draft ..."):
-            out = post_raw("/api/generate-draft", payload)
-        if out.get("__network_error__"):
-            st.error("Network error: " + out["__network_error__"])
-        elif out.get("__error__"):
-            st.error(f"Generate failed: {out.get('__error__')} — see response text below")
-            st.code(out.get("text", ""))
-        else:
-            # prefer JSON payload
-            content = out.get("json") or out.get("text")
-            if isinstance(content, dict):
-                st.session_state["draft_data"] = content
-                st.success("Draft generated and loaded into box.")
-                st.json(st.session_state["draft_data"])
-            else:
-                # try parse text as JSON
-                try:
-                    parsed = json.loads(out.get("text", "{}"))
-                    st.session_state["draft_data"] = parsed
-                    st.success("Loaded JSON from text response.")
-                    st.json(parsed)
-                except Exception:
-                    st.error("Backend returned non-JSON response.")
-                    st.code(out.get("text", ""))
+            content = call_api("Generate", api.generate_draft, email.strip(),
+                               name=name.strip(), role=role.strip(), industry=industry.strip())
+        if content is not None:
+            st.session_state["draft_data"] = content
+            st.success("Draft generated and loaded into box.")
+            st.json(st.session_state["draft_data"])
 
 # ------ Update logic (U) ------
 if update_btn:
@@ -148,57 +133,25 @@ if update_btn:
     elif not feedback.strip():
         st.error("Feedback text required for update.")
     else:
-        payload = {"decision": "U", "feedback": feedback}
         with st.spinner("Calling /api/act (update)..."):
-            out = post_raw("/api/act", payload)
-        # handle response
-        if out.get("__network_error__"):
-            st.error("Network error: " + out["__network_error__"])
-        elif out.get("__error__"):
-            st.error(f"Update failed: {out.get('__error__')}")
-            st.code(out.get("text", ""))
-        else:
-            # Many backends return dict; sometimes update returns {"message":..., "draft": {...}}
-            js = out.get("json")
-            if isinstance(js, dict):
-                # if server returned updated draft inside "draft", prefer that
-                new_draft = js.get("draft") or js
-                st.session_state["draft_data"] = new_draft
-                st.success("Draft updated and UI box refreshed.")
-                st.json(st.session_state["draft_data"])
-            else:
-                # try parse text as JSON fallback
-                try:
-                    parsed = json.loads(out.get("text", "{}"))
-                    st.session_state["draft_data"] = parsed
-                    st.success("Draft updated (parsed text).")
-                    st.json(parsed)
-                except Exception:
-                    st.error("Update response not JSON. See raw text:")
-                    st.code(out.get("text", ""))
+            js = call_api("Update", api.update_draft, feedback)
+        if isinstance(js, dict):
+            # update returns {"message":..., "draft": {...}}; prefer the draft
+            st.session_state["draft_data"] = js.get("draft") or js
+            st.success("Draft updated and UI box refreshed.")
+            st.json(st.session_state["draft_data"])
 
 # ------ Send logic (A) immediate, no confirmation ------
 if send_btn:
     if not st.session_state.get("draft_data"):
         st.error("No draft loaded. Generate first.")
     else:
-        payload = {"decision": "A", "feedback": None}
         with st.spinner("Sending (approve) — calling /api/act ..."):
-            out = post_raw("/api/act", payload, timeout=60)
-        if out.get("__network_error__"):
-            st.error("Network error: " + out["__network_error__"])
-        elif out.get("__error__"):
-            # show HTTP error + full body
-            st.error(f"Send failed: {out.get('__error__')}")
-            st.code(out.get("text", ""))
-        else:
-            js = out.get("json")
-            if js:
-                st.success("Send completed. Server response:")
-                st.json(js)
-            else:
-                st.success("Send completed. Server returned non-JSON:")
-                st.code(out.get("text", ""))
+            js = call_api("Send", api.approve)
+        if js is not None:
+            fetch_history_page.clear()  # a new record was archived
+            st.success("Send completed. Server response:")
+            st.json(js)
 
 # ------ footer ------
 st.markdown("---")